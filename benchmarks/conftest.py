@@ -0,0 +1,30 @@
+"""
+Shared fixtures for the Daffodil_Sim benchmark suite.
+
+The board setups come from tests/boards.py, so the timings reflect the operating point of examples/infer_wine.py
+that the tests use. The wine network (13 x 6 x 3, solution 0) is used wherever a programmed layer is needed.
+"""
+
+import sys
+import pytest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'tests'))
+
+import boards
+
+@pytest.fixture
+def board():
+    return boards.make_sim_board()
+
+@pytest.fixture
+def weights():
+    return boards.load_weights()
+
+@pytest.fixture
+def layers(board):
+    return boards.make_network(board)
+
+@pytest.fixture
+def dataset():
+    return boards.load_dataset()
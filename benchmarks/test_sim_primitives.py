@@ -0,0 +1,124 @@
+"""
+Timing benchmarks for the primitives of the simulated Daffodil board.
+
+Run with pytest-benchmark from the repository root, e.g.
+
+    pytest benchmarks/ --benchmark-storage=benchmarks/baseline --benchmark-compare
+
+See benchmarks/README.md for how the stored baseline is produced and updated.
+"""
+
+import numpy as np
+
+from daffodillib import read_array, outerproduct
+from daffodillib import IVcurve
+from daffodillib import utils
+from daffodillib.Board import emulator
+
+from boards import vgate, vread, vref, vset, vreset, dpot_r, make_layers
+
+def config_read(board):
+    # Forward read configuration over a full kernel: every column biased at vread, every gate on
+    board.set_kernel(0)
+    board.config_forward_pass()
+    board.setgatedacs([board.dac_invertvout(vgate)]*board.xdim)
+    board.setcoldacs([board.dac_invertvout(vread+vref)]*board.xdim)
+    board.setrowdacs([board.dac_invertvout(vref)]*board.ydim)
+    for i in range(board.xdim): board.COL_EN_tobe[i]=1
+    for i in range(board.ydim): board.ROW_EN_tobe[i]=1
+
+def test_generic_event(benchmark, board):
+    config_read(board)
+    board.event() # pushes the DAC outputs into the device model
+    benchmark(board.sim_device.event, board.COL_EN_tobe, board.ROW_EN_tobe)
+
+def test_generic_event_single_device(benchmark, board):
+    config_read(board)
+    board.event()
+    colactiv, rowactiv = [0]*board.xdim, [0]*board.ydim
+    colactiv[3], rowactiv[5] = 1, 1 # one selected device, as in IV sweeps and single device writes
+    benchmark(board.sim_device.event, colactiv, rowactiv)
+
+def test_board_event(benchmark, board):
+    config_read(board)
+    benchmark(board.event)
+
+def test_setcoldacs(benchmark, board):
+    board.config_forward_pass()
+    codes = [board.dac_invertvout(vread+vref)]*board.xdim
+    benchmark(board.setcoldacs, codes)
+
+def test_setgatedacs(benchmark, board):
+    codes = [board.dac_invertvout(vgate)]*board.xdim
+    benchmark(board.setgatedacs, codes)
+
+def test_read_kernel(benchmark, board):
+    benchmark(read_array.read_kernel, board, 0, vread, vgate, vref)
+
+def test_read_all_kernels(benchmark, board):
+    benchmark.pedantic(read_array.read_all_kernels, args=(board, vread, vgate, vref), rounds=3, iterations=1)
+
+def test_vmm_kernel_forward(benchmark, board):
+    inputs = (np.linspace(0, 1, 13) * vread + vref).tolist()
+    benchmark(read_array.vmm_kernel_forward, board, 0, inputs, vgate, vref, (13, 12), 0, 0)
+
+def test_outer_product(benchmark, board):
+    rows = [1, -1, 0, 1]*6 + [1]
+    cols = [-1] + [0]*24
+    benchmark(outerproduct.outer_product, board, vset, vreset, vgate, rows, cols)
+
+def test_linear_forward_pass(benchmark, layers, dataset):
+    X, _ = dataset
+    x = (X[0] * vread).tolist()
+    benchmark(layers[0].forward_pass, x)
+
+def test_load_weights_outerproduct_parallel(benchmark, board, weights):
+    layer1 = make_layers(board)[0]
+    benchmark.pedantic(layer1.load_weights_outerproduct_parallel, args=(weights[0],), kwargs={'vgate': vgate}, rounds=5, iterations=1)
+
+def test_testing_forward(benchmark, layers, dataset):
+    X, Y = dataset
+    Gnorm = (layers[0].board.sim_device.setG - layers[0].board.sim_device.resetG) / layers[0].board.sim_device.currentscale
+    benchmark.pedantic(utils.testing_forward, args=(layers, X[:30], Y[:30], Gnorm, vread), rounds=3, iterations=1)
+
+def test_testing_forward_batch(benchmark, layers, dataset):
+    X, Y = dataset
+    Gnorm = (layers[0].board.sim_device.setG - layers[0].board.sim_device.resetG) / layers[0].board.sim_device.currentscale
+    benchmark.pedantic(utils.testing_forward, args=(layers, X[:30], Y[:30], Gnorm, vread), kwargs={'batch_size': 30}, rounds=3, iterations=1)
+
+def test_IVsweep(benchmark, board, monkeypatch):
+    monkeypatch.setattr(IVcurve, 'sleep_time', 0) # time the board, not the settling delays
+    benchmark.pedantic(IVcurve.IVsweep, args=(board, 0, 3, 4, 1.7, 2.5, 10, vgate, 1.7), rounds=5, iterations=1)
+
+def test_dac_calcvouts(benchmark, board):
+    codes = list(range(0, 4096, 164)) # 25 codes, one per column
+    benchmark(board.dac_calcvouts, codes)
+
+def test_dac_invertvouts(benchmark, board):
+    voltages = np.linspace(vref, vref + vread, board.xdim)
+    benchmark(board.dac_invertvouts, voltages)
+
+def test_buffered_read_kernel_emulated(benchmark):
+    # the emulated Daffodil_Phys, read through the ADC buffer between outer products. Write events must not leave scans behind
+    # for the next read, so every buffered readout has to match a readout through the sysfs files.
+    with emulator.make_phys_board('Generic', dpot_r=dpot_r) as board:
+        board.set_dac_gain_mode(4093)
+        board.set_dac_offset(0)
+        board.set_dpot_D(board.invert_dpot_rout(dpot_r))
+        board.set_compliance_control(1)
+        board.setrefopamp(board.dac_invertvout(abs(vref)))
+        rows = [1, -1, 0, 1]*6 + [1]
+
+        def update_and_read(col):
+            cols = [0]*board.xdim
+            cols[col] = -1
+            board.set_kernel(0)
+            outerproduct.outer_product(board, vset, vreset, vgate, rows, cols)
+            board.enable_adc_buffer(2, emulator.Sysfs_Emu.trigger_name)
+            buffered = read_array.read_kernel(board, 0, vread, vgate, vref)
+            board.disable_adc_buffer()
+            assert buffered == read_array.read_kernel(board, 0, vread, vgate, vref)
+
+        benchmark.pedantic(update_and_read, args=(0,), rounds=1, iterations=1)
+        for col in range(1, 4):
+            update_and_read(col)
@@ -6,7 +6,10 @@ Device documentation available: https://www.analog.com/media/en/technical-docume
 """
 
 from daffodillib.utils import find_device_iio as find_device
+from daffodillib.utils import Sysfs_File
+import numpy as np
 import ctypes
+import os
 
 class AD5391BSTZ5_Base:
     def __init__(self, n):
@@ -39,12 +42,34 @@ class AD5391BSTZ5_Base:
         for obj in self.all_channels:
             obj.update_vout()
 
+    vout_tables = {} # code to voltage tables, shared by all DACs and keyed by (m, c)
+
+    def vout_table(self, m, c): #this returns the output voltage of every register value for a particular m and c
+        if (m, c) not in self.vout_tables:
+            chan = self.all_channels[0]
+            x1 = np.arange(chan.max_prec + 1) # predictcalcvout accepts max_prec as well
+            x2 = ((m+2)/2**chan.n)*x1+(c) # same operations as predictcalcvout, so the table is bit-identical to it
+            self.vout_tables[(m, c)] = 2 * chan.vref * x2/chan.max_prec
+        return self.vout_tables[(m, c)]
+
     def calcvout(self, x1, m, c): #this calculates vout for a particular m and c
         return self.all_channels[0].predictcalcvout(x1,m,c)
 
     def invertvout(self,v,m,c): #this calculates register value for a particular m and c from a voltage 
         return self.all_channels[0].invertvout(v,m,c)
 
+    def calcvouts(self, x1s, m, c): #this calculates vout of an array of register values
+        x1s = np.asarray(x1s)
+        bad = (x1s < 0) | (x1s > self.all_channels[0].max_prec)
+        if np.any(bad):
+            raise ValueError("x1 can only be from 0 to 4095, but was {}!".format(x1s[bad].flat[0]))
+        return self.vout_table(m, c)[x1s]
+
+    def invertvouts(self, vs, m, c): #this converts an array of voltages to register values, see Channel_Base.invertvout
+        chan = self.all_channels[0]
+        reg = np.rint(2**(chan.n-1)*((2**chan.n)*np.asarray(vs, dtype=float)-2*c*chan.vref)/(2+m)/chan.vref)
+        return np.clip(reg, 0, 4095).astype(int)
+
     def get_bit_string(self, CS_line, channel, value):
         if value<0 or value>4095:
             raise Exception("Illegal value for x1")
@@ -55,6 +80,71 @@ class AD5391BSTZ5_Base:
         return CS_line << 24 | 0b0000 << 20 | channel << 16 | 0b11 << 14 | value
 
 
+class AD5391BSTZ5_Calibration:
+    """
+    Measured transfer curves of the 80 DAC channels of the board (5 DACs x 16 channels). Channel k of the board is channel k % 16 of DAC k // 16.
+
+    Two file formats are supported:
+        1) a .txt file with 80 rows of `gain offset`. The measured output is gain * vout + offset, where vout is the ideal output of the channel.
+        2) a .npz file with `vout`, an (80, 4096) array of the measured output for every code (the full INL), and the scalars `m` and `c` it was measured at.
+
+    Conversions take an array of board channel indices and an array of codes or voltages and work on all of them at once.
+    """
+    def __init__(self, fname, n=12, vref=2.5):
+        self.n = n
+        self.vref = vref
+        self.max_prec = 2**n
+        self.tables = None
+        if fname.endswith('.npz'):
+            data = np.load(fname)
+            self.tables = np.asarray(data['vout'], dtype=float)
+            self.m = int(data['m'])
+            self.c = int(data['c'])
+            if self.tables.shape != (80, self.max_prec):
+                raise ValueError("DAC calibration table must have shape (80, {}), but was {}".format(self.max_prec, self.tables.shape))
+            # searchsorted needs increasing rows. A non-monotonic code is never the best choice, so it is shadowed by its predecessor.
+            self.sorted_tables = np.maximum.accumulate(self.tables, axis=1)
+            # offsetting every row by more than the span of all tables lets one searchsorted over the flattened array serve all channels
+            self.row_offset = self.sorted_tables.max() - self.sorted_tables.min() + 1
+            self.flat_tables = (self.sorted_tables + self.row_offset * np.arange(80)[:, None]).ravel()
+        else:
+            data = np.loadtxt(fname, ndmin=2)
+            if data.shape != (80, 2):
+                raise ValueError("DAC calibration file must have 80 rows of gain and offset, but had shape {}".format(data.shape))
+            self.gain = data[:, 0]
+            self.offset = data[:, 1]
+
+    def check_mode(self, m, c):
+        if self.tables is not None and (m, c) != (self.m, self.c):
+            raise ValueError("DAC calibration tables were measured at m={}, c={}, but the DACs are at m={}, c={}".format(self.m, self.c, m, c))
+
+    def calcvouts(self, channels, x1s, m, c): #this calculates the measured vout of every (channel, code) pair
+        self.check_mode(m, c)
+        channels, x1s = np.broadcast_arrays(np.asarray(channels), np.asarray(x1s))
+        if np.any((x1s < 0) | (x1s >= self.max_prec)):
+            raise ValueError("x1 can only be from 0 to 4095!")
+        if self.tables is not None:
+            return self.tables[channels, x1s]
+        vout = 2 * self.vref * (((m+2)/2**self.n)*x1s+(c))/self.max_prec
+        return self.gain[channels] * vout + self.offset[channels]
+
+    def invertvouts(self, channels, vs, m, c): #this calculates the code of every channel that comes closest to the corresponding voltage
+        self.check_mode(m, c)
+        channels, vs = np.broadcast_arrays(np.asarray(channels), np.asarray(vs, dtype=float))
+        if self.tables is not None:
+            flat = self.flat_tables
+            base = channels * self.max_prec
+            pos = np.searchsorted(flat, vs + self.row_offset * channels)
+            hi = np.clip(pos, base, base + self.max_prec - 1) # first code at or above v, within the channel
+            lo = np.clip(hi - 1, base, None)
+            lo_closer = np.abs(vs + self.row_offset * channels - flat[lo]) <= np.abs(flat[hi] - vs - self.row_offset * channels)
+            return np.where(lo_closer, lo, hi) - base
+        # undo the measured gain and offset, then invert the ideal transfer as in Channel_Base.invertvout
+        v = (vs - self.offset[channels]) / self.gain[channels]
+        reg = np.rint(2**(self.n-1)*((2**self.n)*v-2*c*self.vref)/(2+m)/self.vref)
+        return np.clip(reg, 0, 4095).astype(int)
+
+
 class Channel_Base:
     def __init__(self, i):
         self.i = i
@@ -143,18 +233,30 @@ class AD5391BSTZ5_Sim(AD5391BSTZ5_Base):
             self.set_x2 = 0
             self.reset_x2 = 0
 
+            self.calibration = None # (AD5391BSTZ5_Calibration, board channel index) whose measured transfer the output follows, set by Daffodil_Sim.load_dac_calibration
+
+        def calibrated_vout(self, x1): # the measured output of the channel for x1, see calibration
+            calibration, index = self.calibration
+            return float(calibration.calcvouts(index, x1, self.m, self.c))
+
         def update_vout(self): # this updates the output bias
             self.x2=((self.m+2)/2**self.n)*self.x1+(self.c) #this is the internal register value for the output
             self.vout = 2 * self.vref * self.x2/self.max_prec #this produces a new vout
+            if self.calibration is not None:
+                self.vout = self.calibrated_vout(self.x1)
 
             self.set_x2=((self.m+2)/2**self.n)*self.set_x1+(self.c) #A ficticious register for use by hardware set commands
             self.reset_x2=((self.m+2)/2**self.n)*self.reset_x1+(self.c) #Same but for reset
 
         def hardware_set(self):
             self.vout = 2 * self.vref * self.set_x2/self.max_prec #this produces a new vout
+            if self.calibration is not None:
+                self.vout = self.calibrated_vout(self.set_x1)
 
         def hardware_reset(self):
             self.vout = 2 * self.vref * self.reset_x2/self.max_prec #this produces a new vout
+            if self.calibration is not None:
+                self.vout = self.calibrated_vout(self.reset_x1)
 
 
 class AD5391BSTZ5_Phys(AD5391BSTZ5_Base):
@@ -166,12 +268,23 @@ class AD5391BSTZ5_Phys(AD5391BSTZ5_Base):
     class Channel(Channel_Base):
         def __init__(self, i):
             super().__init__(i)
-            self.accel_iio_c = 0
+            self.accel_iio_c = 3
+            self.sysfs_files = None
         def init_static_files(self):
+            if self.accel_iio_c == 3:
+                if self.sysfs_files is None:
+                    self.sysfs_files = [Sysfs_File(self.device_dir + "/out_voltage{}_{}".format(self.i, attr), os.O_WRONLY) for attr in ["calibbias", "calibscale", "raw"]]
+                for f in self.sysfs_files:
+                    f.value = None # another mode may have written the files in the meantime
             if self.accel_iio_c == 2:
                 self.bias_file_num = self.PGPIO.open_write_file(ctypes.c_char_p(bytes(self.device_dir + "/out_voltage{}_calibbias".format(self.i), 'utf-8')))
                 self.scale_file_num = self.PGPIO.open_write_file(ctypes.c_char_p(bytes(self.device_dir + "/out_voltage{}_calibscale".format(self.i), 'utf-8')))
                 self.raw_file_num = self.PGPIO.open_write_file(ctypes.c_char_p(bytes(self.device_dir + "/out_voltage{}_raw".format(self.i), 'utf-8')))
+        def close_static_files(self):
+            if self.sysfs_files is not None:
+                for f in self.sysfs_files:
+                    f.close()
+                self.sysfs_files = None
         def update_vout(self): #This is NOT an atomic operation, use the pulsed GPIO interface to send precisely timed signals
             if self.predictcalcvout(self.x1, self.m, self.c) > self.vmax:
                 raise Exception("Voltage should not be set that high")
@@ -218,6 +331,11 @@ class AD5391BSTZ5_Phys(AD5391BSTZ5_Base):
                 #self.PGPIO.write_static_file(self.bias_file_num, self.c)
                 #self.PGPIO.write_static_file(self.scale_file_num, self.m)
                 #self.PGPIO.write_static_file(self.raw_file_num, self.x1)
+            elif self.accel_iio_c == 3:
+                # gain and offset rarely change, only the raw register is written on every update
+                self.sysfs_files[0].write(self.c, force=False)
+                self.sysfs_files[1].write(self.m, force=False)
+                self.sysfs_files[2].write(self.x1)
 
             #PGPIO.raw_write(PGPIO.set_command_offset + self.global_id * 4, get_bit_string(self.CS_line, self.i, self.set_x1))
             #PGPIO.raw_write(PGPIO.reset_command_offset + self.global_id * 4, get_bit_string(self.CS_line, self.i, self.reset_x1))
@@ -7,7 +7,9 @@ Device documentation available: https://www.analog.com/media/en/technical-docume
 """
 
 from daffodillib.utils import find_device_spi
+from daffodillib.utils import Sysfs_File
 import ctypes
+import os
 import numpy as np
 
 class AD8403_Base:
@@ -17,6 +19,7 @@ class AD8403_Base:
         self.R_W = 50
         self.R_AB = R_AB
         self.n = n
+        self.version = 0 # counts the code and calibration changes, so that the board can cache the resistances
         self.all_channels=[] #this is the most basic element, a channel. description below
         for i in range(self.num_channels):
             # m, b = self.calc_m_b(self.Dmin, self.rmin, self.Dmax, self.rmax)
@@ -24,6 +27,7 @@ class AD8403_Base:
             self.all_channels[-1].R_W = self.R_W
             self.all_channels[-1].R_AB = self.R_AB
             self.all_channels[-1].num_positions = self.num_positions
+            self.all_channels[-1].dpot = self
 
     def setchannels_D(self, values): # this sets a list of channel D values
         if len(values) > len(self.all_channels):
@@ -41,6 +45,14 @@ class AD8403_Base:
     def calcrout(self): #this calculates rout and returns a list of resistances for all channels
         return [self.all_channels[i].predictcalcrout() for i in range(self.num_channels)]
 
+    def predictcalcrouts(self, Ds): #this returns the resistances of the channels at an array of codes, see Channel_Base.predictcalcrout
+        Ds = np.asarray(Ds)
+        return Ds / self.num_positions * self.R_AB + self.R_W
+
+    def invertchannels_routs(self, routs): #this returns the codes closest to an array of resistances, see AD8403_Sim.Channel.invertrout
+        D = np.rint((np.asarray(routs, dtype=float) - self.R_W) / (self.R_AB / self.num_positions))
+        return np.clip(D, 0, self.num_positions - 1).astype(int)
+
     @staticmethod
     def calc_m_c(x1, y1, x2, y2):
         x_coords = [x1, x2]
@@ -75,6 +87,7 @@ class AD8403_Sim(AD8403_Base):
             if (D not in range(self.num_positions)):
                 raise ValueError()
             self.D = D
+            self.dpot.version += 1
 
         def invertrout(self, rout): #this function lets you invert resistance r to the nearest digital code (D) of the digipot.
             D = round((rout - self.R_W) / (self.R_AB / self.num_positions))
@@ -84,26 +97,103 @@ class AD8403_Sim(AD8403_Base):
                 D = 0
             return D
 
+class AD8403_Calibration:
+    """
+    Measured transfer curves of the 28 DPOT channels of a board (7 DPOTs x 4 channels).
+
+    The calibration file holds a header row with the digital codes at which the channels were measured, followed by one row of resistances per channel.
+    Channels that are not connected have a row of zeros. Every file is parsed once and shared by all DPOTs through `get`.
+
+    The transfer curve of every channel is evaluated for all 256 codes in one pass, either piecewise linear through the measured points ('piecewise', extrapolated
+    linearly beyond them) or as a least-squares polynomial of degree `deg` ('poly').
+    """
+    calib_dir = 'misc/dpots' # calibration files are named after the board serial
+    registry = {} # parsed calibrations, keyed by (fname, method, deg)
+
+    @classmethod
+    def get(cls, fname, method='piecewise', deg=1):
+        if (fname, method, deg) not in cls.registry:
+            cls.registry[(fname, method, deg)] = cls(fname, method, deg)
+        return cls.registry[(fname, method, deg)]
+
+    @classmethod
+    def serial_file(cls, serial):
+        fname = cls.calib_dir + '/{}.txt'.format(serial)
+        if not os.path.isfile(fname):
+            raise ValueError("No DPOT calibration file for board serial {}, expected {}".format(serial, fname))
+        return fname
+
+    @classmethod
+    def for_serial(cls, serial, method='piecewise', deg=1):
+        return cls.get(cls.serial_file(serial), method, deg)
+
+    def __init__(self, fname, method='piecewise', deg=1, num_positions=256):
+        data = np.loadtxt(fname)
+        if data.shape[0] != 7 * 4 + 1 or data.shape[1] < 2:
+            raise ValueError("DPOT calibration file {} must have a header row and 28 channel rows of at least 2 points".format(fname))
+        self.fname = fname
+        self.points = data[0] # codes at which the channels were measured
+        self.routs = data[1:] # measured resistances, (28, points)
+
+        codes = np.arange(num_positions)
+        if method == 'piecewise':
+            # segment of every code, the first/last segment also covers the codes outside of the measured range
+            seg = np.clip(np.searchsorted(self.points, codes, side='right') - 1, 0, len(self.points) - 2)
+            x1, x2 = self.points[seg], self.points[seg + 1]
+            y1, y2 = self.routs[:, seg], self.routs[:, seg + 1]
+            self.tables = y1 + (y2 - y1) * (codes - x1) / (x2 - x1)
+        elif method == 'poly':
+            coeffs = np.polyfit(self.points, self.routs.T, deg) # one fit for all channels
+            self.tables = (np.vander(codes, deg + 1) @ coeffs).T
+        else:
+            raise ValueError(f"DPOT calibration method {method} not implemented.")
+        self.tables[~self.routs.any(axis=1)] = 0 # unused channels stay at zero
+
+        # 2-point line through the first and third measured points, as used by the channels before the full curves
+        x2 = 2 if len(self.points) > 2 else 1
+        self.m, self.c = np.zeros(28), np.zeros(28)
+        for k in range(28):
+            self.m[k], self.c[k] = AD8403_Base.calc_m_c(self.points[0], self.routs[k, 0], self.points[x2], self.routs[k, x2])
+
+    def predictcalcrouts(self, channels, Ds): #this returns the resistance of every (channel, code) pair
+        return self.tables[channels, Ds]
+
+    def invertrouts(self, channels, routs): #this returns the code of every channel that comes closest to the corresponding resistance
+        channels, routs = np.broadcast_arrays(np.asarray(channels), np.asarray(routs, dtype=float))
+        return np.abs(self.tables[channels] - routs[..., None]).argmin(axis=-1)
+
+
 class AD8403_Phys(AD8403_Base):
+    # the channels have no transfer curves until `calibrate` is called, see Daffodil_Phys.load_dpot_calibration
+
     def __init__(self, n):
         self.device_dir = find_device_spi(n)
 
-        # TODO: This can be separated - no need to load file for every dpot
-        self.phys_calib = np.loadtxt('misc/dpots/1304917.txt')
-        
-        assert self.phys_calib.shape[0] == 7 * 4 + 1
-        assert self.phys_calib.shape[1] >= 2 
-
         super().__init__(n)
-        chan_num = 4*n + 1 # + 1 to skip header row
         for chan in self.all_channels:
             chan.device_dir = self.device_dir
-            x1 = self.phys_calib[0, 0]
-            x2 = self.phys_calib[0, 2]
-            y1 = self.phys_calib[chan_num, 0]
-            y2 = self.phys_calib[chan_num, 2]
-            chan.m, chan.c = self.calc_m_c(x1, y1, x2, y2)
-            chan_num += 1
+        self.calibration = None
+        self.channel_index = np.arange(4*self.n, 4*self.n + 4)
+
+    def calibrate(self, calibration):
+        """Use the transfer curves of `calibration`, an `AD8403_Calibration`, for the 4 channels of this DPOT."""
+        self.calibration = calibration
+        self.version += 1
+        for chan, k in zip(self.all_channels, self.channel_index):
+            chan.table = calibration.tables[k].tolist()
+            chan.m, chan.c = calibration.m[k], calibration.c[k]
+
+    def predictcalcrouts(self, Ds): #this returns the resistances of the 4 channels at codes Ds
+        self.check_calibrated()
+        return self.calibration.predictcalcrouts(self.channel_index, Ds)
+
+    def invertchannels_routs(self, routs): #this returns the codes of the 4 channels closest to routs
+        self.check_calibrated()
+        return self.calibration.invertrouts(self.channel_index, routs)
+
+    def check_calibrated(self):
+        if self.calibration is None:
+            raise ValueError("Digipots need to be calibrated, see Daffodil_Phys.load_dpot_calibration")
 
     class Channel(Channel_Base):
         def __init__(self, i):
@@ -111,32 +201,41 @@ class AD8403_Phys(AD8403_Base):
             # The following need to be calibrated based on physical tuning and measurements
             self.m = None
             self.c = None
+            self.table = None # resistance at every code
+            self.accel_iio_c = 3
+            self.rdac_file = None
+
+        def init_static_files(self):
+            if self.accel_iio_c == 3 and self.rdac_file is None:
+                self.rdac_file = Sysfs_File(self.device_dir + "/rdac{}".format(self.i), os.O_WRONLY)
+
+        def close_static_files(self):
+            if self.rdac_file is not None:
+                self.rdac_file.close()
+                self.rdac_file = None
         
         def predictcalcrout(self): #this function lets you do the resistance calculation without actually updating rout. 
-            if (self.m == None or self.c == None):
-                print("Digipots need to be calibrated")
-                raise ValueError()
+            if (self.table is None):
+                raise ValueError("Digipots need to be calibrated, see Daffodil_Phys.load_dpot_calibration")
             if (self.D not in range(self.num_positions)):
                 raise ValueError()
-            return self.m * self.D + self.c 
+            return self.table[self.D]
 
         def invertrout(self, rout): #this function lets you invert resistance r to the nearest digital code (D) of the digipot.
-            if (self.m == None or self.c == None):
-                print("Digipots need to be calibrated")
-                raise ValueError()
+            if (self.table is None):
+                raise ValueError("Digipots need to be calibrated, see Daffodil_Phys.load_dpot_calibration")
             if (self.m == 0 and self.c == 0): # unused digipot channels
                 return 0
-            D = round((rout - self.c) / self.m)
-            if (D > 255):
-                D = 255
-            if (D < 0):
-                D = 0
-            return D   
+            return int(np.abs(np.array(self.table) - rout).argmin())
         
         def update_D(self, D): #This is NOT an atomic operation, use the pulsed GPIO interface to send precisely timed signals
             if (D not in range(256)):
                 raise ValueError()
             self.D = D
-            with open(self.device_dir + "/rdac{}".format(self.i), 'w') as f:
-                f.write(str(self.D))
+            self.dpot.version += 1
+            if self.accel_iio_c == 3:
+                self.rdac_file.write(self.D)
+            else:
+                with open(self.device_dir + "/rdac{}".format(self.i), 'w') as f:
+                    f.write(str(self.D))
 
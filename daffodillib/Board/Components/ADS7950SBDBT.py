@@ -6,7 +6,23 @@ Device documentation available: https://www.ti.com/lit/ds/symlink/ads7950.pdf?HQ
 """
 
 from daffodillib.utils import find_device_iio as find_device
+from daffodillib.utils import Sysfs_File
+from daffodillib import utils
+import numpy as np
 import ctypes
+import glob
+import os
+import re
+import select
+import time
+
+def parse_scan_type(scan_type): # parses an IIO scan element type such as "be:u12/16>>0" into a numpy dtype, the number of valid bits and the shift
+    match = re.fullmatch(r'([bl]e):([su])(\d+)/(\d+)(?:X\d+)?>>(\d+)', scan_type.strip())
+    if match is None:
+        raise ValueError("Unsupported IIO scan element type {}".format(scan_type))
+    endian, sign, realbits, storagebits, shift = match.groups()
+    dtype = np.dtype(('>' if endian == 'be' else '<') + ('i' if sign == 's' else 'u') + str(int(storagebits)//8))
+    return dtype, int(realbits), int(shift)
 
 class ADS7950SBDBT_Base:
     def predict_voltage(self, registervalue, gain): #this takes an ADC value and tells you how much voltage you should have gotten
@@ -63,6 +79,9 @@ class ADS7950SBDBT_Sim(ADS7950SBDBT_Base):
             raise ValueError("Register overflow, unphysical current of {} from value {}".format(self.registers[i], value))
 
 class ADS7950SBDBT_Phys(ADS7950SBDBT_Base):
+    buffer_length = 128 # capacity of the kernel ring buffer in scans, raised to n_samples if smaller
+    buffer_timeout = 1.0 # seconds read_buffer waits for the scans of an event
+
     def __init__(self, vref, n):
         self.gain = 1
         self.registers = [0, 0, 0, 0]
@@ -75,16 +94,141 @@ class ADS7950SBDBT_Phys(ADS7950SBDBT_Base):
         else:
             self.vref=vref #the reference bias
 
-        self.accel_iio_c = 0
+        self.accel_iio_c = 3
+        self.sysfs_files = None
+
+        self.buffer_dev = utils.dev_root + "/" + os.path.basename(self.device_dir) # character device of the triggered buffer
+        self.buffer_file = None # non-blocking file descriptor of buffer_dev while the triggered buffer is enabled
+        self.trigger = None # name of the IIO trigger of the buffer
+        self.trigger_dir = None # sysfs directory of the trigger, None if it is not an IIO device next to the ADC
+        self.samples = None # (n_samples, 4) codes of the last buffered capture
+        self.timestamps = None # (n_samples,) timestamps of the last buffered capture in ns
 
     def init_static_files(self):
+        if self.accel_iio_c == 3 and self.sysfs_files is None:
+            self.sysfs_files = [Sysfs_File(self.device_dir + "/in_voltage{}_raw".format(i), os.O_RDONLY) for i in range(4)]
         if self.accel_iio_c == 2:
             self.static_file_nums = [self.PGPIO.open_read_file(ctypes.c_char_p(bytes(self.device_dir + "/in_voltage{}_raw".format(i), 'utf-8'))) for i in range(4)]
 
+    def close_static_files(self):
+        self.disable_buffer()
+        if self.sysfs_files is not None:
+            for f in self.sysfs_files:
+                f.close()
+            self.sysfs_files = None
+
     def setgain(self, value):
         raise Exception("Not yet implemented")
 
+    def write_attr(self, attr, value):
+        with open(self.device_dir + "/" + attr, 'w') as f:
+            f.write(str(value))
+
+    def read_attr(self, attr):
+        with open(self.device_dir + "/" + attr) as f:
+            return f.read().strip()
+
+    def enable_buffer(self, n_samples=1, trigger=None, length=None):
+        """Capture all 4 channels through the IIO triggered buffer instead of the in_voltageN_raw files.
+
+        Every trigger captures one scan. Every call of `update_registers` then reads `n_samples` scans from /dev/iio:deviceN, waiting up to
+        `buffer_timeout` for them, so the trigger has to fire `n_samples` times per event (see `Daffodil_Phys.read_adcs`).
+        `length` is the capacity of the kernel ring buffer in scans, `buffer_length` if None. It is raised to `n_samples` if smaller.
+        """
+        if n_samples < 1:
+            raise ValueError("n_samples must be at least 1")
+        self.disable_buffer()
+        if trigger is None:
+            trigger = self.read_attr("trigger/current_trigger")
+        if not trigger:
+            raise ValueError("No IIO trigger attached to {}, the buffer would never capture a scan".format(self.device_dir))
+
+        elements = []
+        for name in ["in_voltage{}".format(i) for i in range(4)] + ["in_timestamp"]:
+            self.write_attr("scan_elements/{}_en".format(name), 1)
+            index = int(self.read_attr("scan_elements/{}_index".format(name)))
+            elements.append((index, name) + parse_scan_type(self.read_attr("scan_elements/{}_type".format(name))))
+        elements.sort()
+
+        # each element is aligned to its own size, the scan to the largest element
+        names, formats, offsets, offset = [], [], [], 0
+        for index, name, dtype, realbits, shift in elements:
+            offset = -(-offset // dtype.itemsize) * dtype.itemsize
+            names.append(name)
+            formats.append(dtype)
+            offsets.append(offset)
+            offset += dtype.itemsize
+        align = max(dtype.itemsize for dtype in formats)
+        self.scan_dtype = np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': -(-offset // align) * align})
+        self.scan_bits = {name: (realbits, shift) for index, name, dtype, realbits, shift in elements}
+
+        self.write_attr("trigger/current_trigger", trigger)
+        self.write_attr("buffer/length", max(n_samples, self.buffer_length if length is None else length))
+        self.write_attr("buffer/enable", 1)
+        self.trigger = trigger
+        self.trigger_dir = self.find_trigger(trigger)
+        self.n_samples = n_samples
+        self.buffer_file = os.open(self.buffer_dev, os.O_RDONLY | os.O_NONBLOCK)
+        self.flush_buffer()
+
+    def find_trigger(self, name):
+        # the IIO triggers are listed next to the IIO devices
+        for directory in sorted(glob.glob(os.path.dirname(self.device_dir) + '/trigger*')):
+            try:
+                with open(directory + '/name') as f:
+                    if f.read().strip() == name:
+                        return directory
+            except OSError:
+                pass
+        return None
+
+    def flush_buffer(self):
+        """Discard the scans waiting in the triggered buffer, so that the next `read_buffer` returns the scans of the next event."""
+        if self.buffer_file is None:
+            return
+        try:
+            while os.read(self.buffer_file, 4096):
+                pass
+        except BlockingIOError: # the kernel buffer is empty
+            pass
+
+    def disable_buffer(self):
+        if self.buffer_file is None:
+            return
+        os.close(self.buffer_file)
+        self.buffer_file = None
+        self.write_attr("buffer/enable", 0)
+
+    def read_buffer(self):
+        """Read `n_samples` scans from the triggered buffer into `samples` and `timestamps`, and set the registers to the rounded mean.
+        The scans are read as they arrive, for at most `buffer_timeout` seconds.
+        """
+        nbytes = self.n_samples * self.scan_dtype.itemsize
+        data = b''
+        deadline = time.monotonic() + self.buffer_timeout
+        while len(data) < nbytes:
+            remaining = deadline - time.monotonic()
+            if remaining < 0:
+                raise Exception("IIO buffer of {} captured {} of {} scans in {} s, check that trigger {} fires".format(
+                    self.device_dir, len(data) // self.scan_dtype.itemsize, self.n_samples, self.buffer_timeout, self.trigger))
+            select.select([self.buffer_file], [], [], remaining)
+            try:
+                data += os.read(self.buffer_file, nbytes - len(data))
+            except BlockingIOError: # no scan yet
+                pass
+        scans = np.frombuffer(data, dtype=self.scan_dtype)
+
+        self.samples = np.empty((self.n_samples, 4), dtype=np.int64)
+        for i in range(4):
+            realbits, shift = self.scan_bits["in_voltage{}".format(i)]
+            self.samples[:, i] = (scans["in_voltage{}".format(i)].astype(np.int64) >> shift) & ((1 << realbits) - 1)
+        self.timestamps = scans["in_timestamp"].astype(np.int64)
+        self.registers = [int(r) for r in np.rint(self.samples.mean(axis=0))]
+
     def update_registers(self): # this updates all registers by taking a list of values
+        if self.buffer_file is not None:
+            self.read_buffer()
+            return
         for i in range(4):
             self.update_register(i)
 
@@ -99,3 +243,5 @@ class ADS7950SBDBT_Phys(ADS7950SBDBT_Base):
             self.registers[i] = self.PGPIO.read_int(ctypes.c_char_p(bytes(fname, 'utf-8')))
         elif self.accel_iio_c == 2:
             self.registers[i] = self.PGPIO.read_static_file(self.static_file_nums[i])
+        elif self.accel_iio_c == 3:
+            self.registers[i] = self.sysfs_files[i].read()
@@ -4,6 +4,10 @@ Osama Yousuf
 MTJ API for Daffodil Board 
 """
 
+import numpy as np
+import os
+from .base import Device_Base, register
+
 def gatecurrent(vg, vt): #Gate Voltage, Threshold voltage
     #This is a toy cutoff function to simulate the behavior of a transistor in this MTJ Arry
     if (vg > 3.3 + 1.7): # Defined by the manufacturer. You cannot apply more than 3.3Volts
@@ -42,7 +46,37 @@ def voltageevent(vg,vt,vwrite,vcol,vrow,gdevice,goff,gon,activ,D): #this functio
     else:
         return gdevice, icurrent  # we can also just return the current and leave conductance the same
 
-class Generic:
+def gatecurrents(vg, vt): #array version of gatecurrent, vg holds the gate-source voltages
+    if np.any(vg > 3.3 + 1.7): # Defined by the manufacturer. You cannot apply more than 3.3Volts
+        raise ValueError()
+    return np.where(vg <= vt, 0, 4000*(vg-vt)**2/(3-vt)**2) # below threshold you don't get any current
+
+def devicecurrents(vg,vt,vcol,vrow,gdevice,activ): #array version of the current calculation of voltageevent. returns the currents and where devices conduct
+    icurrent=(vcol-vrow)*gdevice # this uses the voltage to guess what the device is based on the conductance
+    vgs=vg-np.minimum(vcol,vrow)
+    on=(activ != 0) & (icurrent != 0) & ~(vgs < vt) # devices that are selected and conduct
+    currentlimit=gatecurrents(vgs[on], vt) #we use the gatecurrent function to check what the max current allowed is from the transistor
+    ion=icurrent[on]
+    ion=np.where(np.abs(ion) > currentlimit, currentlimit*ion/np.abs(ion), ion) #if we're above the limit we just use the limit current, with the same sign
+    icurrent=np.zeros(np.shape(on))
+    icurrent[on]=ion
+    return icurrent, on
+
+def voltageevents(vg,vt,vwrite,vcol,vrow,gdevice,goff,gon,activ,D): #array version of voltageevent. the currents can differ from it in the last bit, numpy squares where python calls pow
+    icurrent, on = devicecurrents(vg,vt,vcol,vrow,gdevice,activ)
+    vdevice=icurrent/gdevice #here we measure the voltage across the device
+    update=np.where(on & (vdevice >= vwrite) & (gdevice == gon), goff, gdevice) # RESET the device into OFF (low G) state
+    update=np.where(on & (vdevice <= -vwrite) & (gdevice < gon), gon, update) # SET the device into ON (high G) state
+    return update, icurrent
+
+def sumcurrents(icurrent): #integrates the device currents over every column and row, adding them up in the same order as the device loop
+    # cumulative sums add strictly in order (np.sum may add pairwise), as the loop does. adding 0.0 turns a -0.0 sum into 0.0, as the loop starts from 0
+    if icurrent.size == 0:
+        return np.zeros(icurrent.shape[0]), np.zeros(icurrent.shape[1])
+    return np.add.accumulate(icurrent, axis=1)[:,-1] + 0.0, np.add.accumulate(icurrent, axis=0)[-1] + 0.0
+
+@register('Generic')
+class Generic(Device_Base):
     """
         This is the Generic Device Class. It's most important characteristic is that you can select a kernel and specify voltages on the rows and the columns.
         When you apply an event to the Generic system, it will respond to the those voltages. It will respond by a) changing the device state and b) producing currents.
@@ -54,61 +88,77 @@ class Generic:
         This class is currently modeled in a pseudo-physical way. It assumes certain properties of the 1T-1R array, namely it is possible to select one device and you never have complete leakage paths.
 
         This would not work with a passive array or a different transistor array. For these, you would need a spice model. If your spice model class however specifies input voltages and output currents, it could comply with the Generic model class definition. 
+        See `Board.Device.base.Device_Base` for the interface.
     """
     
-    def __init__(self, numkernel=32, xdim=25, ydim=25, vt=0.5):
+    def __init__(self, numkernel=32, xdim=25, ydim=25, vt=0.5, store=None, store_mode='r+'):
+        """
+            Parameters
+            ----------
+            store : str, optional
+                Path of a .npy file backing the device state (conductances, set/reset levels and pulse counters). The file is memory mapped, so the state
+                persists across processes and several processes can attach to the same chip. The file is created if it does not exist.
+            store_mode : 'r+' or 'r'
+                'r+' attaches read-write. 'r' attaches read-only, e.g. for analysis processes inspecting a chip that is in use, and events are refused.
+        """
+        super().__init__(numkernel, xdim, ydim)
         self.vt=vt # this is the threshold of the transistors 
-        
-        self.numkernel=numkernel #number of kernels in the array
-        self.kernelxdim=xdim #column dimension of a kernel
-        self.kernelydim=ydim #row dimension of a current
-        
-        self.rowcurrents=[] #initialize lists of row currents
-        self.columncurrents=[] # initialize lists of column currents
-        
-        self.rowvoltages=[] #initlaize lists of row voltages
-        self.columnvoltages=[] # initialize lists of column voltages
-        self.gatevoltages=[] # initialize lists of gate voltages
-        
-        self.selectedkernel=0 #the default kernel is 0
 
-        self.currentscale = 10**6 # to compensate for DPOT resistance compatibility with this model
         self.vwrite = 0.75
 
         vread = 0.3 # Todo: Pass this from outside
         self.resetG = 40 // vread # initial (off state) conductance state
         self.setG = 70 // vread
         
-        for i in range(xdim): # inititialze with zero bias
-            self.columncurrents.append(0)
-            self.columnvoltages.append(0) 
-            self.gatevoltages.append(0)
-        for i in range(ydim):
-            self.rowcurrents.append(0)
-            self.rowvoltages.append(0)
-        
         self.all_kernels=[] #initialize the kernen list
 
+        self.store = None
+        if store is not None:
+            self.attach_store(store, store_mode)
+
         for i in range(self.numkernel): #initialize the kernel class. we have now created the actual memory array. 
             self.all_kernels.append(self.kernel(self.kernelxdim,self.kernelydim,self.vt,self.vwrite,self.resetG,self.setG))
-        
-        self.name = 'Generic'
-
-    def selectkernel(self, value):
-        #this function lets you select a kernel. They are ordered from 1 to N
-        #0-32 CA1, MSB, LSB, CA0, RA1, R0 The kernel can also be represented as a bit string based on the TTL command that asserts the kernel from the FPGA. 
-        if value not in range(self.numkernel):
-            raise ValueError()
-        self.selectedkernel=value
+            if self.store is not None: # the kernel works on views of the file instead of its own arrays
+                for name in self.store_fields:
+                    setattr(self.all_kernels[-1], name, self.store[name][i])
+
+    store_fields = ['kern', 'setG', 'resetG', 'set_count', 'reset_count']
+
+    def store_dtype(self):
+        shape = (self.kernelxdim, self.kernelydim)
+        return np.dtype([('kern', float, shape), ('setG', float, shape), ('resetG', float, shape), ('set_count', np.int64, shape), ('reset_count', np.int64, shape)])
+
+    def attach_store(self, store, store_mode='r+'):
+        #the store holds one record per kernel
+        if store_mode not in ['r+', 'r']:
+            raise ValueError(f"Store mode {store_mode} not implemented.")
+        if os.path.exists(store):
+            self.store = np.load(store, mmap_mode=store_mode)
+            if self.store.dtype != self.store_dtype() or self.store.shape != (self.numkernel,):
+                raise ValueError("Device store {} does not match the array dimensions".format(store))
+        elif store_mode == 'r':
+            raise ValueError("Device store {} does not exist".format(store))
+        else:
+            self.store = np.lib.format.open_memmap(store, mode='w+', dtype=self.store_dtype(), shape=(self.numkernel,))
+            self.store['kern'] = self.resetG
+            self.store['setG'] = self.setG
+            self.store['resetG'] = self.resetG
+            self.store.flush()
+        self.readonly = store_mode == 'r'
+
+    def flush(self):
+        #writes the memory mapped state to disk. The OS does this on its own too, flush is only needed to be safe against crashes.
+        if self.store is not None:
+            self.store.flush()
 
     def retrievekernel(self, value):
         #you can ask what kernel you're using
         return self.all_kernels[self.selectedkernel].kern
             
-    def event(self,colactiv,rowactiv):
-        #This function has all the action. It uses the applied biases to decide the change in states and the generated currents.
-        #Note, the current returned is the current of the PREVIOUS state, not the END state of the event. 
-        self.columncurrents, self.rowcurrents = self.all_kernels[self.selectedkernel].biasupdate(self.gatevoltages,self.columnvoltages,self.rowvoltages, colactiv, rowactiv, self.dpot_r)
+    def update(self, kernel, gatevoltages, columnvoltages, rowvoltages, colactiv, rowactiv):
+        #see Device_Base.update
+        columncurrents, rowcurrents = self.all_kernels[kernel].biasupdate(gatevoltages, columnvoltages, rowvoltages, colactiv, rowactiv, self.dpot_r)
+        return columncurrents, rowcurrents, self.all_kernels[kernel].kern
         
     class kernel:
         """
@@ -117,48 +167,77 @@ class Generic:
             This model implicitly assumes conductanes are represented in microsiemens and currents therefore in microamps.
         """
         def __init__(self, xdim=25, ydim=25, vt=0.7, vwrite=0.7, resetG=50, setG=100):
-            self.kern=[] # initialize the list of weights
             self.xdim=xdim # column dimension
             self.ydim=ydim # row dimension
             self.vt=vt #threshold bias of transistors 
             self.vwrite=vwrite
             self.G=resetG
-            self.setG=[]
-            self.resetG=[]
-            for i in range(xdim):
-                self.kern.append([])
-                self.setG.append([])
-                self.resetG.append([])
-                for j in range (ydim):
-                    self.kern[i].append(resetG) # this initliazes the kernel to 50 microsiemens, which is assumed to be the low conductance state for our Generic model. 
-                    self.setG[i].append(setG)
-                    self.resetG[i].append(resetG)
+            self.kern=np.full((xdim, ydim), resetG, dtype=float) # this initliazes the kernel to the low conductance state of our Generic model. 
+            self.setG=np.full((xdim, ydim), setG, dtype=float)
+            self.resetG=np.full((xdim, ydim), resetG, dtype=float)
+            self.set_count=np.zeros((xdim, ydim), dtype=np.int64) # number of SET/RESET switching events of each device
+            self.reset_count=np.zeros((xdim, ydim), dtype=np.int64)
+
+        def switch(self, vg, vcol, vrow, kern, resetG, setG, activ, D): #returns the conductances after the event and the device currents. override this to model a different device
+            return voltageevents(vg,self.vt,self.vwrite,vcol,vrow,kern,resetG,setG,activ,D)
+
+        sparse_fraction = 0.25 # events selecting at most this fraction of the devices only evaluate the selected ones
+        scalar_limit = 4 # events selecting at most this many devices evaluate them one by one with voltageevent, which is cheaper than array operations
 
         def biasupdate(self, gatevoltages, columnvoltages, rowvoltages, colactiv, rowactiv, D):
-            rowcurrents=[] # initliaze lists of values for row and column currents
-            columncurrents=[]
-            update=0 #initialize placeholder variable for whether or not to change a device conductance 
-            current=0 #a variable for integrating currents in a row or column. 
-            
-            for i in range(self.xdim): # we initliaze everything to have zero current
-                columncurrents.append(0) 
-            for i in range(self.ydim):
-                rowcurrents.append(0)
-                
-            for i in range(len(gatevoltages)): # we now do a loop over all devices
-                for j in range(len(rowvoltages)):
-                    
-                    update, current = voltageevent(gatevoltages[i],self.vt,self.vwrite,columnvoltages[i],rowvoltages[j],self.kern[i][j],self.resetG[i][j],self.setG[i][j],colactiv[i]*rowactiv[j], D)
-                    self.kern[i][j] = update # if there is enough voltage across the device, it will update. 
-
-                    # this next code block helps deal with the zero edge case. 0 conductance is impossible and can lead to division by zero issues. We set the abosolute minimum as 0.1 microsiemens
-                    # since we limit all steps sizes to be +/- 1 microsiemen, we also dealwith the 1.1 microsiemen edge case. 
-                    if self.kern[i][j] < 1:
-                        self.kern[i][j] = 0.1
-                    if self.kern[i][j]==1.1:
-                        self.kern[i][j]=1
-                    
-                    columncurrents[i]+=current # here we integrate the currents. 
+            #all devices are updated at once, the first len(gatevoltages) columns and len(rowvoltages) rows take part
+            n, m = len(gatevoltages), len(rowvoltages)
+            cols, rows = np.flatnonzero(colactiv[:n]), np.flatnonzero(rowactiv[:m])
+            if len(cols)*len(rows) <= self.scalar_limit:
+                return self.biasupdate_devices(gatevoltages, columnvoltages, rowvoltages, colactiv, rowactiv, D, cols.tolist(), rows.tolist())
+            if len(cols)*len(rows) <= self.sparse_fraction*n*m:
+                # sparse path, e.g. for single device writes and IV sweeps: unselected devices neither switch nor conduct, so only the selected block is evaluated
+                index = np.ix_(cols, rows)
+            else:
+                cols, rows = slice(None, n), slice(None, m) # dense path, the block is a view of the whole kernel
+                index = (cols, rows)
+            kern, resetG, setG = self.kern[index], self.resetG[index], self.setG[index]
+            activ = np.multiply.outer(colactiv[cols], rowactiv[rows])
+
+            update, current = self.switch(gatevoltages[cols,None], columnvoltages[cols,None], rowvoltages[None,rows], kern, resetG, setG, activ, D)
+            switched = update != kern
+            if np.count_nonzero(switched): # the devices switched
+                is_set = update == setG
+                self.set_count[index] += switched & is_set
+                self.reset_count[index] += switched & ~is_set
+                self.kern[index] = update # only touch a memory mapped kernel when something changed
+            self.clamp(n, m)
+
+            columncurrents=np.zeros(self.xdim) # we initliaze everything to have zero current
+            rowcurrents=np.zeros(self.ydim)
+            columncurrents[cols], rowcurrents[rows] = sumcurrents(current) # here we integrate the currents. 
+            return columncurrents, rowcurrents # we return the currents
+
+        def biasupdate_devices(self, gatevoltages, columnvoltages, rowvoltages, colactiv, rowactiv, D, cols, rows):
+            #biasupdate for a few selected devices, which are updated one by one
+            columncurrents=np.zeros(self.xdim)
+            rowcurrents=np.zeros(self.ydim)
+            for i in cols:
+                for j in rows:
+                    g = float(self.kern[i,j])
+                    update, current = voltageevent(float(gatevoltages[i]),self.vt,self.vwrite,float(columnvoltages[i]),float(rowvoltages[j]),g,float(self.resetG[i,j]),float(self.setG[i,j]),colactiv[i]*rowactiv[j], D)
+                    if update != g: # the device switched
+                        if update == self.setG[i,j]: self.set_count[i,j] += 1
+                        else: self.reset_count[i,j] += 1
+                        self.kern[i,j] = update
+                    columncurrents[i]+=current
                     rowcurrents[j]+=current
-
-            return columncurrents, rowcurrents # we return the currents      
+            self.clamp(len(gatevoltages), len(rowvoltages))
+            return columncurrents, rowcurrents
+
+        def clamp(self, n, m):
+            # this helps deal with the zero edge case. 0 conductance is impossible and can lead to division by zero issues. We set the abosolute minimum as 0.1 microsiemens
+            # since we limit all steps sizes to be +/- 1 microsiemen, we also dealwith the 1.1 microsiemen edge case.
+            # every device of the first n columns and m rows is clamped, whether it was selected or not, as in the device loop of the original model
+            block = self.kern[:n, :m]
+            if block.min() > 1.1: # nothing to clamp, the usual case
+                return
+            low, edge = (block < 1) & (block != 0.1), block == 1.1
+            if low.any() or edge.any(): # only touch a memory mapped kernel when something changed
+                block[low] = 0.1
+                block[edge] = 1
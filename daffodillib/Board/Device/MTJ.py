@@ -0,0 +1,59 @@
+"""
+October 2026
+Stochastic MTJ device model for the simulated Daffodil Board
+"""
+
+import numpy as np
+from .base import register
+from .Generic import Generic, devicecurrents
+
+@register('MTJ')
+class MTJ(Generic):
+    """
+        This is a 1T-1MTJ model with thermally activated, stochastic switching. Every device is in one of two states, parallel (high G, `setG`) or antiparallel (low G, `resetG`).
+        The transistor and current limit are modeled as in `Generic`, and the device state, set/reset levels, counters and memory mapped store work the same way.
+
+        A voltage across the device switches it with probability 1 - exp(-pulse_len/tau), with tau = tau0*exp(delta*(1 - |v|/vc)). Positive voltages switch parallel devices
+        to antiparallel (RESET), negative voltages switch antiparallel devices to parallel (SET). Reads at low bias therefore have a small, but nonzero, chance to disturb a device.
+    """
+
+    def __init__(self, numkernel=32, xdim=25, ydim=25, vt=0.5, store=None, store_mode='r+', vc=0.75, delta=40, tau0=1e-9, pulse_len=1e-6, seed=None):
+        """
+            Parameters
+            ----------
+            vc : float
+                Critical switching voltage, at which the energy barrier vanishes.
+            delta : float
+                Thermal stability factor, the energy barrier at zero bias in units of kT.
+            tau0 : float
+                Attempt time in seconds.
+            pulse_len : float
+                Duration of an event in seconds.
+            seed : int, optional
+                Seed of the random number generator, for reproducible switching.
+            See `Generic` for the other parameters.
+        """
+        self.vc = vc
+        self.delta = delta
+        self.tau0 = tau0
+        self.pulse_len = pulse_len
+        self.rng = np.random.default_rng(seed)
+        super().__init__(numkernel, xdim, ydim, vt, store, store_mode)
+        for kern in self.all_kernels:
+            kern.device = self
+
+    def switching_probability(self, vdevice):
+        #probability that a device switches during an event with vdevice across it
+        tau = self.tau0*np.exp(self.delta*(1 - np.minimum(np.abs(vdevice)/self.vc, 1)))
+        return -np.expm1(-self.pulse_len/tau)
+
+    class kernel(Generic.kernel):
+        scalar_limit = 0 # the stochastic switching is only implemented on arrays
+
+        def switch(self, vg, vcol, vrow, kern, resetG, setG, activ, D):
+            icurrent, on = devicecurrents(vg,self.vt,vcol,vrow,kern,activ)
+            vdevice = icurrent/kern # the voltage across the device
+            flip = on & (self.device.rng.random(np.shape(kern)) < self.device.switching_probability(vdevice))
+            update = np.where(flip & (vdevice > 0) & (kern == setG), resetG, kern) # RESET into the antiparallel state
+            update = np.where(flip & (vdevice < 0) & (kern == resetG), setG, update) # SET into the parallel state
+            return update, icurrent
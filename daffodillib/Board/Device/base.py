@@ -0,0 +1,85 @@
+"""
+October 2026
+Device model interface for the simulated Daffodil Board
+"""
+
+import numpy as np
+
+models = {} # the device models available to Daffodil_Sim, by name. see register
+
+def register(name):
+    #class decorator that makes a device model available under name
+    def wrap(cls):
+        cls.name = name
+        models[name] = cls
+        return cls
+    return wrap
+
+def make_device(name, *args, **kwargs):
+    #creates the device model registered under name, the arguments are passed on to its constructor
+    if name not in models:
+        raise ValueError(f"{name} not implemented.")
+    return models[name](*args, **kwargs)
+
+class Device_Base:
+    """
+        This is the interface between the simulated board and a device model. The board writes the voltages it applies into `columnvoltages`, `rowvoltages` and `gatevoltages`
+        and calls `event` with the column and row enables. The model responds by a) changing the device state of the selected kernel and b) producing `columncurrents` and `rowcurrents`.
+
+        A device model subclasses this class, implements `update` on arrays and is made available to `Daffodil_Sim` with the `register` decorator.
+        All voltages and currents are NumPy arrays. Conductances are represented in microsiemens and currents therefore in microamps.
+    """
+    name = None
+
+    def __init__(self, numkernel=32, xdim=25, ydim=25):
+        self.numkernel=numkernel #number of kernels in the array
+        self.kernelxdim=xdim #column dimension of a kernel
+        self.kernelydim=ydim #row dimension of a current
+
+        self.columncurrents=np.zeros(xdim) # inititialze with zero bias
+        self.rowcurrents=np.zeros(ydim)
+        self.columnvoltages=np.zeros(xdim)
+        self.rowvoltages=np.zeros(ydim)
+        self.gatevoltages=np.zeros(xdim)
+
+        self.selectedkernel=0 #the default kernel is 0
+        self.currentscale = 10**6 # to compensate for DPOT resistance compatibility with this model
+        self.readonly = False # a read-only model refuses events
+
+    def selectkernel(self, value):
+        #this function lets you select a kernel. They are ordered from 1 to N
+        if value not in range(self.numkernel):
+            raise ValueError()
+        self.selectedkernel=value
+
+    def event(self,colactiv,rowactiv):
+        #This function has all the action. It uses the applied biases to decide the change in states and the generated currents.
+        #Note, the current returned is the current of the PREVIOUS state, not the END state of the event.
+        if self.readonly:
+            raise Exception("Device state is attached read-only")
+        self.columncurrents, self.rowcurrents, G = self.update(self.selectedkernel, np.asarray(self.gatevoltages, dtype=float), np.asarray(self.columnvoltages, dtype=float),
+            np.asarray(self.rowvoltages, dtype=float), np.asarray(colactiv), np.asarray(rowactiv))
+
+    def update(self, kernel, gatevoltages, columnvoltages, rowvoltages, colactiv, rowactiv):
+        """
+            Apply voltages to a kernel and update its device state.
+
+            Parameters
+            ----------
+            kernel : int
+                The kernel the voltages are applied to.
+            gatevoltages, columnvoltages : numpy.ndarray
+                Voltages of the first len(gatevoltages) columns. Shorter arrays than the kernel leave the remaining columns unbiased.
+            rowvoltages : numpy.ndarray
+                Voltages of the first len(rowvoltages) rows.
+            colactiv, rowactiv : numpy.ndarray
+                Column and row enables, a device is selected when both of its enables are nonzero.
+
+            Returns
+            -------
+            columncurrents, rowcurrents : numpy.ndarray
+                Currents integrated over every column and row of the kernel, in microamps.
+            G : numpy.ndarray
+                The (columns, rows) conductances of the kernel after the event.
+        """
+        raise Exception("This is an abstract method and must be implemented by a subclass")
@@ -0,0 +1,105 @@
+"""
+Asyncio interface of the Daffodil board.
+
+`Async_Board` wraps a `Daffodil_Sim` or `Daffodil_Phys` object. Board calls are short register and sysfs accesses and run directly in the event loop,
+but every call yields to the loop afterwards, and the waits that the synchronous API spends in `time.sleep` (ADC settling after a timed read
+pulse, the delays of the IV routines) are `asyncio.sleep`s. An orchestrator can then run measurements on several boards, logging and analysis
+as tasks of one event loop, without threads:
+
+    async def measure(aboard, x, y):
+        async with aboard.lock:
+            return await aio.aread_device(col_code, row_code, gate_code, x, y, pulselen, ground_code, aboard, ref_code)
+
+    currents = await asyncio.gather(measure(aboard0, 0, 0), measure(aboard1, 0, 0))
+
+Tasks that share one board should hold `lock` around every sequence of calls that has to run without another task reconfiguring the board in between.
+"""
+
+import asyncio
+from .controller import check_oversampling, sample_statistics
+
+class Async_Board:
+    """
+    Awaitable versions of the board calls that block, the rest of the board API is available unchanged through attribute access.
+    """
+    def __init__(self, board):
+        self.board = board
+        self.lock = asyncio.Lock() # serializes the tasks driving this board, see the module description
+
+    def __getattr__(self, name):
+        return getattr(self.board, name)
+
+    async def await_settle(self, t):
+        """Wait `t` seconds for the board to settle, while other tasks run."""
+        await asyncio.sleep(t)
+
+    async def aevent(self):
+        """Assert an `event` and yield to the event loop."""
+        self.board.event()
+        await asyncio.sleep(0)
+
+    async def aevent_timevariant(self, pulse_len, write=False):
+        """Assert an `event_timevariant`. On a physical board, the ADC settling time after a read pulse is awaited instead of slept."""
+        if not hasattr(self.board, 'assert_event'): # simulated events complete immediately
+            self.board.event_timevariant(pulse_len)
+        elif self.board.assert_event(pulse_len):
+            if not write: # the outputs settle before the ADCs are read or the buffer trigger is fired
+                await self.await_settle(self.board.adc_settle_time)
+            self.board.read_adcs()
+        await asyncio.sleep(0)
+
+    async def aevent_oversampled(self, n_samples=1, min_stderr=None, mode='event', pulse_len=None):
+        """Awaitable `Daffodil_Base.event_oversampled`, with the same parameters and return values."""
+        check_oversampling(n_samples, mode)
+        samples = []
+        for i in range(n_samples):
+            if i == 0 or mode == 'event':
+                if pulse_len is None: await self.aevent()
+                else: await self.aevent_timevariant(pulse_len)
+            else:
+                self.board.read_adcs()
+                await asyncio.sleep(0)
+            if self.board.collect_adc_samples(samples, mode, min_stderr):
+                break
+        return sample_statistics(samples)
+
+    async def aset_col_dacs(self, colvoltages):
+        """Awaitable `setcoldacs`."""
+        self.board.setcoldacs(colvoltages)
+        await asyncio.sleep(0)
+
+    async def aset_row_dacs(self, rowvoltages):
+        """Awaitable `setrowdacs`."""
+        self.board.setrowdacs(rowvoltages)
+        await asyncio.sleep(0)
+
+    async def aset_gate_dacs(self, gatevoltages):
+        """Awaitable `setgatedacs`."""
+        self.board.setgatedacs(gatevoltages)
+        await asyncio.sleep(0)
+
+    async def aset_ref_opamp(self, refbias):
+        """Awaitable `setrefopamp`."""
+        self.board.setrefopamp(refbias)
+        await asyncio.sleep(0)
+
+async def aread_device(col_code, row_code, gate_code, x ,y, pulselen, ground_code, aboard, ref_code, n_avg=1, min_stderr=None, oversample_mode='event'):
+    #awaitable IVcurve.read_device on an Async_Board, the settling delays are awaited
+    aboard.config_forward_pass()
+    aboard.set_compliance_control(1)
+    aboard.setgatedac_channel(gate_code, x)
+    aboard.setrowdac_channel(row_code, y)
+    aboard.setcoldac_channel(col_code, x)
+    mean, std, samples = await aboard.aevent_oversampled(n_avg, min_stderr, oversample_mode, pulse_len=pulselen)
+
+    current = ((aboard.adc_predict_voltage(mean[y])-aboard.dac_calcvout(ref_code, line='ref'))/aboard.pots[x])*1000000
+    await aboard.await_settle(0.01)
+    return current
+
+async def aprogram(col_code, row_code, gate_code, x ,y, pulselen, ground_code, aboard, ref_code):
+    #awaitable IVcurve.program on an Async_Board
+    aboard.setgatedac_channel(gate_code, x)
+    aboard.setrowdac_channel(row_code, y)
+    aboard.setcoldac_channel(col_code, x)
+    await aboard.aevent_timevariant(pulselen, write=True)
+    await aboard.await_settle(0.005)
@@ -9,16 +9,34 @@ Daffodil-lib does not have a class model for all the parts. For example, the tra
 from .Components.AD5391BSTZ5 import AD5391BSTZ5_Sim as DAC_sim
 from .Components.ADS7950SBDBT import ADS7950SBDBT_Sim as ADC_sim
 from .Components.AD5391BSTZ5 import AD5391BSTZ5_Phys as DAC_phys
+from .Components.AD5391BSTZ5 import AD5391BSTZ5_Calibration as DAC_calibration
 from .Components.ADS7950SBDBT import ADS7950SBDBT_Phys as ADC_phys
 from .Components.AD8403 import AD8403_Sim as DPOT_sim
 from .Components.AD8403 import AD8403_Phys as DPOT_phys
+from .Components.AD8403 import AD8403_Calibration as DPOT_calibration
+from .Device.base import make_device
 from .Device.Generic import Generic
+from .Device.MTJ import MTJ
 
 import numpy as np
 import ctypes
 import ctypes.util
 import time as t
 import os
+import json
+
+def check_oversampling(n_samples, mode):
+    #validates the parameters of Daffodil_Base.event_oversampled
+    if n_samples < 1:
+        raise ValueError("n_samples must be at least 1")
+    if mode not in ['event', 'adc']:
+        raise ValueError(f"Oversampling mode {mode} not implemented.")
+
+def sample_statistics(samples):
+    #mean, standard deviation and array of the samples collected by Daffodil_Base.event_oversampled
+    samples = np.array(samples, dtype=float)
+    std = samples.std(axis=0, ddof=1) if len(samples) > 1 else np.zeros(samples.shape[1])
+    return samples.mean(axis=0), std, samples
 
 class Daffodil_Base:
     """
@@ -50,11 +68,15 @@ class Daffodil_Base:
 
         self.curr_vref = None # This is the on-board vref for the opamp (DAC2 Channel 9). It is set inside the setrefopamp() function.
         self.curr_mode = None
+        self.dac_calibration = None # per-channel DAC calibration, see load_dac_calibration
+        self.dac_code_windows = {} # legal DAC codes of the bulk setters, see dac_code_window
 
         self.dpots=[] # this initializes the potentiometers, which define the transimpedance for current measurement
         for i in range(7):
             self.dpots.append(DPOT(i)) # The pots can be tuned from 1 to 10 kohm. The actual expressed unit, however, is V/uA
             # the amplifiers for these are ADA4891-4WARUZ-R7
+        self._pots = None # cached transimpedances, see pots
+        self._pots_version = None # sum of the DPOT versions _pots was computed at
 
         self.dacs=[] # initiliaze the DAC list
         self.adcs=[] # initiliaze the ADC list
@@ -107,38 +129,62 @@ class Daffodil_Base:
 
         Parameters
         ----------
-        rout : float
-            The resistance to be inverted.
+        rout : float or array_like
+            The resistance to be inverted, or one resistance per DPOT channel in read channel order. Channels beyond the end of a shorter vector are set to code 0.
         Returns
         -------
-        Ds : list[floats]
-            A list of digital codes corresponding to inverted resistances over each DPOT on the Board.
+        Ds : list[list[int]]
+            The digital codes of the 4 channels of each DPOT on the Board.
         """
-        Ds=[]
-        for dpot in self.dpots:
-            ds = dpot.invertchannels_rout(rout)
-            Ds.append(ds)
-        return Ds  
+        num_channels = len(self.dpots) * self.dpots[0].num_channels
+        routs = np.asarray(rout, dtype=float)
+        if routs.ndim == 0:
+            routs = np.full(num_channels, routs)
+        elif routs.ndim != 1 or len(routs) > num_channels:
+            raise ValueError("rout must be a resistance or a vector of at most {} resistances".format(num_channels))
+        else:
+            routs = np.concatenate([routs, np.zeros(num_channels - len(routs))])
+        return [dpot.invertchannels_routs(r).tolist() for dpot, r in zip(self.dpots, routs.reshape(len(self.dpots), -1))]
 
     def set_dpot_D(self, D):
         """Configure all DPOTs based on the provided digital code D. 
 
         Parameters
         ----------
-        D : float or list[float]
-            The digital code or a list of digital codes to which DPOT channels on the Board should be configured.
+        D : int or array_like
+            The digital code for all channels, or the codes of the 4 channels of each DPOT on the Board, e.g. from `invert_dpot_rout`.
         """
         # Configure dpots based on the provided digital code D. 
         # Calibration must have been done prior to calling this function.
-        self.pots=[]  # list of actual resistances
-        for i in range(len(self.dpots)):
-            if type(D) == int: self.dpots[i].setchannels_D([D, D, D, D]) # put the same D on all dpots
-            elif type(D) == list and len(D[i]) == 4: self.dpots[i].setchannels_D(D[i])
-            else: raise ValueError()
-            rs = self.dpots[i].calcrout()
-            for r in rs: 
-                self.pots.append(-1*r) # when positive voltage is applied (vappled-vref), the output of the amplifier to the ADC falls. That means, the votlage change is negative! However, in the vector matrix multiply, we expect the current output to be positive and the mathematical operation to be positive. For this reason, we add the negative sign.
-                if (len(self.pots) == max(self.xdim, self.ydim)): break
+        if isinstance(D, (int, np.integer)) and not isinstance(D, bool):
+            D = [[int(D)] * dpot.num_channels for dpot in self.dpots] # put the same D on all dpots
+        if type(D) not in (list, np.ndarray) or np.shape(D) != (len(self.dpots), self.dpots[0].num_channels):
+            raise ValueError()
+        for dpot, Ds in zip(self.dpots, np.asarray(D).tolist()):
+            dpot.setchannels_D(Ds)
+
+    @property
+    def pots(self):
+        """Transimpedances of the read channels as a vector of negative resistances.
+
+        When positive voltage is applied (vappled-vref), the output of the amplifier to the ADC falls. That means, the votlage change is negative! However, in the vector matrix multiply,
+        we expect the current output to be positive and the mathematical operation to be positive. For this reason, the resistances are negated.
+        The vector is cached and only recomputed after a DPOT code or calibration changed. Do not modify it in place.
+        """
+        version = sum(dpot.version for dpot in self.dpots)
+        if version != self._pots_version:
+            Ds = [[c.D for c in dpot.all_channels] for dpot in self.dpots]
+            if not all(D in range(dpot.num_positions) for dpot, row in zip(self.dpots, Ds) for D in row):
+                raise ValueError("DPOT codes have not been set, see set_dpot_D")
+            rs = np.concatenate([dpot.predictcalcrouts(row) for dpot, row in zip(self.dpots, Ds)])
+            self._pots = -1 * rs[:max(self.xdim, self.ydim)]
+            self._pots_version = version
+        return self._pots
+
+    @pots.setter
+    def pots(self, values):
+        self._pots = np.array(values, dtype=float)
+        self._pots_version = sum(dpot.version for dpot in self.dpots)
 
     @staticmethod
     def log_interp1d(xx, yy, kind='linear'):
@@ -219,6 +265,96 @@ class Daffodil_Base:
         self.EXT_GATE=0
         self.EXT_COL=0
       
+    def dac_bias_violations(self, line, vouts):
+        """Check DAC output voltages against the limits of the bulk DAC setters.
+
+        Parameters
+        ----------
+        line : 'col', 'row' or 'gate'
+            The lines driven by the voltages. Columns are only checked in the forward pass and rows in the backward pass.
+        vouts : numpy.ndarray
+            DAC output voltages.
+        Returns
+        -------
+        drop, bias : numpy.ndarray[bool]
+            Where the voltage across the device (or gate) exceeds 3.3 V, and where the bias is outside of the allowed range. A 0 V output means the line isn't active and is always allowed.
+        """
+        active = {'col': 'forward', 'row': 'backward'}
+        if line in active and self.curr_mode != active[line]:
+            return np.zeros(vouts.shape, dtype=bool), np.zeros(vouts.shape, dtype=bool)
+        if self.curr_vref is None:
+            raise ValueError('vref must be set with setrefopamp before the DACs are programmed.')
+        # do not apply voltages across the device exceeding 3.3 V
+        drop = np.abs(vouts - self.curr_vref) > (self.vmax - self.vground)
+        # do not apply anything lower than 1.7V (a 0 voltage_applied means the column/row/gate isn't active) 
+        # This is potentially incorrect - rows can also be grounded as long as they're disabled (?)
+        if line == 'gate':
+            bias = (vouts != 0) & ((vouts < 1.68) | (vouts > 5))
+        else:
+            bias = (vouts != 0) & ((vouts < self.vground) | (vouts > self.vmax))
+        return drop, bias
+
+    def dac_code_window(self, line):
+        """Return the `dac_bias_violations` of every DAC code for the current pass, reference bias, gain, offset and DAC calibration.
+        The masks are computed once for each of these settings, so checking a bias vector is a lookup.
+
+        Parameters
+        ----------
+        line : 'col', 'row' or 'gate'
+            The lines driven by the codes.
+        Returns
+        -------
+        drop, bias : numpy.ndarray[bool]
+            Masks indexed by DAC code. If a DAC calibration is loaded, every line has its own transfer curve and the masks are indexed by line and code.
+        """
+        key = (self.curr_mode, self.curr_vref, self.dac_gain_mode, self.dac_offset, self.dac_calibration, self.swfix_en)
+        if line not in self.dac_code_windows or self.dac_code_windows[line][0] != key:
+            if self.dac_calibration is None:
+                vouts = self.dacs[0].vout_table(self.dac_gain_mode, self.dac_offset) # same voltages as dac_calcvout
+            else:
+                codes = np.arange(self.dac_calibration.max_prec)
+                vouts = self.dac_calibration.calcvouts(self.dac_channel_index(line)[:, None], codes, self.dac_gain_mode, self.dac_offset)
+            self.dac_code_windows[line] = (key, self.dac_bias_violations(line, vouts))
+        return self.dac_code_windows[line][1]
+
+    def check_dac_codes(self, line, codes, channels=None):
+        """Check DAC codes before they are written by the bulk DAC setters.
+
+        Parameters
+        ----------
+        line : 'col', 'row' or 'gate'
+            The lines driven by the codes.
+        codes : array_like[int]
+            12-bit register values, element i drives line i.
+        channels : list[int], optional
+            The line numbers of the codes, used to select the calibration of the line and in the error message. Defaults to the positions in `codes`.
+
+        Raises
+        ------
+        ValueError
+            If any code violates the limits, listing every offending line.
+        """
+        codes = np.asarray(codes)
+        channels = np.arange(len(codes)) if channels is None else np.asarray(channels)
+        window = self.dac_code_window(line)
+        if codes.dtype.kind in 'iu' and (codes.size == 0 or (codes.min() >= 0 and codes.max() < window[0].shape[-1])):
+            drop, bias = [mask[codes] if mask.ndim == 1 else mask[channels, codes] for mask in window]
+        else: # fractional or out of range codes, dac_calcvout raises for the latter
+            drop, bias = self.dac_bias_violations(line, np.array([self.dac_calcvout(x, line, i) for x, i in zip(codes.tolist(), channels.tolist())]))
+        if not (drop.any() or bias.any()):
+            return
+
+        messages = {
+            'col': ('Applied voltage across the chip cannot be greater than 3.3V.', 'Column Bias cannot be lower than 1.7V.'),
+            'row': ('Applied voltage across the chip cannot be greater than 3.3V.', 'Row Bias cannot be lower than 1.7V.'),
+            'gate': ('Applied voltage across the gate cannot be greater than 3.3V.', 'Gate Bias cannot be lower than 1.7V.'),
+        }[line]
+        errors = []
+        for mask, message in zip([drop, bias & ~drop], messages):
+            if mask.any():
+                errors.append((np.argmax(mask), message + ' Offending {} channels: {}'.format(line, channels[mask].tolist())))
+        raise ValueError(' '.join(error for first, error in sorted(errors))) # the first offending channel's error comes first, as when checking one by one
+
     def setcoldacs(self, colvoltages):
         """This function accepts a list of voltages and programs all column DACS (all 25 channels). It will accept a smaller list.
 
@@ -232,17 +368,8 @@ class Daffodil_Base:
         ValueError
             If voltages exceeding 3.3 V are applied across a device, or if voltages lower than 1.7 V are applied on a column.
         """
+        self.check_dac_codes('col', colvoltages) # all channels are checked before any is written
         for i in range(len(colvoltages)):
-            voltage_applied = self.dac_calcvout(colvoltages[i])
-            voltage_drop =  voltage_applied - self.curr_vref
-            # do not apply voltages across the device exceeding 3.3 V
-            # do not apply anything lower than 1.7V (a 0 voltage_applied means the column/row/gate isn't active) 
-            if (self.curr_mode == 'forward'):
-                if (abs(voltage_drop) > (self.vmax - self.vground)):
-                    raise ValueError('Applied voltage across the chip cannot be greater than 3.3V.')
-                # This is potentially incorrect - rows can also be grounded as long as they're disabled (?)
-                if (voltage_applied != 0 and (voltage_applied < self.vground or voltage_applied > self.vmax)): 
-                    raise ValueError('Column Bias cannot be lower than 1.7V.')
             if i < 16: #this programs all 16 channels on DAC2
                 self.dacs[2].all_channels[i].update_x1(colvoltages[i])
                 self.dacs[2].all_channels[i].update_vout()
@@ -270,16 +397,7 @@ class Daffodil_Base:
         """
         #This function accepts a lists and programs all the column ADCS. It will accept a smaller list
         
-        voltage_applied = self.dac_calcvout(colvoltage)
-        voltage_drop =  voltage_applied - self.curr_vref
-        # do not apply voltages across the device exceeding 3.3 V
-        # do not apply anything lower than 1.7V (a 0 voltage_applied means the column/row/gate isn't active) 
-        if (self.curr_mode == 'forward'):
-            if (abs(voltage_drop) > (self.vmax - self.vground)):
-                raise ValueError('Applied voltage across the chip cannot be greater than 3.3V.')
-            # This is potentially incorrect - rows can also be grounded as long as they're disabled (?)
-            if (voltage_applied != 0 and (voltage_applied < self.vground or voltage_applied > self.vmax)): 
-                raise ValueError('Column Bias cannot be lower than 1.7V.')
+        self.check_dac_codes('col', [colvoltage], [i])
         if i < 16: #this programs all 16 channels on DAC2
             self.dacs[2].all_channels[i].update_x1(colvoltage)
             self.dacs[2].all_channels[i].update_vout()
@@ -303,17 +421,8 @@ class Daffodil_Base:
         ValueError
             If voltages exceeding 3.3 V are applied across a device, or if voltages lower than 1.7 V are applied on a row.
         """
+        self.check_dac_codes('row', rowvoltages) # all channels are checked before any is written
         for i in range(len(rowvoltages)):
-            voltage_applied = self.dac_calcvout(rowvoltages[i])
-            voltage_drop =  voltage_applied - self.curr_vref
-            # do not apply voltages across the device exceeding 3.3 V
-            # do not apply anything lower than 1.7V (a 0 voltage_applied means the column/row/gate isn't active) 
-            if (self.curr_mode == 'backward'):
-                if (abs(voltage_drop) > (self.vmax - self.vground)): 
-                    raise ValueError('Applied voltage across the chip cannot be greater than 3.3V.')
-                # This is potentially incorrect - rows can also be grounded as long as they're disabled (?)
-                if (voltage_applied != 0 and (voltage_applied < self.vground or voltage_applied > self.vmax)): 
-                    raise ValueError('Row Bias cannot be lower than 1.7V.')
             if i < 16: #This programs all 16 channels on DAC0
                 self.dacs[0].all_channels[i].update_x1(rowvoltages[i])
                 self.dacs[0].all_channels[i].update_vout()
@@ -339,14 +448,7 @@ class Daffodil_Base:
         ValueError
             If voltages exceeding 3.3 V are applied across a device, or if voltages lower than 1.7 V are applied on a row.
         """
-        voltage_applied = self.dac_calcvout(rowvoltage)
-        voltage_drop =  voltage_applied - self.curr_vref
-        if (self.curr_mode == 'backward'):
-            if (abs(voltage_drop) > (self.vmax - self.vground)): 
-                raise ValueError('Applied voltage across the chip cannot be greater than 3.3V.')
-            # This is potentially incorrect - rows can also be grounded as long as they're disabled (?)
-            if (voltage_applied != 0 and (voltage_applied < self.vground or voltage_applied > self.vmax)): 
-                raise ValueError('Row Bias cannot be lower than 1.7V.')
+        self.check_dac_codes('row', [rowvoltage], [i])
         if i < 16: #this programs all 16 channels on DAC2
             self.dacs[0].all_channels[i].update_x1(rowvoltage)
             self.dacs[0].all_channels[i].update_vout()
@@ -370,15 +472,8 @@ class Daffodil_Base:
         ValueError
             If voltages exceeding 3.3 V are applied across a gate, or if voltages lower than 1.7 V are applied on a gate.
         """
+        self.check_dac_codes('gate', gatevoltages) # all channels are checked before any is written
         for i in range(len(gatevoltages)):
-            voltage_applied = self.dac_calcvout(gatevoltages[i])
-            voltage_drop =  voltage_applied - self.curr_vref
-            # do not apply voltages across the device exceeding 3.3 V
-            # do not apply anything lower than 1.7V (a 0 voltage_applied means the column/row/gate isn't active) 
-            if (abs(voltage_drop) > (self.vmax - self.vground)): 
-                raise ValueError('Applied voltage across the gate cannot be greater than 3.3V.')
-            if (voltage_applied != 0 and (voltage_applied < 1.68 or voltage_applied > 5)):
-                raise ValueError('Gate Bias cannot be lower than 1.7V.')
             if i < 16: #this programs all 16 channels on DAC4 
                 if(i == 13 and self.swfix_en):
                     self.dacs[4].all_channels[14].update_x1(gatevoltages[13])
@@ -417,14 +512,7 @@ class Daffodil_Base:
             If voltages exceeding 3.3 V are applied across a gate, or if voltages lower than 1.7 V are applied on a gate.
         """
     
-        voltage_applied = self.dac_calcvout(gatevoltage)
-        voltage_drop =  voltage_applied - self.curr_vref
-        # do not apply voltages across the device exceeding 3.3 V
-        # do not apply anything lower than 1.7V (a 0 voltage_applied means the column/row/gate isn't active) 
-        if (abs(voltage_drop) > (self.vmax - self.vground)): 
-            raise ValueError('Applied voltage across the gate cannot be greater than 3.3V.')
-        if (voltage_applied != 0 and (voltage_applied < 1.68 or voltage_applied > 5)):
-            raise ValueError('Gate Bias cannot be lower than 1.7V.')
+        self.check_dac_codes('gate', [gatevoltage], [i])
         if i < 16: #this programs all 16 channels on DAC4 
             if(i == 13 and self.swfix_en):
                 self.dacs[4].all_channels[14].update_x1(gatevoltage)
@@ -469,7 +557,7 @@ class Daffodil_Base:
         #for example, we can pass 0.1 volts and measure current by applying the DACs to the columns at 0.1V and reading the current on the rows
         #we can also set the DACs to zero on the column and apply 0.1 volts to the reference bias. That will apply "negative" 0.1V to the device
         #current will flow the opposite direction. However, this also means that 0.1V is the zero current bias condition. This must be corrected post ADC in algorithm
-        v = self.dac_calcvout(refbias)
+        v = self.dac_calcvout(refbias, line='ref') # the measured output of the reference channel if a DAC calibration is loaded
         if (abs(v) < 1.687 or abs(v) > 2.5): raise ValueError('vref is best set within [1.7, 2.5] V. Verify that applied voltages are safe before suppressing this error.')
         self.curr_vref = v # saving for calculating applied voltages for later
         self.dacs[1].all_channels[9].update_x1(refbias)
@@ -495,6 +583,75 @@ class Daffodil_Base:
         """
         raise Exception("This is an abstract method and must be implemented")
 
+    def read_adcs(self):
+        """Update the ADC registers from the converters without asserting a new event. This is an abstract method that must be re-defined by inheriting classes."""
+        raise Exception("This is an abstract method and must be implemented")
+
+    def close(self):
+        """Release the files and mappings held by the board. Simulated boards hold none, see `Daffodil_Phys.close`."""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def event_oversampled(self, n_samples=1, min_stderr=None, mode='event', pulse_len=None):
+        """Assert a read event and measure the ADC outputs `n_samples` times.
+
+        Parameters
+        ----------
+        n_samples : int
+            Maximum number of samples per channel.
+        min_stderr : float, optional
+            Stop early once the standard error of the mean is below `min_stderr` (in ADC codes) on every channel. At least 2 samples are taken before stopping.
+        mode : 'event' or 'adc'
+            'event' asserts a new event for every sample. 'adc' asserts a single event and reads the converters `n_samples` times, which only averages the ADC noise.
+            If the ADC buffer of a physical board is enabled, every event returns the buffered scans and they are all used as samples. In 'adc' mode, a single event is then asserted.
+        pulse_len : int, optional
+            If given, the events are asserted with `event_timevariant(pulse_len)` instead of `event()`.
+
+        Returns
+        -------
+        mean : numpy.ndarray
+            Mean ADC code of each of the 25 channels.
+        std : numpy.ndarray
+            Standard deviation of the samples of each channel.
+        samples : numpy.ndarray
+            (number of samples, 25) array of ADC codes.
+        """
+        check_oversampling(n_samples, mode)
+        samples = []
+        for i in range(n_samples):
+            if i == 0 or mode == 'event':
+                if pulse_len is None: self.event()
+                else: self.event_timevariant(pulse_len)
+            else:
+                self.read_adcs()
+            if self.collect_adc_samples(samples, mode, min_stderr):
+                break
+        return sample_statistics(samples)
+
+    def collect_adc_samples(self, samples, mode, min_stderr):
+        """Append the ADC codes of the last event or ADC read to `samples`, the sampling step of `event_oversampled`.
+
+        Returns
+        -------
+        done : bool
+            True if no more samples are to be taken: the buffered scans of an 'adc' mode event are all the samples there are,
+            or the standard error of the mean is below `min_stderr` on every channel.
+        """
+        if getattr(self, 'adc_buffered', False):
+            samples.extend(self.retrieve_adc_samples()[0])
+            if mode == 'adc': return True # the scans of the event are the ADC samples, there is nothing left to read
+        else:
+            samples.append(self.retrievecurrents())
+
+        if min_stderr is not None and len(samples) > 1:
+            return bool(np.all(np.std(samples, axis=0, ddof=1) / np.sqrt(len(samples)) < min_stderr))
+        return False
+
     def retreivecolvoltages(self):
         """Retrieve the voltages written to the column DACs. These are 12 bit integers.
 
@@ -599,35 +756,145 @@ class Daffodil_Base:
         for dac in self.dacs:
             dac.setchannels_c([offset]*16)
 
-    def dac_calcvout(self,x1):
+    def dac_calcvout(self, x1, line=None, i=0):
         """Convert a provided 12-bit register value for a DAC to an output voltage.
 
         Parameters
         ----------
         x1 : int
             12-bit register value for a DAC. 
+        line : 'col', 'row', 'gate' or 'ref', optional
+            If given and a DAC calibration is loaded, `x1` is converted with the calibration of the DAC channel driving line `i`.
+        i : int
+            The line number, see `line`.
 
         Returns
         -------
         vout : float
             Output voltage corresponding to `x1`.
         """
+        if line is not None and self.dac_calibration is not None:
+            return float(self.dac_calibration.calcvouts(self.dac_channel_index(line)[i], x1, self.dac_gain_mode, self.dac_offset))
         return self.dacs[0].calcvout(x1,self.dac_gain_mode,self.dac_offset)
 
-    def dac_invertvout(self,v):
+    def dac_invertvout(self, v, line=None, i=0):
         """Convert a voltage to a 12-bit register value for a DAC.
 
         Parameters
         ----------
         vout : float
             Voltage to be converted.
+        line : 'col', 'row', 'gate' or 'ref', optional
+            If given and a DAC calibration is loaded, `v` is converted with the calibration of the DAC channel driving line `i`.
+        i : int
+            The line number, see `line`.
         Returns
         -------
         x1 : int
             12-bit register value corresponding to `v`. 
         """
+        if line is not None and self.dac_calibration is not None:
+            return int(self.dac_calibration.invertvouts(self.dac_channel_index(line)[i], v, self.dac_gain_mode, self.dac_offset))
         return self.dacs[0].invertvout(v,self.dac_gain_mode,self.dac_offset)
 
+    def dac_calcvouts(self, x1s, line=None):
+        """Convert an array of 12-bit DAC register values to output voltages. Same as `dac_calcvout` for every element, using a precomputed table.
+
+        Parameters
+        ----------
+        x1s : array_like[int]
+            12-bit register values.
+        line : 'col', 'row', 'gate' or 'ref', optional
+            If given and a DAC calibration is loaded, element i is converted with the calibration of the DAC channel driving line i.
+
+        Returns
+        -------
+        vouts : numpy.ndarray
+            Output voltages corresponding to `x1s`.
+        """
+        if line is not None and self.dac_calibration is not None:
+            x1s = np.asarray(x1s)
+            return self.dac_calibration.calcvouts(self.dac_channel_index(line)[:x1s.shape[-1]], x1s, self.dac_gain_mode, self.dac_offset)
+        return self.dacs[0].calcvouts(x1s,self.dac_gain_mode,self.dac_offset)
+
+    def dac_invertvouts(self, vs, line=None):
+        """Convert an array of voltages to 12-bit DAC register values. Same as `dac_invertvout` for every element.
+
+        Parameters
+        ----------
+        vs : array_like[float]
+            Voltages to be converted.
+        line : 'col', 'row', 'gate' or 'ref', optional
+            If given and a DAC calibration is loaded, element i is converted with the calibration of the DAC channel driving line i.
+
+        Returns
+        -------
+        x1s : numpy.ndarray
+            12-bit register values corresponding to `vs`.
+        """
+        if line is not None and self.dac_calibration is not None:
+            vs = np.asarray(vs, dtype=float)
+            return self.dac_calibration.invertvouts(self.dac_channel_index(line)[:vs.shape[-1]], vs, self.dac_gain_mode, self.dac_offset)
+        return self.dacs[0].invertvouts(vs,self.dac_gain_mode,self.dac_offset)
+
+    def dac_inverter(self, line=None):
+        """Capture the current DAC gain mode, offset and calibration in a conversion function that does not access the board.
+
+        Parameters
+        ----------
+        line : 'col', 'row', 'gate' or 'ref', optional
+            See `dac_invertvouts`.
+
+        Returns
+        -------
+        invertvouts : callable
+            Called as `invertvouts(vs)`, it returns the same register values as `dac_invertvouts(vs, line)` did when it was created.
+            It can run on another thread while the board is in use.
+        """
+        m, c = self.dac_gain_mode, self.dac_offset
+        if line is not None and self.dac_calibration is not None:
+            calibration, index = self.dac_calibration, self.dac_channel_index(line)
+            return lambda vs: calibration.invertvouts(index[:np.shape(vs)[-1]], np.asarray(vs, dtype=float), m, c)
+        dac = self.dacs[0]
+        return lambda vs: dac.invertvouts(vs, m, c)
+
+    def dac_channel_index(self, line):
+        """Map the board lines to DAC channels, following the assignments of `setcoldacs`, `setrowdacs`, `setgatedacs` and `setrefopamp`.
+
+        Parameters
+        ----------
+        line : 'col', 'row', 'gate' or 'ref'
+            The lines to map.
+
+        Returns
+        -------
+        index : numpy.ndarray
+            For every line, the board channel index 16 * DAC + channel of the DAC channel driving it.
+        """
+        if line == 'col':
+            return np.array([2*16 + i if i < 16 else 3*16 + i-16 for i in range(self.xdim)])
+        elif line == 'row':
+            return np.array([0*16 + i if i < 16 else 1*16 + i-16 for i in range(self.ydim)])
+        elif line == 'gate':
+            index = np.array([4*16 + i if i < 16 else 1*16 + i-16+10 if i < 22 else 3*16 + i-22+9 for i in range(self.xdim)])
+            if self.swfix_en: index[[13, 14]] = index[[14, 13]]
+            return index
+        elif line == 'ref':
+            return np.array([1*16 + 9])
+        raise ValueError(f"Line {line} not implemented.")
+
+    def load_dac_calibration(self, fname):
+        """Load measured per-channel DAC transfer curves. See `Board.Components.AD5391BSTZ5.AD5391BSTZ5_Calibration` for the file formats.
+        Once loaded, the conversions (`dac_calcvout`, `dac_invertvout`, their array versions and `dac_inverter`) use it when they are given a `line`,
+        and `check_dac_codes` and `setrefopamp` check the measured outputs.
+
+        Parameters
+        ----------
+        fname : str
+            Calibration file, or None to go back to the ideal transfer.
+        """
+        self.dac_calibration = None if fname is None else DAC_calibration(fname, self.dacs[0].all_channels[0].n, self.dacs[0].all_channels[0].vref)
+
     def adc_predict_voltage(self, registervalue):
         """Convert a readout ADC 12-bit register value to a voltage, which can then be converted to current using potentiometer values and knowledge of the reference bias.
 
@@ -704,25 +971,52 @@ class Daffodil_Sim(Daffodil_Base):
     """
     Simulation class for Daffodil board. Inherits from `Daffodil_Base`.
     """
-    def __init__(self, name):
+    def __init__(self, name, store=None, store_mode='r+', **device_args):
         """Initialize a Board object with simulated devices of type `name`.
 
         Parameters
         ----------
-        name : 'Generic'
-            A generic device model. See Board.Device.Generic for further details on default implementation.
+        name : 'Generic', 'MTJ' or the name of another registered device model
+            'Generic' is a generic device model, see Board.Device.Generic for further details on default implementation. 'MTJ' switches stochastically, see Board.Device.MTJ.
+            Further models can be added with `Board.Device.base.register`.
+        store : str, optional
+            Path of a memory mapped file holding the device state, so that a simulated chip persists across processes. See `Generic`.
+        store_mode : 'r+' or 'r'
+            Attach the store read-write or read-only.
+        device_args
+            Additional arguments of the device model, e.g. `seed` of 'MTJ'.
         """
         super().__init__(ADC_sim, DAC_sim, DPOT_sim)
 
-        if name == 'Generic':
-            self.sim_device = Generic(self.kernels, self.xdim, self.ydim)
-        else:
-            raise ValueError(f"{name} not implemented.")
+        self.sim_device = make_device(name, self.kernels, self.xdim, self.ydim, store=store, store_mode=store_mode, **device_args)
+
+        self.adc_registers = np.zeros((len(self.adcs), 4), dtype=int) # registers of all ADCs, adcs[i].registers is a view of row i
+        for adc, registers in zip(self.adcs, self.adc_registers):
+            adc.registers = registers
 
     def load_dacs(self, value):
         # nothing to do if simulation model
         return
 
+    def read_adcs(self):
+        # nothing to do if simulation model, the registers are updated by event
+        return
+
+    def load_dac_calibration(self, fname):
+        """Load measured per-channel DAC transfer curves, see `Daffodil_Base.load_dac_calibration`.
+        The simulated DAC channels then output the calibrated voltages, so the simulation models a board with these DACs.
+
+        Parameters
+        ----------
+        fname : str
+            Calibration file, or None to go back to the ideal transfer.
+        """
+        super().load_dac_calibration(fname)
+        for k, dac in enumerate(self.dacs):
+            for j, channel in enumerate(dac.all_channels):
+                channel.calibration = None if self.dac_calibration is None else (self.dac_calibration, 16*k + j)
+                channel.update_vout()
+
     def event(self):
         """
         Assert an `event` for the simulated Board. `event` physics are not perfectly resolved here. For example, there is no sense of timing. Certain realistic features are missing such as the
@@ -770,57 +1064,82 @@ class Daffodil_Sim(Daffodil_Base):
             for i in range(self.xdim):
                 self.sim_device.gatevoltages[i] = 0
 
-        for volt in self.sim_device.columnvoltages:
-            #this checks for unrealistic voltages
-            if volt > self.vmax:
-                raise ValueError("Voltage too high: " + str(volt) + "Volts > " + str(self.vmax))
-            #this checks for unrealistic voltages
-        for volt in self.sim_device.rowvoltages:
-            if volt > self.vmax:
-                raise ValueError("Voltage too high: " + str(volt) + "Volts > " + str(self.vmax))
-            #this checks for unrealistic voltages 
-        for volt in self.sim_device.gatevoltages:
-            if volt > self.vmax:
-                raise ValueError("Voltage too high: " + str(volt) + "Volts > " + str(self.vmax))
+        #this checks for unrealistic voltages on the columns, rows and gates at once
+        ncol, nrow = len(self.sim_device.columnvoltages), len(self.sim_device.rowvoltages)
+        volts = np.concatenate([self.sim_device.columnvoltages, self.sim_device.rowvoltages, self.sim_device.gatevoltages]).astype(float, copy=False)
+        columnvoltages, rowvoltages = volts[:ncol], volts[ncol:ncol+nrow]
+        over = volts > self.vmax
+        if np.count_nonzero(over):
+            raise ValueError("Voltage too high: " + str(volts[over.argmax()]) + "Volts > " + str(self.vmax))
 
         #this asserts a ReRAM/MTJ (whatever simulation device is selected) event. The devices and the currents are updated.
         self.sim_device.event(self.COL_EN_tobe,self.ROW_EN_tobe)
 
-        if self.write_mode_C == 0 and self.ext_mode_C == 0:
-            #if you are in the forward pass or the outer product update, this checks if the current exceeded the DAC limits
-            for curr in self.sim_device.columncurrents:
-                if abs(curr) > self.dac_curr_limit:
-                    raise ValueError("Column Current too high: " + str(curr) + "Volts > " + str(self.dac_curr_limit))
-            
-        if self.write_mode_R == 0 and self.ext_mode_R == 0:
-            #if you are in the backward pass or the outer product update, this checks if the current exceeded the DAC limits
-            for curr in self.sim_device.rowcurrents:
-                if abs(curr) > self.dac_curr_limit:
-                    raise ValueError("Row Current too high: " + str(curr) + "Volts > " + str(self.dac_curr_limit))
+        ncol = len(self.sim_device.columncurrents)
+        currs = np.concatenate([self.sim_device.columncurrents, self.sim_device.rowcurrents]).astype(float, copy=False)
+        columncurrents, rowcurrents = currs[:ncol], currs[ncol:]
+
+        #if you are in the forward/backward pass or the outer product update, this checks if the column/row currents exceeded the DAC limits
+        check_C = self.write_mode_C == 0 and self.ext_mode_C == 0
+        check_R = self.write_mode_R == 0 and self.ext_mode_R == 0
+        if check_C or check_R:
+            over = np.abs(currs[(0 if check_C else ncol):(None if check_R else ncol)]) > self.dac_curr_limit
+            if np.count_nonzero(over):
+                first = over.argmax() + (0 if check_C else ncol)
+                raise ValueError(("Column" if first < ncol else "Row") + " Current too high: " + str(currs[first]) + "Volts > " + str(self.dac_curr_limit))
 
         if self.write_mode_C == 1 and self.ext_mode_C == 0:
             #this converts the currents (in uA) to voltages values and updates the ADC registers. It assumes an ideal zero input impedance transimpedance.
-            for i in range(self.xdim):
-                transimpedance_output = self.sim_device.columnvoltages[i] - self.sim_device.columncurrents[i]*self.pots[i]/self.sim_device.currentscale
-                if transimpedance_output > (self.vmax - self.vground): #The voltage cannot exceed the board limit. You can also clip this at 3.3
+            transimpedance_output = columnvoltages[:self.xdim] - columncurrents[:self.xdim]*self.pots[:self.xdim]/self.sim_device.currentscale
+            #The voltage cannot exceed the board limit or go below 0. You can also clip this at 3.3 and 0
+            over = (transimpedance_output > (self.vmax - self.vground)) | (transimpedance_output < 0.0)
+            if np.count_nonzero(over):
+                first = over.argmax()
+                if transimpedance_output[first] > (self.vmax - self.vground):
                     raise ValueError("input current to transimpedance amplifier at limit")
-                if transimpedance_output < 0.0: #The voltage cannot go below the board limit. You can also clip this at 0
-                    raise ValueError("the minimal voltage limit on the amplifier is reached " + str(transimpedance_output) + " is out of range")
-                self.adcs[i//4].update_register(i%4,transimpedance_output)
+                raise ValueError("the minimal voltage limit on the amplifier is reached " + str(transimpedance_output[first]) + " is out of range")
+            self.update_adc_registers(transimpedance_output)
 
         if self.write_mode_R == 1 and self.ext_mode_R == 0:
             #this converts the currents (in uA) to voltages values and updates the ADC registers. It assumes an ideal zero input impedance transimpedance.
-            for i in range(self.ydim):
-                transimpedance_output = self.sim_device.rowvoltages[i] + self.sim_device.rowcurrents[i]*self.pots[i]/self.sim_device.currentscale
-                if transimpedance_output > (self.vmax - self.vground): #The voltage cannot exceed the board limit. You can also clip this at 3.3
-                    transimpedance_output = (self.vmax - self.vground)
-                    # raise ValueError("input current to transimpedance amplifier at limit")
-                if transimpedance_output < 0.0: #The voltage cannot go below the board limit. You can also clip this at 0
-                    transimpedance_output = 0.0
-                    # raise ValueError("the minimal voltage limit on the amplifier is reached " + str(transimpedance_output) + " is out of range")
-                self.adcs[i//4].update_register(i%4,transimpedance_output)
-
-    def event_timevariant(self, pulse_len):
+            transimpedance_output = rowvoltages[:self.ydim] + rowcurrents[:self.ydim]*self.pots[:self.ydim]/self.sim_device.currentscale
+            #The voltage cannot exceed the board limit or go below 0, it is clipped at 3.3 and 0
+            transimpedance_output = np.maximum(np.minimum(transimpedance_output, self.vmax - self.vground), 0.0)
+            self.update_adc_registers(transimpedance_output)
+
+    def update_adc_registers(self, values):
+        """Quantize the transimpedance amplifier outputs of the first len(`values`) read channels into `adc_registers`, as `ADS7950SBDBT_Sim.update_register` does channel by channel.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            Voltages at the ADC inputs.
+        """
+        gains = [adc.gain for adc in self.adcs]
+        vrefs = [adc.vref for adc in self.adcs]
+        if gains.count(gains[0]) == len(gains) and vrefs.count(vrefs[0]) == len(vrefs): # the ADCs share their settings
+            gains, vrefs = gains[0], vrefs[0]
+        else:
+            gains, vrefs = np.repeat(gains, 4)[:len(values)], np.repeat(vrefs, 4)[:len(values)]
+        codes = np.rint(4096*values/(gains+1)/vrefs)
+        over = codes > 4096 # this checks a physical reality. It's mathematically impossible to read more than 4096 values
+        if np.count_nonzero(over):
+            first = over.argmax()
+            raise ValueError("Register overflow, unphysical current of {} from value {}".format(int(codes[first]), values[first]))
+        self.adc_registers.reshape(-1)[:len(values)] = codes
+
+    def retrievecurrents(self):
+        """Retrieve output currents from all ADCs, read directly from `adc_registers`. See `Daffodil_Base.retrievecurrents`.
+
+        Returns
+        -------
+        currents : list[int]
+            A list of currents on the crossbar outputs as 12-bit integers.
+        """
+        return self.adc_registers.reshape(-1)[:self.xdim].tolist()
+
+    def event_timevariant(self, pulse_len, write=False):
+        # simulated events take no time, reads and writes alike
         self.event()
 
     def set_kernel(self, kernel, swfix_en=False): # This selects the kernel
@@ -858,20 +1177,176 @@ class Daffodil_Sim(Daffodil_Base):
         if bit not in [0, 1]: raise ValueError("Setting compliance control incorrectly")
         self.compliance_control = bit
 
+    # scalar board settings captured by snapshot(), in addition to the per-part registers
+    snapshot_flags = ['write_mode_G', 'ext_mode_G', 'EN_IO_G', 'write_mode_C', 'ext_mode_C', 'EN_IO_C', 'write_mode_R', 'ext_mode_R', 'EN_IO_R',
+                      'EXT_ROW', 'EXT_GATE', 'EXT_COL', 'RA0', 'RA1', 'CA0', 'LSB', 'MSB', 'CA1', 'compliance_control', 'swfix_en', 'selected_kernel',
+                      'dac_gain_mode', 'dac_offset']
+    snapshot_dac_regs = ['x1', 'm', 'c', 'set_x1', 'reset_x1'] # integer DAC channel registers
+    snapshot_dac_outs = ['x2', 'vout', 'set_x2', 'reset_x2'] # derived DAC channel values, kept so that hardware set/reset states restore exactly
+
+    def snapshot_dtype(self):
+        device = self.sim_device
+        dac_shape = (len(self.dacs), self.channels)
+        return np.dtype([
+            ('G', float, (device.numkernel, device.kernelxdim, device.kernelydim)),
+            ('setG', float, (device.numkernel, device.kernelxdim, device.kernelydim)),
+            ('resetG', float, (device.numkernel, device.kernelxdim, device.kernelydim)),
+            ('set_count', int, (device.numkernel, device.kernelxdim, device.kernelydim)),
+            ('reset_count', int, (device.numkernel, device.kernelxdim, device.kernelydim)),
+            ('selectedkernel', int),
+            ('dpot_r', float),
+            ('columnvoltages', float, (self.xdim,)),
+            ('rowvoltages', float, (self.ydim,)),
+            ('gatevoltages', float, (self.xdim,)),
+            ('columncurrents', float, (self.xdim,)),
+            ('rowcurrents', float, (self.ydim,)),
+            ] + [(name, int, dac_shape) for name in self.snapshot_dac_regs] + [(name, float, dac_shape) for name in self.snapshot_dac_outs] + [
+            ('D', int, (len(self.dpots), self.dpots[0].num_channels)),
+            ('registers', int, (len(self.adcs), 4)),
+            ('COL_EN_tobe', int, (self.xdim,)),
+            ('ROW_EN_tobe', int, (self.ydim,)),
+            ('flags', int, (len(self.snapshot_flags),)),
+            ('curr_vref', float),
+            ('curr_mode', 'U16'),
+            ('rng_state', 'U512'), # JSON state of the random number generator of stochastic device models, see Device.MTJ
+        ])
+
+    def snapshot(self):
+        """Capture the state of the simulated board: device conductances, DAC registers, DPOT codes, ADC registers, enables and mux configuration.
+        The random number generator of a stochastic device model is captured too, so that the same operations switch the same devices after `restore`.
+
+        Returns
+        -------
+        snap : numpy.ndarray
+            A 0-d structured array holding the state. It can be passed to `restore`, or written with `save`.
+        """
+        device = self.sim_device
+        snap = np.zeros((), dtype=self.snapshot_dtype())
+        snap['G'] = [k.kern for k in device.all_kernels]
+        for name in ['setG', 'resetG', 'set_count', 'reset_count']:
+            snap[name] = [getattr(k, name) for k in device.all_kernels]
+        snap['selectedkernel'] = device.selectedkernel
+        snap['dpot_r'] = getattr(device, 'dpot_r', np.nan)
+        for name in ['columnvoltages', 'rowvoltages', 'gatevoltages', 'columncurrents', 'rowcurrents']:
+            snap[name] = getattr(device, name)
+        for name in self.snapshot_dac_regs + self.snapshot_dac_outs:
+            snap[name] = [[getattr(c, name) for c in dac.all_channels] for dac in self.dacs]
+        snap['D'] = [[c.D for c in dpot.all_channels] for dpot in self.dpots]
+        snap['registers'] = [adc.registers for adc in self.adcs]
+        snap['COL_EN_tobe'] = self.COL_EN_tobe
+        snap['ROW_EN_tobe'] = self.ROW_EN_tobe
+        snap['flags'] = [getattr(self, name, 0) for name in self.snapshot_flags]
+        snap['curr_vref'] = np.nan if self.curr_vref is None else self.curr_vref
+        snap['curr_mode'] = '' if self.curr_mode is None else self.curr_mode
+        if hasattr(device, 'rng'):
+            rng_state = json.dumps(device.rng.bit_generator.state)
+            if len(rng_state) > snap['rng_state'].itemsize // 4:
+                raise ValueError(f"The state of the {device.rng.bit_generator.__class__.__name__} generator does not fit in a snapshot")
+            snap['rng_state'] = rng_state
+        return snap
+
+    def restore(self, snap):
+        """Restore a state captured by `snapshot` or read by `load`. The snapshot itself is not modified, so it can be restored any number of times.
+
+        Parameters
+        ----------
+        snap : numpy.ndarray
+            A snapshot of a board with the same dimensions and device model.
+        """
+        if snap.dtype != self.snapshot_dtype():
+            raise ValueError("Snapshot does not match the board dimensions")
+        device = self.sim_device
+        for k, kern in enumerate(device.all_kernels):
+            for name, field in [('kern', 'G'), ('setG', 'setG'), ('resetG', 'resetG'), ('set_count', 'set_count'), ('reset_count', 'reset_count')]:
+                getattr(kern, name)[...] = snap[field][k] # in place, the kernel may be backed by a memory mapped device store, see Generic
+        device.selectkernel(int(snap['selectedkernel']))
+        if not np.isnan(snap['dpot_r']):
+            device.dpot_r = float(snap['dpot_r'])
+        for name in ['columnvoltages', 'rowvoltages', 'gatevoltages', 'columncurrents', 'rowcurrents']:
+            setattr(device, name, np.array(snap[name], dtype=float))
+        for name in self.snapshot_dac_regs + self.snapshot_dac_outs:
+            for dac, values in zip(self.dacs, snap[name].tolist()):
+                for c, value in zip(dac.all_channels, values):
+                    setattr(c, name, value)
+        for dpot, Ds in zip(self.dpots, snap['D'].tolist()):
+            for c, D in zip(dpot.all_channels, Ds):
+                c.D = D # -1 if the codes were never set
+            dpot.version += 1 # the transimpedances are recomputed from the codes, see pots
+        self.adc_registers[...] = snap['registers']
+        self.COL_EN_tobe = snap['COL_EN_tobe'].tolist()
+        self.ROW_EN_tobe = snap['ROW_EN_tobe'].tolist()
+        for name, value in zip(self.snapshot_flags, snap['flags'].tolist()):
+            setattr(self, name, bool(value) if name == 'swfix_en' else value)
+        self.curr_vref = None if np.isnan(snap['curr_vref']) else float(snap['curr_vref'])
+        self.curr_mode = None if snap['curr_mode'] == '' else str(snap['curr_mode'])
+        if hasattr(device, 'rng') and snap['rng_state'] != '':
+            device.rng.bit_generator.state = json.loads(str(snap['rng_state']))
+
+    def save(self, fname, snap=None):
+        """Write a snapshot to a binary .npy file.
+
+        Parameters
+        ----------
+        fname : str
+            File name.
+        snap : numpy.ndarray, optional
+            Snapshot to write. The current state is captured if None.
+        """
+        np.save(fname, self.snapshot() if snap is None else snap)
+
+    def load(self, fname):
+        """Restore the board from a file written by `save`.
+
+        The file is memory mapped copy-on-write, so the returned snapshot can be restored again later without re-reading or modifying the file.
+
+        Parameters
+        ----------
+        fname : str
+            File name.
+
+        Returns
+        -------
+        snap : numpy.ndarray
+            The loaded snapshot.
+        """
+        snap = np.load(fname, mmap_mode='c')
+        self.restore(snap)
+        return snap
+
 class Daffodil_Phys(Daffodil_Base):
     """
     Physical class for Daffodil board. Inherits from `Daffodil_Base`. Handles all physical interactions with the mixed-signal daughterboard.
     """
-    def __init__(self):
+    default_serial = '1304917' # the board the library was developed on, whose DPOT calibration was used before serials could be selected
+
+    def __init__(self, PGPIO=None, serial=default_serial, dpot_calib_file=None):
 
         """Initialize the physical Board object. Similar to `Daffodil_Base.__init__` with additional binding to the physical memory space for communication with the mixed-signal daughterboard.
+
+        Parameters
+        ----------
+        PGPIO : ctypes.CDLL or object, optional
+            The PGPIO interface. If None, libpgpio.so is loaded. Any object with the same functions and integer variables can be passed instead, e.g. `Board.emulator.PGPIO_Emu`.
+        serial : str, optional
+            Board serial. The DPOTs are calibrated with the measurements of this board, see `load_dpot_calibration`. Defaults to `default_serial`.
+        dpot_calib_file : str, optional
+            DPOT calibration file, used instead of the one of `serial`.
+
+        Raises
+        ------
+        ValueError
+            If `dpot_calib_file` is not given and there is no calibration file for `serial`, since the transimpedances of the board are not known without a DPOT calibration.
         """
 
         self.name_map = {}
-        try:
-            self.PGPIO = ctypes.CDLL(ctypes.util.find_library("pgpio")) #this will find and load libpgpio.so
-        except:
-            raise Exception("Failed to load C bindings for PGPIO")
+        if dpot_calib_file is None:
+            DPOT_calibration.serial_file(serial) # raises before the PGPIO is used
+        if PGPIO is None:
+            try:
+                PGPIO = ctypes.CDLL(ctypes.util.find_library("pgpio")) #this will find and load libpgpio.so
+            except:
+                raise Exception("Failed to load C bindings for PGPIO")
+        self.PGPIO = PGPIO
 
         ret = self.PGPIO.open_mem()
         if ret != 0:
@@ -879,6 +1354,8 @@ class Daffodil_Phys(Daffodil_Base):
         self.PGPIO.init()
 
         super().__init__(ADC_phys, DAC_phys, DPOT_phys)
+        self.serial = serial
+        self.load_dpot_calibration(dpot_calib_file, serial)
 
         self.name_map = {
             "RA0": self.get_int("ra_base"),
@@ -900,6 +1377,9 @@ class Daffodil_Phys(Daffodil_Base):
 
         self.config_muxes()
 
+        self.adc_buffered = False
+        self.adc_trigger_now = None # trigger_now attribute of the sysfs trigger of the ADC buffers, see enable_adc_buffer
+        self.closed = False
         for dac in self.dacs:
             dac.PGPIO = self.PGPIO
             for c in dac.all_channels:
@@ -908,6 +1388,27 @@ class Daffodil_Phys(Daffodil_Base):
         for adc in self.adcs:
             adc.PGPIO = self.PGPIO
             adc.init_static_files()
+        for dpot in self.dpots:
+            for c in dpot.all_channels:
+                c.init_static_files()
+
+    def close(self):
+        """Close the sysfs files kept open by the DAC, ADC and DPOT parts (about 300 in the default `accel_iio_c` mode 3) and release the
+        PGPIO register mapping. The board cannot be used afterwards. Boards are also context managers, `with Daffodil_Phys(serial=...) as board: ...`
+        closes the board at the end of the block.
+        """
+        if self.closed:
+            return
+        for dac in self.dacs:
+            for c in dac.all_channels:
+                c.close_static_files()
+        for adc in self.adcs:
+            adc.close_static_files()
+        for dpot in self.dpots:
+            for c in dpot.all_channels:
+                c.close_static_files()
+        self.PGPIO.close_mem()
+        self.closed = True
 
     def __setattr__(self, name, value):
         if name == "name_map":
@@ -925,7 +1426,125 @@ class Daffodil_Phys(Daffodil_Base):
         return object.__getattribute__(self, name) #not sure this is nescessary
 
     def get_int(self, name):
-        return ctypes.c_int.in_dll(self.PGPIO, name).value
+        if isinstance(self.PGPIO, ctypes.CDLL):
+            return ctypes.c_int.in_dll(self.PGPIO, name).value
+        return getattr(self.PGPIO, name) # software stand-ins expose the library variables as attributes
+
+    def set_accel_iio_c(self, mode):
+        """Select how the DAC, ADC and DPOT parts access their sysfs files.
+
+        Parameters
+        ----------
+        mode : int
+            0 opens and closes the files from Python on every access, 1 does the same through PGPIO, 2 uses files kept open by PGPIO,
+            and 3 (the default) uses files kept open from Python, skipping DAC gain/offset writes that do not change the value.
+            Mode 2 opens the files once per call, so it should only be selected once per board. The DPOTs only distinguish mode 3 from the rest.
+        """
+        for dac in self.dacs:
+            for c in dac.all_channels:
+                c.accel_iio_c = mode
+                c.init_static_files()
+        for adc in self.adcs:
+            adc.accel_iio_c = mode
+            adc.init_static_files()
+        for dpot in self.dpots:
+            for c in dpot.all_channels:
+                c.accel_iio_c = mode
+                c.init_static_files()
+
+    def load_dpot_calibration(self, fname=None, serial=None, method='piecewise', deg=1):
+        """Use measured DPOT transfer curves. Calibration files are parsed once and shared, see `Board.Components.AD8403.AD8403_Calibration`.
+        The resistances in `pots` are recomputed for the current codes.
+
+        Parameters
+        ----------
+        fname : str, optional
+            Calibration file. Either `fname` or `serial` must be given.
+        serial : str, optional
+            Board serial, selects `<calib_dir>/<serial>.txt`.
+        method : str
+            'piecewise' for linear interpolation between the measured points, 'poly' for a least-squares polynomial of degree `deg`.
+        deg : int
+            Degree of the polynomial fit.
+        """
+        if fname is not None:
+            calibration = DPOT_calibration.get(fname, method, deg)
+        elif serial is not None:
+            calibration = DPOT_calibration.for_serial(serial, method, deg)
+        else:
+            raise ValueError("Either fname or serial must be given")
+        for dpot in self.dpots:
+            dpot.calibrate(calibration)
+
+    def enable_adc_buffer(self, n_samples=1, trigger=None, length=None):
+        """Read the ADCs through the IIO triggered buffer. Each read event then captures `n_samples` scans of all channels, one per trigger,
+        and reads them in one bulk read per ADC.
+
+        A sysfs trigger (iio-trig-sysfs, which has a trigger_now attribute) is fired `n_samples` times by every read event, after the read pulse
+        (and after `adc_settle_time` in `event_timevariant`). Any other trigger (e.g. an hrtimer trigger) has to fire on its own: the scans it
+        captured before the read are dropped, and the read waits up to `ADS7950SBDBT_Phys.buffer_timeout` for the next `n_samples` scans.
+
+        Parameters
+        ----------
+        n_samples : int
+            Number of scans captured per event. The ADC registers are set to the rounded mean of the scans, see `retrieve_adc_samples` for the individual scans.
+        trigger : str, optional
+            Name of the IIO trigger to attach to the ADCs. The current trigger is kept if None.
+        length : int, optional
+            Capacity of the kernel ring buffers in scans, see `ADS7950SBDBT_Phys.enable_buffer`.
+        """
+        for adc in self.adcs:
+            adc.enable_buffer(n_samples, trigger, length)
+        directory = self.adcs[0].trigger_dir
+        self.adc_trigger_now = None
+        if directory is not None and os.path.exists(directory + '/trigger_now'):
+            self.adc_trigger_now = ctypes.c_char_p(bytes(directory + '/trigger_now', 'utf-8'))
+        self.adc_buffered = True
+
+    def disable_adc_buffer(self):
+        """Go back to reading the ADCs channel by channel through sysfs."""
+        for adc in self.adcs:
+            adc.disable_buffer()
+        self.adc_buffered = False
+
+    def flush_adc_buffer(self):
+        # scans triggered outside of read events (e.g. by write pulses) would otherwise be returned by the next buffered read
+        if self.adc_buffered:
+            for adc in self.adcs:
+                adc.flush_buffer()
+
+    def fire_adc_trigger(self):
+        # fires the sysfs trigger of the ADC buffers once per scan to capture, see enable_adc_buffer
+        if self.adc_trigger_now is not None:
+            for i in range(self.adcs[0].n_samples):
+                self.PGPIO.write_int(self.adc_trigger_now, 1)
+
+    def read_adcs(self):
+        if self.adc_buffered:
+            if self.adc_trigger_now is None:
+                self.flush_adc_buffer() # a trigger firing on its own may have captured scans before the outputs settled
+            self.fire_adc_trigger()
+            for adc in self.adcs:
+                adc.update_registers()
+        else:
+            for i in range(self.xdim):
+                self.adcs[i//4].update_register(i%4)
+
+    def retrieve_adc_samples(self):
+        """Retrieve the individual scans of the last buffered read event.
+
+        Returns
+        -------
+        samples : numpy.ndarray
+            (n_samples, 25) array of 12-bit ADC codes.
+        timestamps : numpy.ndarray
+            (n_samples, 7) array of scan timestamps in ns, one column per ADC.
+        """
+        if not self.adc_buffered:
+            raise Exception("ADC buffer is not enabled, see enable_adc_buffer")
+        samples = np.concatenate([adc.samples for adc in self.adcs], axis=1)[:, :self.xdim]
+        timestamps = np.stack([adc.timestamps for adc in self.adcs], axis=1)
+        return samples, timestamps
 
     def load_dacs(self, value):
         self.PGPIO.write_bit(0x1000, 15, value[4])
@@ -978,10 +1597,10 @@ class Daffodil_Phys(Daffodil_Base):
         for i in range(row_cnt):
             self.PGPIO.write_bit(data_offset, row_base + i, self.ROW_EN_tobe[i])
         if self.write_mode_C == 1 or self.write_mode_R == 1:
+            self.flush_adc_buffer()
             self.PGPIO.raw_write(self.get_int("pulse_length_addr"), self.read_pulse_len)
             self.PGPIO.raw_write(self.get_int("event_addr"), 1)
-            for i in range(self.xdim):
-                self.adcs[i//4].update_register(i%4)
+            self.read_adcs()
             #event will end after all adcs have been read
         else:
             self.PGPIO.raw_write(self.get_int("pulse_length_addr"), self.write_pulse_len)
@@ -991,6 +1610,8 @@ class Daffodil_Phys(Daffodil_Base):
         # There should be more methods added to the base class to deal with changing the pulse length
         # Different pulse lengths will also impact the simulation, so the base class should take care of them
  
+    adc_settle_time = 0.06 # wait between a timed read pulse and the ADC reads, see event_timevariant
+
     def event_timevariant(self, pulse_len, write = False):
         """
         Assert a read or write `event` for the physical Board with specified pulse length `pulse_len`.
@@ -1002,6 +1623,20 @@ class Daffodil_Phys(Daffodil_Base):
             write: bool
                 If False, the event is followed by ADC register updates, indicating a read operation.
         """
+        if self.assert_event(pulse_len):
+            if(write == False):
+                t.sleep(self.adc_settle_time) # the outputs settle before the ADCs are read or the buffer trigger is fired
+            self.read_adcs()
+
+    def assert_event(self, pulse_len):
+        """
+        Assert the enables and a pulse of `pulse_len` clock cycles, the first half of `event_timevariant`.
+
+        Returns
+        -------
+            read: bool
+                True if the board is in a read configuration, in which case the ADCs are to be read once the outputs have settled (see `adc_settle_time`).
+        """
         data_offset = self.get_int("gpio_data_offset")
         col_cnt = self.get_int("col_en_cnt")
         col_base = self.get_int("col_en_base")
@@ -1021,18 +1656,17 @@ class Daffodil_Phys(Daffodil_Base):
         for i in range(row_cnt):
             self.PGPIO.write_bit(data_offset, row_base + i, self.ROW_EN_tobe[i])
         if self.write_mode_C == 1 or self.write_mode_R == 1:
+            self.flush_adc_buffer()
             self.PGPIO.raw_write(self.get_int("pulse_length_addr"), pulse_len)
             self.PGPIO.raw_write(self.get_int("event_addr"), 1)
-            if(write == False):
-                t.sleep(0.06)
-            for i in range(self.xdim):
-                self.adcs[i//4].update_register(i%4)
+            return True
             #event will end after all adcs have been read
         else:
             self.PGPIO.raw_write(self.get_int("pulse_length_addr"), pulse_len)
             self.PGPIO.raw_write(self.get_int("event_addr"), 1)
             #print("pulse len", self.write_pulse_len)
             #event is over quickly
+            return False
 
         # There should be more methods added to the base class to deal with changing the pulse length
         # Different pulse lengths will also impact the simulation, so the base class should take care of them    
@@ -0,0 +1,371 @@
+"""
+Software stand-in for the hardware interfaces used by `Daffodil_Phys`.
+
+`Daffodil_Phys` talks to the mixed-signal daughterboard through two interfaces: the PGPIO library (libpgpio.so), which maps the FPGA
+registers through /dev/mem, and the IIO/SPI sysfs trees of the DAC, ADC and DPOT drivers. This file emulates both, so that the real
+`Daffodil_Phys` code paths (sysfs writes, GPIO toggles, the `accel_iio_c` modes) can be exercised and profiled without the lab bench.
+
+    * `Sysfs_Emu` builds a temporary directory tree with the same layout as /sys/bus/iio/devices and /sys/bus/spi/devices, and a dev/
+      directory whose iio:deviceN files stand in for the IIO buffer character devices of the ADCs.
+    * `PGPIO_Emu` implements the PGPIO functions and variables in Python. Writing the event register runs a `Daffodil_Sim` shadow board:
+      the DAC, DPOT, mux, enable and kernel state is read back from the files and registers, the device model is updated, and the
+      resulting ADC codes are written to the in_voltageN_raw files. Firing the sysfs trigger through `write_int` appends one scan of
+      these codes to the buffer of every ADC attached to it.
+
+A board is built with `make_phys_board()`, e.g.
+
+    board = emulator.make_phys_board('Generic')
+    board.sim_device = board.PGPIO.sim.sim_device # optional, to inspect the emulated chip
+    ...
+    board.close() # closes the sysfs files and removes the temporary sysfs tree
+
+The emulation is functional only. There is no sense of timing, and an event always completes before the next register access.
+"""
+
+from .controller import Daffodil_Sim, Daffodil_Phys
+from .. import utils
+
+import numpy as np
+import ctypes
+import tempfile
+import shutil
+import time
+import os
+
+class Sysfs_Emu:
+    """
+    Temporary sysfs tree for the 7 ADCs (iio:device0-6), 5 DACs (iio:device8-12) and 7 DPOTs (spi13.0-6) of the Daffodil board.
+
+    A DPOT calibration file matching the ideal `AD8403_Sim` transfer curve is written to the root of the tree so that `AD8403_Phys`
+    can be calibrated against it, see `Daffodil_Phys(dpot_calib_file=...)`.
+
+    The tree has one IIO sysfs trigger (trigger0, named `trigger_name`) for the ADC buffers.
+    """
+    trigger_name = 'sysfstrig0'
+
+    def __init__(self, root=None, vref=2.5):
+        self.tmpdir = None
+        if root is None:
+            self.tmpdir = tempfile.mkdtemp(prefix='daffodil-sysfs-')
+            root = self.tmpdir
+        self.root = root
+
+        self.adc_dirs = [self.make_dir('bus/iio/devices/iio:device{}'.format(i)) for i in range(7)]
+        self.dac_dirs = [self.make_dir('bus/iio/devices/iio:device{}'.format(i + 8)) for i in range(5)]
+        self.dpot_dirs = [self.make_dir('bus/spi/devices/spi13.{}'.format(i)) for i in range(7)]
+        self.trigger_dir = self.make_dir('bus/iio/devices/trigger0')
+        self.dev_dir = self.make_dir('dev')
+        self.adc_devs = [self.dev_dir + '/iio:device{}'.format(i) for i in range(7)]
+
+        for d in self.adc_dirs:
+            self.write(d + '/name', 'ads7950')
+            self.write(d + '/in_voltage_scale', '{:.9f}'.format(1000 * vref / 4096))
+            for i in range(4):
+                self.write(d + '/in_voltage{}_raw'.format(i), 0)
+            # triggered buffer of the ti-ads7950 driver: 12 bit big endian samples in 16 bit words, timestamp at index 4
+            self.make_dir(d[len(self.root) + 1:] + '/scan_elements')
+            self.make_dir(d[len(self.root) + 1:] + '/buffer')
+            self.make_dir(d[len(self.root) + 1:] + '/trigger')
+            for i in range(4):
+                self.write(d + '/scan_elements/in_voltage{}_en'.format(i), 0)
+                self.write(d + '/scan_elements/in_voltage{}_index'.format(i), i)
+                self.write(d + '/scan_elements/in_voltage{}_type'.format(i), 'be:u12/16>>0')
+            self.write(d + '/scan_elements/in_timestamp_en', 0)
+            self.write(d + '/scan_elements/in_timestamp_index', 4)
+            self.write(d + '/scan_elements/in_timestamp_type', 'le:s64/64>>0')
+            self.write(d + '/buffer/length', 2)
+            self.write(d + '/buffer/enable', 0)
+            self.write(d + '/trigger/current_trigger', '')
+        for dev in self.adc_devs:
+            self.write(dev, '')
+        self.write(self.trigger_dir + '/name', self.trigger_name)
+        self.write(self.trigger_dir + '/trigger_now', 0)
+        self.trigger_now = self.trigger_dir + '/trigger_now'
+        for d in self.dac_dirs:
+            self.write(d + '/name', 'ad5391')
+            for i in range(16):
+                self.write(d + '/out_voltage{}_raw'.format(i), 0)
+                self.write(d + '/out_voltage{}_calibscale'.format(i), 4094)
+                self.write(d + '/out_voltage{}_calibbias'.format(i), 0)
+        for d in self.dpot_dirs:
+            self.write(d + '/modalias', 'spi:ad8403')
+            for i in range(4):
+                self.write(d + '/rdac{}'.format(i), 0)
+
+        # header row holds the digital codes, the following 28 rows the resistance of each channel at those codes
+        codes = np.array([0, 128, 255])
+        R_AB, R_W, num_positions = 100000, 50, 256
+        calib = np.vstack([codes] + [codes / num_positions * R_AB + R_W] * 28)
+        self.calib_file = self.root + '/dpots.txt'
+        np.savetxt(self.calib_file, calib, fmt='%.3f', delimiter='\t')
+
+    def make_dir(self, path):
+        directory = self.root + '/' + path
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    @staticmethod
+    def write(fname, value):
+        with open(fname, 'w') as f:
+            f.write(str(value))
+
+    @staticmethod
+    def read_int(fname):
+        # sysfs stores take the leading integer, anything after a newline is left over from a longer previous write
+        with open(fname, 'rb') as f:
+            return int(f.read().split(b'\n')[0].split(b'\0')[0])
+
+    def close(self):
+        if self.tmpdir is not None:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+            self.tmpdir = None
+
+    # scan layout produced by the scan_elements above, with all channels and the timestamp enabled
+    scan_dtype = np.dtype({'names': ['in_voltage0', 'in_voltage1', 'in_voltage2', 'in_voltage3', 'in_timestamp'],
+                           'formats': ['>u2', '>u2', '>u2', '>u2', '<i8'], 'offsets': [0, 2, 4, 6, 8], 'itemsize': 16})
+
+class PGPIO_Emu:
+    """
+    Python implementation of the PGPIO library, backed by a `Daffodil_Sim` shadow board.
+
+    The integer variables mirror pgpio-lib.c. Register writes are kept in a plain list of 32-bit words.
+    """
+    col_en_base = 46
+    col_en_cnt = 25
+    row_en_base = 71
+    row_en_cnt = 25
+    dac_ldac_n_pin_base = 15
+    ca_base = 37
+    ra_base = 35
+    compliance_control_lo_pin = 31
+    array_control_lsb_lo_pin = 30
+    array_control_msb_lo_pin = 29
+    ext_mode_G_pin = 28
+    write_mode_G_pin = 27
+    EN_IO_G_pin = 26
+    ext_mode_R_pin = 25
+    write_mode_R_pin = 24
+    EN_IO_R_pin = 23
+    ext_mode_C_pin = 22
+    write_mode_C_pin = 21
+    EN_IO_C_pin = 20
+    power_en_pin = 0
+    power_en_pin_1 = 1
+    power_en_pin_2 = 2
+
+    gpio_data_offset = 0x1000
+    gpio_direction_offset = 0x2000
+    gpio_pulse_mode_offset = 0x3000
+    gpio_polarity_offset = 0x4000
+    gpio_hw_ctl_offset = 0x5000
+    gpio_input_offset = 0x6000
+
+    event_addr = 0x0
+    pulse_length_addr = 0x4
+    pulse_count_addr = 0x8
+    ABI_magic_number_addr = 0x40
+    ABI_magic_number = 0x12340001
+
+    def __init__(self, sysfs, name='Generic', dpot_r=None, adc_noise=0, seed=None):
+        """
+        Parameters
+        ----------
+        sysfs : Sysfs_Emu
+            The sysfs tree the shadow board reads its DAC/DPOT state from and writes its ADC codes to.
+        name : str
+            Device model of the shadow `Daffodil_Sim`.
+        dpot_r : float, optional
+            Resistance used by the device model in compliance mode. If None, the mean resistance of the DPOT settings is used at every event.
+        adc_noise : float
+            Standard deviation of gaussian noise added to every ADC code, in LSB.
+        seed : int, optional
+            Seed for the ADC noise.
+        """
+        self.sysfs = sysfs
+        self.sim = Daffodil_Sim(name)
+        self.dpot_r = dpot_r
+        self.adc_noise = adc_noise
+        self.rng = np.random.default_rng(seed)
+
+        self.regs = [0] * (0x10000 // 4)
+        self.regs[self.ABI_magic_number_addr // 4] = self.ABI_magic_number
+        self.files = []
+        self.events = 0
+        self.triggers = 0
+
+        self.mux_pins = {
+            "write_mode_R": self.write_mode_R_pin,
+            "ext_mode_R": self.ext_mode_R_pin,
+            "EN_IO_R": self.EN_IO_R_pin,
+            "write_mode_C": self.write_mode_C_pin,
+            "ext_mode_C": self.ext_mode_C_pin,
+            "EN_IO_C": self.EN_IO_C_pin,
+            "write_mode_G": self.write_mode_G_pin,
+            "ext_mode_G": self.ext_mode_G_pin,
+            "EN_IO_G": self.EN_IO_G_pin,
+        }
+
+    # Memory mapped registers
+    def open_mem(self):
+        return 0
+
+    def close_mem(self):
+        # the emulated hardware goes away with the register mapping, which removes a temporary sysfs tree
+        for fd in self.files:
+            os.close(fd)
+        self.files = []
+        self.sysfs.close()
+
+    def init(self):
+        for pin in [self.power_en_pin, self.power_en_pin_1, self.power_en_pin_2]:
+            self.write_bit(self.gpio_data_offset, pin, 1)
+        for i in range(5):
+            self.write_bit(self.gpio_data_offset, self.dac_ldac_n_pin_base + i, 1)
+        self.raw_write(self.pulse_length_addr, 5)
+        return 0
+
+    def raw_write(self, addr, data):
+        self.regs[addr // 4] = data & 0xffffffff
+        if addr == self.event_addr and data:
+            self.event()
+
+    def read_addr(self, addr):
+        return self.regs[addr // 4]
+
+    def masked_write(self, addr, write_mask, data):
+        self.raw_write(addr, (self.regs[addr // 4] & ~write_mask) | (data & write_mask))
+
+    def write_bit(self, addr, bit, value):
+        self.masked_write(addr + (bit // 32) * 4, 1 << (bit % 32), value << (bit % 32))
+
+    def write_bit_range(self, addr, low_bit, high_bit, value):
+        for bit in range(low_bit, high_bit):
+            self.write_bit(addr, bit, value)
+
+    def read_bit(self, addr, bit):
+        return (self.regs[addr // 4 + bit // 32] >> (bit % 32)) & 1
+
+    # File access helpers, see read_int/write_int and the static file functions of pgpio-lib.c
+    @staticmethod
+    def path(fname):
+        if isinstance(fname, ctypes.c_char_p):
+            fname = fname.value
+        if isinstance(fname, bytes):
+            fname = fname.decode('utf-8')
+        return fname
+
+    def read_int(self, fname):
+        return self.sysfs.read_int(self.path(fname))
+
+    def write_int(self, fname, value):
+        self.sysfs.write(self.path(fname), value)
+        if self.path(fname) == self.sysfs.trigger_now:
+            self.trigger()
+
+    def open_write_file(self, fname):
+        self.files.append(os.open(self.path(fname), os.O_WRONLY))
+        return len(self.files) - 1
+
+    def open_read_file(self, fname):
+        self.files.append(os.open(self.path(fname), os.O_RDONLY))
+        return len(self.files) - 1
+
+    def read_static_file(self, fnum):
+        return int(os.pread(self.files[fnum], 8, 0).split(b'\n')[0].split(b'\0')[0])
+
+    def write_static_file(self, fnum, value):
+        data = str(value).encode('utf-8')
+        os.pwrite(self.files[fnum], data, 0)
+        os.ftruncate(self.files[fnum], len(data)) # regular files keep stale bytes, sysfs attributes do not
+
+    # Emulated event
+    def kernel(self):
+        data = self.gpio_data_offset
+        bits = [self.read_bit(data, self.ra_base), self.read_bit(data, self.ra_base + 1), self.read_bit(data, self.ca_base + 1),
+                self.read_bit(data, self.array_control_lsb_lo_pin), self.read_bit(data, self.array_control_msb_lo_pin)]
+        return sum(b << i for i, b in enumerate(bits))
+
+    def event(self):
+        """Mirror the board state into the shadow `Daffodil_Sim`, assert an event on it and write the ADC codes to sysfs."""
+        sim = self.sim
+        sysfs = self.sysfs
+        data = self.gpio_data_offset
+
+        for d, dac in enumerate(sim.dacs):
+            for ch in dac.all_channels:
+                prefix = sysfs.dac_dirs[d] + '/out_voltage{}'.format(ch.i)
+                ch.x1 = sysfs.read_int(prefix + '_raw')
+                ch.m = sysfs.read_int(prefix + '_calibscale')
+                ch.c = sysfs.read_int(prefix + '_calibbias')
+                ch.update_vout()
+        sim.set_dpot_D([[sysfs.read_int(d + '/rdac{}'.format(i)) for i in range(4)] for d in sysfs.dpot_dirs])
+        sim.sim_device.dpot_r = self.dpot_r if self.dpot_r is not None else -np.mean(sim.pots) # pots are stored as negative resistances
+
+        for name, pin in self.mux_pins.items():
+            setattr(sim, name, self.read_bit(data, pin))
+        sim.set_compliance_control(self.read_bit(data, self.compliance_control_lo_pin))
+        sim.COL_EN_tobe = [self.read_bit(data, self.col_en_base + i) for i in range(sim.xdim)]
+        sim.ROW_EN_tobe = [self.read_bit(data, self.row_en_base + i) for i in range(sim.ydim)]
+        sim.set_kernel(self.kernel())
+
+        sim.event()
+        self.events += 1
+
+        for k, adc in enumerate(sim.adcs):
+            for i in range(4):
+                code = adc.registers[i]
+                if self.adc_noise:
+                    code = int(round(code + self.rng.normal(0, self.adc_noise)))
+                sysfs.write(sysfs.adc_dirs[k] + '/in_voltage{}_raw'.format(i), min(max(code, 0), 4095))
+
+    def trigger(self):
+        """Fire the sysfs trigger: every ADC with an enabled buffer attached to it captures one scan of the codes of the last event, with its own noise."""
+        sysfs = self.sysfs
+        self.triggers += 1
+        for k, adc in enumerate(self.sim.adcs):
+            d = sysfs.adc_dirs[k]
+            if not sysfs.read_int(d + '/buffer/enable'):
+                continue
+            with open(d + '/trigger/current_trigger') as f:
+                if f.read().strip() != sysfs.trigger_name:
+                    continue
+            codes = np.array(adc.registers, dtype=float) + self.rng.normal(0, self.adc_noise, 4) * bool(self.adc_noise)
+            scan = np.zeros(1, dtype=sysfs.scan_dtype)
+            for i in range(4):
+                scan['in_voltage{}'.format(i)] = np.clip(np.rint(codes[i]), 0, 4095)
+            scan['in_timestamp'] = time.time_ns()
+            with open(sysfs.adc_devs[k], 'ab') as f:
+                f.write(scan.tobytes())
+
+def make_phys_board(name='Generic', root=None, dpot_r=None, adc_noise=0, seed=None):
+    """Build a `Daffodil_Phys` bound to an emulated PGPIO and sysfs tree.
+
+    Parameters
+    ----------
+    name : str
+        Device model simulated behind the emulated hardware.
+    root : str, optional
+        Directory for the sysfs tree. A temporary directory is created if None.
+    dpot_r : float, optional
+        See `PGPIO_Emu`.
+    adc_noise : float
+        Standard deviation of the ADC noise, in LSB.
+    seed : int, optional
+        Seed for the ADC noise.
+
+    Returns
+    -------
+    board : Board.controller.Daffodil_Phys
+        Physical board object. The emulator is reachable through `board.PGPIO`, and the sysfs tree through `board.PGPIO.sysfs`.
+    """
+    sysfs = Sysfs_Emu(root)
+    pgpio = PGPIO_Emu(sysfs, name, dpot_r, adc_noise, seed)
+
+    # the parts resolve their sysfs directories when they are constructed
+    sysfs_root, dev_root = utils.sysfs_root, utils.dev_root
+    utils.sysfs_root, utils.dev_root = sysfs.root, sysfs.dev_dir
+    try:
+        board = Daffodil_Phys(PGPIO=pgpio, dpot_calib_file=sysfs.calib_file)
+    finally:
+        utils.sysfs_root, utils.dev_root = sysfs_root, dev_root
+    return board
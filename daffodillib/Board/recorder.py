@@ -0,0 +1,369 @@
+"""
+Recording and replay of the low-level operation stream of a Daffodil board.
+
+`Recorder` instruments a board (simulated or physical) and logs every DAC write, configuration change, kernel select, event (with its enable
+masks) and ADC read issued by any routine, e.g. `outer_product` or `set_target`, together with the time spent in it. Calls made by a recorded
+operation itself (e.g. the `event` inside the simulated `event_timevariant`) are not logged separately.
+
+    with Recorder(board) as recording:
+        outerproduct.outer_product(board, vset, vreset, vgate, rows, cols)
+    recording.save('outer_product.dlog')
+
+`replay` executes a recording on a board as a flat list of calls, without the decision logic of the routine that produced it. With `check=True`
+the ADC codes read during the replay are compared to the recorded ones, which makes a replay on `Daffodil_Sim` a bit-exact regression test.
+`Recording.profile` breaks the recorded time down by operation.
+
+The log is a sequence of records: an opcode (uint8), the payload length (uint16) and the duration in seconds (float32), followed by the payload.
+DAC codes are stored as uint16, enable masks as packed bits.
+"""
+
+import numpy as np
+import struct
+import time
+
+record_header = struct.Struct('<BHf')
+magic = b'DFLOG1'
+
+# opcode, method and payload layout of the recorded operations. 'codes' is a uint16 vector, 'masks' the packed column and row enables
+operations = [
+    (1, 'setcoldacs', 'codes'),
+    (2, 'setrowdacs', 'codes'),
+    (3, 'setgatedacs', 'codes'),
+    (4, 'setcoldac_channel', '<HB'),
+    (5, 'setrowdac_channel', '<HB'),
+    (6, 'setgatedac_channel', '<HB'),
+    (7, 'setrefopamp', '<H'),
+    (8, 'set_kernel', '<BB'),
+    (9, 'config_forward_pass', ''),
+    (10, 'config_backward_pass', ''),
+    (11, 'config_outerproduct', ''),
+    (12, 'set_compliance_control', '<B'),
+    (13, 'set_dac_gain_mode', '<H'),
+    (14, 'set_dac_offset', '<H'),
+    (15, 'set_dpot_D', 'dpots'),
+    (16, 'event', 'masks'),
+    (17, 'event_timevariant', 'timed'),
+    (18, 'read_adcs', ''),
+    (19, 'retrievecurrents', 'codes'),
+    (20, 'retrievecurrent_channel', '<BH'),
+]
+opcodes = {name: (opcode, layout) for opcode, name, layout in operations}
+names = {opcode: (name, layout) for opcode, name, layout in operations}
+
+class Recording:
+    """
+    A recorded operation stream, see the module description.
+    """
+    def __init__(self, data=b''):
+        if data and not data.startswith(magic):
+            raise ValueError("Not a board operation log")
+        self.data = bytearray(data[len(magic):])
+
+    def append(self, opcode, payload, duration):
+        self.data += record_header.pack(opcode, len(payload), duration)
+        self.data += payload
+
+    def records(self):
+        """Iterate over the (opcode, duration, payload) of every record. Raises ValueError on a truncated log or an unknown opcode."""
+        offset = 0
+        while offset < len(self.data):
+            if offset + record_header.size > len(self.data):
+                raise ValueError(f"Truncated operation log: incomplete record header at byte {offset}")
+            opcode, length, duration = record_header.unpack_from(self.data, offset)
+            if opcode not in names:
+                raise ValueError(f"Unknown opcode {opcode} at byte {offset} of the operation log")
+            offset += record_header.size
+            if offset + length > len(self.data):
+                raise ValueError(f"Truncated operation log: the {names[opcode][0]} record at byte {offset - record_header.size} is missing {offset + length - len(self.data)} payload bytes")
+            yield opcode, duration, bytes(self.data[offset:offset+length])
+            offset += length
+
+    def __len__(self):
+        return sum(1 for record in self.records())
+
+    def save(self, fname):
+        with open(fname, 'wb') as f:
+            f.write(magic + self.data)
+
+    @classmethod
+    def load(cls, fname):
+        with open(fname, 'rb') as f:
+            return cls(f.read())
+
+    def profile(self):
+        """Number of calls and total recorded time in seconds of every operation."""
+        profile = {}
+        for opcode, duration, payload in self.records():
+            count, total = profile.get(names[opcode][0], (0, 0.0))
+            profile[names[opcode][0]] = (count + 1, total + duration)
+        return profile
+
+def pack(layout, board, args, kwargs, result):
+    #payload of an operation called with args/kwargs that returned result
+    if layout == 'codes':
+        return np.asarray(result if args == () else args[0], dtype='<u2').tobytes()
+    if layout == 'dpots':
+        return np.broadcast_to(np.asarray(args[0], dtype=np.uint8), (7, 4)).tobytes()
+    if layout == 'masks':
+        return pack_masks(board)
+    if layout == 'timed':
+        write = kwargs.get('write', args[1] if len(args) > 1 else None)
+        return struct.pack('<QB', args[0], 2 if write is None else int(write)) + pack_masks(board)
+    if layout == '<BB': # set_kernel
+        return struct.pack(layout, args[0], int(kwargs.get('swfix_en', args[1] if len(args) > 1 else False)))
+    if layout == '<BH': # retrievecurrent_channel
+        return struct.pack(layout, args[0], result)
+    if layout == '<HB': # channel setters
+        return struct.pack(layout, args[0], args[1])
+    return struct.pack(layout, *args)
+
+def pack_masks(board):
+    return np.packbits(np.asarray(board.COL_EN_tobe, dtype=np.uint8)).tobytes() + np.packbits(np.asarray(board.ROW_EN_tobe, dtype=np.uint8)).tobytes()
+
+class Recorder:
+    """
+    Records the operations of a board while active. The board methods are wrapped on the board object itself, so routines need no changes.
+    """
+    def __init__(self, board, recording=None):
+        self.board = board
+        self.recording = Recording() if recording is None else recording
+        self.depth = 0 # nesting of recorded calls, only the outermost one is logged
+
+    def wrap(self, name, opcode, layout):
+        method = getattr(self.board, name)
+        def recorded(*args, **kwargs):
+            self.depth += 1
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                self.depth -= 1
+            if self.depth == 0:
+                self.recording.append(opcode, pack(layout, self.board, args, kwargs, result), time.perf_counter() - start)
+            return result
+        return recorded
+
+    def start(self):
+        for opcode, name, layout in operations:
+            if hasattr(self.board, name):
+                setattr(self.board, name, self.wrap(name, opcode, layout))
+        return self.recording
+
+    def stop(self):
+        for opcode, name, layout in operations:
+            if name in self.board.__dict__:
+                del self.board.__dict__[name]
+        return self.recording
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def compile_recording(board, recording):
+    #turns a recording into a list of (opcode, function, args, recorded result) calls on board
+    calls = []
+    for opcode, duration, payload in recording.records():
+        name, layout = names[opcode]
+        method = getattr(board, name)
+        expected = None
+        if layout == 'codes':
+            codes = np.frombuffer(payload, dtype='<u2').tolist()
+            if name == 'retrievecurrents':
+                args, expected = (), codes
+            else:
+                args = (codes,)
+        elif layout == 'dpots':
+            args = (np.frombuffer(payload, dtype=np.uint8).reshape(7, 4).astype(int),)
+        elif layout == 'masks':
+            method, args = set_enables_and_call(board, method), (payload,)
+        elif layout == 'timed':
+            pulse_len, write = struct.unpack_from('<QB', payload)
+            call = method if write == 2 else lambda pulse_len, event_timevariant=method, write=bool(write): event_timevariant(pulse_len, write=write)
+            method, args = set_enables_and_call(board, call), (payload[9:], pulse_len)
+        elif layout == '<BB':
+            kernel, swfix_en = struct.unpack(layout, payload)
+            args = (kernel, bool(swfix_en)) if swfix_en else (kernel,)
+        elif layout == '<BH':
+            channel, expected = struct.unpack(layout, payload)
+            args = (channel,)
+        else:
+            args = struct.unpack(layout, payload)
+        calls.append((opcode, method, args, expected))
+    return calls
+
+def set_enables_and_call(board, method):
+    #an event preceded by loading the recorded enable masks
+    def call(masks, *args):
+        col_bytes = (board.xdim + 7) // 8
+        board.COL_EN_tobe = np.unpackbits(np.frombuffer(masks[:col_bytes], dtype=np.uint8))[:board.xdim].tolist()
+        board.ROW_EN_tobe = np.unpackbits(np.frombuffer(masks[col_bytes:], dtype=np.uint8))[:board.ydim].tolist()
+        return method(*args)
+    return call
+
+def replay(board, recording, check=False):
+    """Execute a recording on `board`.
+
+    Parameters
+    ----------
+    board : Board.controller.Daffodil_Base
+        The board to replay on.
+    recording : Recording
+        The recorded operations.
+    check : bool
+        If True, the ADC codes read during the replay are compared to the recorded ones.
+
+    Returns
+    -------
+    mismatches : list[tuple]
+        For every ADC read that differs from the recording, (record index, recorded codes, replayed codes). Empty if `check` is False.
+    """
+    calls = compile_recording(board, recording)
+    mismatches = []
+    if not check:
+        for opcode, method, args, expected in calls:
+            method(*args)
+        return mismatches
+    for k, (opcode, method, args, expected) in enumerate(calls):
+        result = method(*args)
+        if expected is not None and result != expected:
+            mismatches.append((k, expected, result))
+    return mismatches
+
+# DAC writes of the optimizer, by line
+dac_writes = {'setcoldacs': 'col', 'setrowdacs': 'row', 'setgatedacs': 'gate'}
+dac_channel_writes = {'setcoldac_channel': 'col', 'setrowdac_channel': 'row', 'setgatedac_channel': 'gate'}
+# operations after which the DAC outputs matter (events and ADC reads), or that change how DAC codes are checked
+dac_barriers = {'event', 'event_timevariant', 'read_adcs', 'retrievecurrents', 'retrievecurrent_channel', 'config_forward_pass', 'config_backward_pass',
+                'config_outerproduct', 'setrefopamp', 'set_dac_gain_mode', 'set_dac_offset'}
+# operations that only set a board setting, and are redundant if it already holds the value
+settings = {'setrefopamp', 'set_kernel', 'set_compliance_control', 'set_dac_gain_mode', 'set_dac_offset', 'set_dpot_D'}
+modes = {'config_forward_pass', 'config_backward_pass', 'config_outerproduct'}
+
+def optimize(recording, channel_limit=1):
+    """Remove the redundant operations of a recording. Replaying the result leaves the board in the same state and reads the same ADC codes.
+
+    Two passes are made over the operations:
+
+        1. DAC writes whose channels are all written again before the next event, ADC read or configuration change are dropped, so that only
+           the last update of every channel reaches the DACs before an event.
+        2. DAC writes and settings that do not change the board state are dropped. A bulk DAC write that changes at most `channel_limit`
+           channels (and fewer than it writes) becomes single-channel writes. Conversely, consecutive single-channel writes to one line that
+           change more than `channel_limit` channels are merged into one bulk write, if the codes of all the other channels of the line are
+           known. After a DAC gain or offset change, the DAC codes and the reference are written again.
+
+    Together, the passes hoist the setup that routines repeat in every iteration of their loops (kernel selects, configuration, reference and
+    bias vectors) out of the loops: the first setup is kept, the repeats do not change the state, and a bias that an iteration restores after
+    its event (e.g. to an idle voltage) is overwritten by the setup of the next iteration before it is used. The first write of every DAC channel
+    and setting is always kept, since the state of the board before the recording is not known. Rewritten DAC records have no recorded duration.
+
+    Parameters
+    ----------
+    recording : Recording
+        The recording to optimize.
+    channel_limit : int
+        Largest number of changed channels for which a bulk DAC write is rewritten as single-channel writes.
+
+    Returns
+    -------
+    optimized : Recording
+        The optimized recording.
+    report : dict
+        'before' and 'after', the total numbers of operations, and 'operations', the (before, after) counts of every operation.
+    """
+    records = list(recording.records())
+
+    # pass 1, backwards: channels written later in the current window, i.e. before the next barrier
+    keep = [True]*len(records)
+    covered = {'col': set(), 'row': set(), 'gate': set()}
+    for k in reversed(range(len(records))):
+        opcode, duration, payload = records[k]
+        name = names[opcode][0]
+        if name in dac_barriers:
+            covered = {'col': set(), 'row': set(), 'gate': set()}
+        if name in dac_writes:
+            channels = set(range(len(payload) // 2))
+            line = dac_writes[name]
+        elif name in dac_channel_writes:
+            channels = {struct.unpack('<HB', payload)[1]}
+            line = dac_channel_writes[name]
+        else:
+            continue
+        if channels <= covered[line]:
+            keep[k] = False
+        covered[line] |= channels
+
+    # pass 2, forwards: the known DAC codes and settings of the board
+    optimized = Recording()
+    codes = {'col': {}, 'row': {}, 'gate': {}}
+    widths = {} # number of channels of the bulk writes of every line
+    state = {}
+    run = [] # consecutive single-channel writes to one line, (opcode, payload, duration, channel)
+
+    def end_run():
+        #writes the run, merged into one bulk write if it changes more than channel_limit channels and all codes of the line are known
+        if not run:
+            return
+        name = names[run[0][0]][0]
+        line, width = dac_channel_writes[name], widths.get(dac_channel_writes[name], 0)
+        channels = {channel for opcode, payload, duration, channel in run}
+        if len(channels) > channel_limit and len(run) > 1 and channels <= set(range(width)) and all(i in codes[line] for i in range(width)):
+            optimized.append(opcodes[name.replace('dac_channel', 'dacs')][0], np.array([codes[line][i] for i in range(width)], dtype='<u2').tobytes(), 0.0)
+        else:
+            for opcode, payload, duration, channel in run:
+                optimized.append(opcode, payload, duration)
+        run.clear()
+
+    def channel_write(opcode, payload, duration):
+        code, i = struct.unpack('<HB', payload)
+        line = dac_channel_writes[names[opcode][0]]
+        if codes[line].get(i) == code:
+            return
+        if run and run[0][0] != opcode:
+            end_run()
+        codes[line][i] = code
+        run.append((opcode, payload, duration, i))
+
+    for k, (opcode, duration, payload) in enumerate(records):
+        if not keep[k]:
+            continue
+        name = names[opcode][0]
+        if name in dac_channel_writes:
+            channel_write(opcode, payload, duration)
+            continue
+        if name in dac_writes:
+            line = dac_writes[name]
+            new = np.frombuffer(payload, dtype='<u2').tolist()
+            widths[line] = max(widths.get(line, 0), len(new))
+            changed = [i for i, code in enumerate(new) if codes[line].get(i) != code]
+            if not changed:
+                continue
+            if len(changed) <= channel_limit and len(changed) < len(new):
+                channel_opcode = opcodes[name.replace('dacs', 'dac_channel')][0]
+                for i in changed:
+                    channel_write(channel_opcode, struct.pack('<HB', new[i], i), 0.0)
+                continue
+            end_run()
+            optimized.append(opcode, payload, duration)
+            codes[line].update(enumerate(new))
+            continue
+        if name in modes:
+            if state.get('mode') == name:
+                continue
+            state['mode'] = name
+        elif name in settings:
+            if state.get(name) == payload:
+                continue
+            state[name] = payload
+        end_run()
+        if name in ('set_dac_gain_mode', 'set_dac_offset'): # the DACs, including the reference, are rewritten with the new calibration
+            codes = {'col': {}, 'row': {}, 'gate': {}}
+            state.pop('setrefopamp', None)
+        optimized.append(opcode, payload, duration)
+    end_run()
+
+    count = lambda rec: [names[opcode][0] for opcode, duration, payload in rec.records()]
+    before, after = count(recording), count(optimized)
+    report = {'before': len(before), 'after': len(after), 'operations': {name: (before.count(name), after.count(name)) for name in dict.fromkeys(before + after)}}
+    return optimized, report
@@ -0,0 +1,374 @@
+"""
+Board server and client for the Daffodil board.
+
+`Daffodil_Phys` drives the hardware through /dev/mem and sysfs, so it has to run on the board's own controller. `Board_Server` owns one board
+(physical or simulated) in its own process and executes batches of board operations received over a Unix or TCP socket. `Daffodil_Client`
+implements the `Daffodil_Base` API on the other side of the socket.
+
+The client keeps a local copy of the DAC, DPOT and enable registers, so that the voltage/code conversions and the bias checks run without a round
+trip, and it queues the operations that do not return anything (DAC writes, configuration, kernel select, events). The queue is sent as one
+request when a result is needed (currents, ADC samples, the transimpedances), so e.g. a column read of `read_kernel` is a single round trip.
+Errors of queued operations are therefore raised by the call that sends them.
+
+Messages are a 4-byte big-endian header length, a JSON header and the raw bytes of the NumPy arrays referenced by the header. Lists of numbers,
+such as DAC code vectors, travel as arrays as well.
+
+A server is started with
+
+    python -m daffodillib.Board.server /tmp/daffodil.sock --serial 1304917 # the physical board
+    python -m daffodillib.Board.server localhost:5025 --sim Generic # a simulated board
+
+and used with `board = Daffodil_Client('/tmp/daffodil.sock')` or `Daffodil_Client(('localhost', 5025))`. The server runs any public board method
+it is asked to, so it should only listen on a Unix socket or on a trusted interface.
+"""
+
+from .controller import Daffodil_Base, Daffodil_Sim, Daffodil_Phys
+from .Components.AD5391BSTZ5 import AD5391BSTZ5_Sim as DAC_sim
+from .Components.ADS7950SBDBT import ADS7950SBDBT_Sim as ADC_sim
+from .Components.AD8403 import AD8403_Sim as DPOT_sim
+
+import numpy as np
+import argparse
+import json
+import os
+import socket
+import struct
+import threading
+
+def encode(obj, buffers):
+    #replaces the arrays (and lists of numbers) in obj by references to buffers, the rest is sent as JSON
+    if isinstance(obj, np.ndarray):
+        buffers.append(np.ascontiguousarray(obj))
+        return {'__array__': len(buffers) - 1, 'dtype': obj.dtype.str, 'shape': list(obj.shape)}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, list) and len(obj) > 1 and len({type(x) for x in obj}) == 1 and type(obj[0]) in (int, float):
+        ref = encode(np.array(obj), buffers)
+        ref['list'] = True
+        return ref
+    if isinstance(obj, tuple):
+        return {'__tuple__': [encode(x, buffers) for x in obj]}
+    if isinstance(obj, list):
+        return [encode(x, buffers) for x in obj]
+    if isinstance(obj, dict):
+        return {key: encode(value, buffers) for key, value in obj.items()}
+    return obj
+
+def decode(obj, buffers):
+    #inverse of encode
+    if isinstance(obj, dict):
+        if '__array__' in obj:
+            array = buffers[obj['__array__']]
+            return array.tolist() if obj.get('list') else array
+        if '__tuple__' in obj:
+            return tuple(decode(x, buffers) for x in obj['__tuple__'])
+        return {key: decode(value, buffers) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [decode(x, buffers) for x in obj]
+    return obj
+
+def recv_exactly(sock, n):
+    data = bytearray(n)
+    view = memoryview(data)
+    while n > 0:
+        k = sock.recv_into(view, n)
+        if k == 0:
+            raise ConnectionError("Connection closed")
+        view = view[k:]
+        n -= k
+    return data
+
+def send_message(sock, body):
+    buffers = []
+    header = json.dumps({'body': encode(body, buffers), 'buffers': [[b.dtype.str, b.shape, b.nbytes] for b in buffers]}).encode()
+    sock.sendall(b''.join([struct.pack('!I', len(header)), header] + [b.tobytes() for b in buffers]))
+
+def recv_message(sock):
+    header = json.loads(recv_exactly(sock, struct.unpack('!I', recv_exactly(sock, 4))[0]))
+    payload = recv_exactly(sock, sum(nbytes for dtype, shape, nbytes in header['buffers']))
+    buffers, offset = [], 0
+    for dtype, shape, nbytes in header['buffers']:
+        buffers.append(np.frombuffer(payload, dtype=dtype, count=nbytes // np.dtype(dtype).itemsize, offset=offset).reshape(shape))
+        offset += nbytes
+    return decode(header['body'], buffers)
+
+def make_socket(address):
+    #a path is a Unix socket, a (host, port) tuple a TCP socket
+    if isinstance(address, str):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # the requests are small and latency bound
+    return sock
+
+class Board_Server:
+    """
+    Serves one board to one client at a time.
+
+    A request is a list of operations {'name', 'args', 'kwargs'}, executed in order. An operation with 'getattr' set returns the attribute `name`
+    instead of calling it, and one with 'enables' sets COL_EN_tobe and ROW_EN_tobe first. The reply holds the result of every executed operation,
+    and the type and message of the error if one was raised, in which case the remaining operations are skipped. A request that is not a list of
+    operations, or an operation without a name, is answered with a ValueError.
+    """
+    def __init__(self, board, address):
+        self.board = board
+        self.address = address # a TCP port 0 is replaced by the port the server is bound to
+        self.running = False
+        self.listening = threading.Event() # set once clients can connect
+        self.requests = 0 # number of requests served
+        self.operations = 0 # number of operations executed
+
+    def execute(self, op):
+        if not isinstance(op, dict) or not isinstance(op.get('name'), str):
+            raise ValueError(f"Malformed operation {op!r}")
+        name = op['name']
+        if name.startswith('_'):
+            raise ValueError(f"{name} is not a public board attribute")
+        if op.get('getattr'):
+            return getattr(self.board, name)
+        if 'enables' in op:
+            self.board.COL_EN_tobe = list(op['enables'][0])
+            self.board.ROW_EN_tobe = list(op['enables'][1])
+        return getattr(self.board, name)(*op.get('args', []), **op.get('kwargs', {}))
+
+    def handle(self, conn):
+        #serves the requests of one connection until it is closed, or a shutdown is requested
+        while self.running:
+            try:
+                ops = recv_message(conn)
+            except ConnectionError:
+                return
+            results, error = [], None
+            if not isinstance(ops, list):
+                error = {'type': 'ValueError', 'message': f"Malformed request {ops!r}, expected a list of operations", 'op': 0}
+                ops = []
+            for op in ops:
+                if isinstance(op, dict) and op.get('name') == 'shutdown':
+                    self.running = False
+                    break
+                try:
+                    results.append(self.execute(op))
+                except Exception as e:
+                    error = {'type': type(e).__name__, 'message': str(e), 'op': len(results)}
+                    break
+            self.requests += 1
+            self.operations += len(results)
+            send_message(conn, {'results': results, 'error': error})
+
+    def serve_forever(self):
+        """Accept clients until a client sends a shutdown request."""
+        sock = make_socket(self.address)
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address) # stale socket of a previous server
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(self.address)
+        if not isinstance(self.address, str):
+            self.address = sock.getsockname()
+        sock.listen(1)
+        self.running = True
+        self.listening.set()
+        try:
+            while self.running:
+                conn, _ = sock.accept()
+                with conn:
+                    self.handle(conn)
+        finally:
+            self.listening.clear()
+            sock.close()
+            if isinstance(self.address, str):
+                os.unlink(self.address)
+
+class Daffodil_Client(Daffodil_Base):
+    """
+    A board served by `Board_Server`, with the `Daffodil_Base` API. See the module description for the batching of the calls.
+    """
+    def __init__(self, address, max_queue=256):
+        """
+        Parameters
+        ----------
+        address : str or tuple
+            Path of the Unix socket, or (host, port) of the TCP socket of the server.
+        max_queue : int
+            Number of queued operations after which the queue is sent without waiting for a result.
+        """
+        super().__init__(ADC_sim, DAC_sim, DPOT_sim) # local copy of the registers, for the conversions and checks
+        self.queue = []
+        self.max_queue = max_queue
+        self.requests = 0 # number of round trips to the server
+        self.sock = make_socket(address)
+        self.sock.connect(address)
+
+    def defer(self, name, *args, enables=False, **kwargs):
+        #queues an operation of the server board
+        op = {'name': name, 'args': list(args), 'kwargs': kwargs}
+        if enables:
+            op['enables'] = [np.array(self.COL_EN_tobe, dtype=np.uint8), np.array(self.ROW_EN_tobe, dtype=np.uint8)]
+        self.queue.append(op)
+        if len(self.queue) >= self.max_queue:
+            self.flush()
+
+    def flush(self):
+        """Send the queued operations, returns the result of the last one."""
+        if not self.queue:
+            return None
+        ops, self.queue = self.queue, []
+        send_message(self.sock, ops)
+        reply = recv_message(self.sock)
+        self.requests += 1
+        if reply['error'] is not None:
+            error = reply['error']
+            message = f"{error['message']} (server operation {ops[error['op']]['name']})"
+            raise ValueError(message) if error['type'] == 'ValueError' else Exception(f"{error['type']}: {message}")
+        return reply['results'][-1]
+
+    def call(self, name, *args, enables=False, **kwargs):
+        #sends the queue followed by the operation and returns its result
+        self.defer(name, *args, enables=enables, **kwargs)
+        return self.flush()
+
+    def remote_getattr(self, name):
+        """Read attribute `name` of the server board, e.g. a flag that only the server board has."""
+        self.queue.append({'name': name, 'getattr': True})
+        return self.flush()
+
+    def close(self):
+        """Send the queued operations and disconnect."""
+        self.flush()
+        self.sock.close()
+
+    def shutdown(self):
+        """Send the queued operations and stop the server."""
+        self.flush()
+        send_message(self.sock, [{'name': 'shutdown'}])
+        recv_message(self.sock)
+        self.sock.close()
+
+    def load_dacs(self, value):
+        # nothing to do locally, the server board loads its DACs when the setters run there
+        return
+
+    # operations that change the board state are checked and applied locally, and queued for the server
+
+    def setcoldacs(self, colvoltages):
+        super().setcoldacs(colvoltages)
+        self.defer('setcoldacs', colvoltages)
+
+    def setcoldac_channel(self, colvoltage, i):
+        super().setcoldac_channel(colvoltage, i)
+        self.defer('setcoldac_channel', colvoltage, i)
+
+    def setrowdacs(self, rowvoltages):
+        super().setrowdacs(rowvoltages)
+        self.defer('setrowdacs', rowvoltages)
+
+    def setrowdac_channel(self, rowvoltage, i):
+        super().setrowdac_channel(rowvoltage, i)
+        self.defer('setrowdac_channel', rowvoltage, i)
+
+    def setgatedacs(self, gatevoltages):
+        super().setgatedacs(gatevoltages)
+        self.defer('setgatedacs', gatevoltages)
+
+    def setgatedac_channel(self, gatevoltage, i):
+        super().setgatedac_channel(gatevoltage, i)
+        self.defer('setgatedac_channel', gatevoltage, i)
+
+    def setrefopamp(self, refbias):
+        super().setrefopamp(refbias)
+        self.defer('setrefopamp', refbias)
+
+    def set_dac_gain_mode(self, mode):
+        super().set_dac_gain_mode(mode)
+        self.defer('set_dac_gain_mode', mode)
+
+    def set_dac_offset(self, offset):
+        super().set_dac_offset(offset)
+        self.defer('set_dac_offset', offset)
+
+    def load_dac_calibration(self, fname):
+        super().load_dac_calibration(fname)
+        self.defer('load_dac_calibration', fname)
+
+    def set_dpot_D(self, D):
+        super().set_dpot_D(D)
+        self.defer('set_dpot_D', D)
+
+    def config_forward_pass(self):
+        super().config_forward_pass()
+        self.defer('config_forward_pass')
+
+    def config_backward_pass(self):
+        super().config_backward_pass()
+        self.defer('config_backward_pass')
+
+    def config_outerproduct(self):
+        super().config_outerproduct()
+        self.defer('config_outerproduct')
+
+    def set_kernel(self, kernel, swfix_en=False):
+        if kernel not in range(self.kernels):
+            raise ValueError()
+        self.selected_kernel = kernel
+        self.swfix_en = swfix_en # swaps gate channels 13 and 14, as on Daffodil_Phys
+        self.defer('set_kernel', kernel, swfix_en)
+
+    def set_compliance_control(self, bit):
+        if bit not in [0, 1]: raise ValueError("Setting compliance control incorrectly")
+        self.compliance_control = bit
+        self.defer('set_compliance_control', bit)
+
+    def event(self):
+        self.defer('event', enables=True)
+
+    def event_timevariant(self, pulse_len, *args, **kwargs):
+        self.defer('event_timevariant', pulse_len, *args, enables=True, **kwargs)
+
+    def read_adcs(self):
+        self.defer('read_adcs')
+
+    # operations with results are sent together with the queue
+
+    def event_oversampled(self, n_samples=1, min_stderr=None, mode='event', pulse_len=None):
+        return self.call('event_oversampled', n_samples, min_stderr, mode, pulse_len, enables=True)
+
+    def retrievecurrents(self):
+        return self.call('retrievecurrents')
+
+    def retrievecurrent_channel(self, channel_no):
+        return self.call('retrievecurrent_channel', channel_no)
+
+    def retrieve_adc_samples(self):
+        return self.call('retrieve_adc_samples')
+
+    @property
+    def pots(self):
+        # the transimpedances of the server board, which may use a DPOT calibration, fetched again whenever a DPOT code changed here
+        version = sum(dpot.version for dpot in self.dpots)
+        if self._pots is None or self._pots_version != version:
+            self._pots = np.asarray(self.remote_getattr('pots'), dtype=float)
+            self._pots_version = version
+        return self._pots
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a Daffodil board over a socket.")
+    parser.add_argument('address', help="path of a Unix socket, or host:port of a TCP socket")
+    parser.add_argument('--sim', metavar='DEVICE', help="serve a Daffodil_Sim with this device model instead of the physical board")
+    parser.add_argument('--dpot-r', type=float, help="DPOT resistance assumed by the simulated device model")
+    parser.add_argument('--serial', default=Daffodil_Phys.default_serial, help="serial of the physical board, selects its DPOT calibration (default: %(default)s)")
+    parser.add_argument('--dpot-calib', metavar='FILE', help="DPOT calibration file of the physical board, instead of the one of --serial")
+    args = parser.parse_args(argv)
+
+    address = args.address
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        address = (host, int(port))
+    if args.sim:
+        board = Daffodil_Sim(args.sim)
+    else:
+        board = Daffodil_Phys(serial=args.serial, dpot_calib_file=args.dpot_calib)
+    if args.sim and args.dpot_r is not None:
+        board.sim_device.dpot_r = args.dpot_r
+    with board:
+        Board_Server(board, address).serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -100,11 +100,11 @@ def IVsweep_parallel(board,kernel,x,vstart,vend,step_mult,vgate,vref,backwards=F
             #we set our bias and assert an event
             board.event()
             #we attach our voltage to the voltage list by converting the register value to a voltage
-            voltagelist.append(-board.dac_calcvout(rowbiases[x])+board.dac_calcvout(ref_code))
+            voltagelist.append(-board.dac_calcvout(rowbiases[x], line='row', i=x)+board.dac_calcvout(ref_code, line='ref'))
             #we readout the ADC value, convert it to a voltage, and finally a current using the potentiometer value
             for i in range(board.xdim): board.COL_EN_tobe[i]=1
             t.sleep(sleep_time)
-            currentlist.append(-(board.adc_predict_voltage(np.array(board.retrievecurrents()))-board.dac_calcvout(ref_code))/board.pots)
+            currentlist.append(-(board.adc_predict_voltage(np.array(board.retrievecurrents()))-board.dac_calcvout(ref_code, line='ref'))/board.pots)
             rowbiases[x]+=1*step_mult
             t.sleep(sleep_time)
         rowbiases[x]=dac_code_end
@@ -113,10 +113,10 @@ def IVsweep_parallel(board,kernel,x,vstart,vend,step_mult,vgate,vref,backwards=F
             #we repeat what we did above, except now we are counting down!
             board.setrowdacs(rowbiases)
             board.event()
-            voltagelist.append(-board.dac_calcvout(rowbiases[x])+board.dac_calcvout(ref_code))
+            voltagelist.append(-board.dac_calcvout(rowbiases[x], line='row', i=x)+board.dac_calcvout(ref_code, line='ref'))
             for i in range(board.xdim): board.COL_EN_tobe[i]=1
             t.sleep(sleep_time)
-            currentlist.append(-(board.adc_predict_voltage(np.array(board.retrievecurrents()))-board.dac_calcvout(ref_code))/board.pots)
+            currentlist.append(-(board.adc_predict_voltage(np.array(board.retrievecurrents()))-board.dac_calcvout(ref_code, line='ref'))/board.pots)
             rowbiases[x]+=-1*step_mult
             t.sleep(sleep_time)
 
@@ -125,10 +125,10 @@ def IVsweep_parallel(board,kernel,x,vstart,vend,step_mult,vgate,vref,backwards=F
             rowbiases[x]=dac_code_start
             board.setrowdacs(rowbiases)
             board.event()
-            voltagelist.append(-board.dac_calcvout(rowbiases[x])+board.dac_calcvout(ref_code))
+            voltagelist.append(-board.dac_calcvout(rowbiases[x], line='row', i=x)+board.dac_calcvout(ref_code, line='ref'))
             for i in range(board.xdim): board.COL_EN_tobe[i]=1
             t.sleep(sleep_time)
-            currentlist.append(-(board.adc_predict_voltage(np.array(board.retrievecurrents()))-board.dac_calcvout(ref_code))/board.pots)
+            currentlist.append(-(board.adc_predict_voltage(np.array(board.retrievecurrents()))-board.dac_calcvout(ref_code, line='ref'))/board.pots)
 
     else:
         board.config_forward_pass()
@@ -140,11 +140,11 @@ def IVsweep_parallel(board,kernel,x,vstart,vend,step_mult,vgate,vref,backwards=F
             #we set or bias and assert an event
             board.event()
             #we attach our voltage to the voltage list by converting the register value to a voltage
-            voltagelist.append(board.dac_calcvout(colbiases[x])-board.dac_calcvout(ref_code))
+            voltagelist.append(board.dac_calcvout(colbiases[x], line='col', i=x)-board.dac_calcvout(ref_code, line='ref'))
             #we readout the ADC value, convert it to a voltage, and finally a current using the potentiometer value
             for i in range(board.ydim): board.ROW_EN_tobe[i]=1        
             t.sleep(0.001)
-            currentlist.append((board.adc_predict_voltage(np.array(board.retrievecurrents()))-board.dac_calcvout(ref_code))/board.pots)
+            currentlist.append((board.adc_predict_voltage(np.array(board.retrievecurrents()))-board.dac_calcvout(ref_code, line='ref'))/board.pots)
             colbiases[x]+=1*step_mult
         colbiases[x]=dac_code_end
 
@@ -153,10 +153,10 @@ def IVsweep_parallel(board,kernel,x,vstart,vend,step_mult,vgate,vref,backwards=F
             # now we go in the opposite direction!
             board.setcoldacs(colbiases)
             board.event()
-            voltagelist.append(board.dac_calcvout(colbiases[x])-board.dac_calcvout(ref_code))
+            voltagelist.append(board.dac_calcvout(colbiases[x], line='col', i=x)-board.dac_calcvout(ref_code, line='ref'))
             for i in range(board.ydim): board.ROW_EN_tobe[i]=1        
             t.sleep(sleep_time)
-            currentlist.append((board.adc_predict_voltage(np.array(board.retrievecurrents()))-board.dac_calcvout(ref_code))/board.pots)
+            currentlist.append((board.adc_predict_voltage(np.array(board.retrievecurrents()))-board.dac_calcvout(ref_code, line='ref'))/board.pots)
             colbiases[x]+=-1*step_mult
         for i in range(board.ydim): board.ROW_EN_tobe[i]=0        
 
@@ -166,11 +166,11 @@ def IVsweep_parallel(board,kernel,x,vstart,vend,step_mult,vgate,vref,backwards=F
             board.setcoldacs(colbiases)
             board.event()
          
-            voltagelist.append(board.dac_calcvout(colbiases[x])-board.dac_calcvout(ref_code))
+            voltagelist.append(board.dac_calcvout(colbiases[x], line='col', i=x)-board.dac_calcvout(ref_code, line='ref'))
             for i in range(board.ydim): board.ROW_EN_tobe[i]=1        
 
             t.sleep(sleep_time)
-            currentlist.append((board.adc_predict_voltage(np.array(board.retrievecurrents()))-board.dac_calcvout(ref_code))/board.pots)
+            currentlist.append((board.adc_predict_voltage(np.array(board.retrievecurrents()))-board.dac_calcvout(ref_code, line='ref'))/board.pots)
 
     #we return these lists to plot
     return voltagelist, currentlist
@@ -250,10 +250,10 @@ def IVsweep(board,kernel,x,y,vstart,vend,step_mult,vgate,vref,backwards=False,co
             #we set our bias and assert an event
             board.event()
             #we attach our voltage to the voltage list by converting the register value to a voltage
-            voltagelist.append(-board.dac_calcvout(rowbiases[y])+board.dac_calcvout(ref_code))
+            voltagelist.append(-board.dac_calcvout(rowbiases[y], line='row', i=y)+board.dac_calcvout(ref_code, line='ref'))
             #we readout the ADC value, convert it to a voltage, and finally a current using the potentiometer value
             t.sleep(sleep_time)
-            currentlist.append(-(board.adc_predict_voltage(board.retrievecurrents()[x])-board.dac_calcvout(ref_code))/board.pots[x])
+            currentlist.append(-(board.adc_predict_voltage(board.retrievecurrents()[x])-board.dac_calcvout(ref_code, line='ref'))/board.pots[x])
             rowbiases[y]+=1*step_mult
 
         rowbiases[y]=dac_code_end
@@ -261,8 +261,8 @@ def IVsweep(board,kernel,x,y,vstart,vend,step_mult,vgate,vref,backwards=False,co
             #we repeat what we did above, except now we are counting down!
             board.setrowdacs(rowbiases)
             board.event()
-            voltagelist.append(-board.dac_calcvout(rowbiases[y])+board.dac_calcvout(ref_code))
-            currentlist.append(-(board.adc_predict_voltage(board.retrievecurrents()[x])-board.dac_calcvout(ref_code))/board.pots[x])
+            voltagelist.append(-board.dac_calcvout(rowbiases[y], line='row', i=y)+board.dac_calcvout(ref_code, line='ref'))
+            currentlist.append(-(board.adc_predict_voltage(board.retrievecurrents()[x])-board.dac_calcvout(ref_code, line='ref'))/board.pots[x])
             rowbiases[y]+=-1*step_mult
 
         if rowbiases[y] != dac_code_start:
@@ -270,8 +270,8 @@ def IVsweep(board,kernel,x,y,vstart,vend,step_mult,vgate,vref,backwards=False,co
             rowbiases[y]=dac_code_start
             board.setrowdacs(rowbiases)
             board.event()
-            voltagelist.append(-board.dac_calcvout(rowbiases[y])+board.dac_calcvout(ref_code))
-            currentlist.append(-(board.adc_predict_voltage(board.retrievecurrents()[x])-board.dac_calcvout(ref_code))/board.pots[x])
+            voltagelist.append(-board.dac_calcvout(rowbiases[y], line='row', i=y)+board.dac_calcvout(ref_code, line='ref'))
+            currentlist.append(-(board.adc_predict_voltage(board.retrievecurrents()[x])-board.dac_calcvout(ref_code, line='ref'))/board.pots[x])
 
     else:
         board.config_forward_pass()
@@ -283,10 +283,10 @@ def IVsweep(board,kernel,x,y,vstart,vend,step_mult,vgate,vref,backwards=False,co
             #we set our bias and assert an event
             board.event()
             #we attach our voltage to the voltage list by converting the register value to a voltage
-            voltagelist.append(board.dac_calcvout(colbiases[x])-board.dac_calcvout(ref_code))
+            voltagelist.append(board.dac_calcvout(colbiases[x], line='col', i=x)-board.dac_calcvout(ref_code, line='ref'))
             #we readout the ADC value, convert it to a voltage, and finally a current using the potentiometer value
             t.sleep(sleep_time)
-            currentlist.append((board.adc_predict_voltage(board.retrievecurrents()[y])-board.dac_calcvout(ref_code))/board.pots[y])
+            currentlist.append((board.adc_predict_voltage(board.retrievecurrents()[y])-board.dac_calcvout(ref_code, line='ref'))/board.pots[y])
             colbiases[x]+=1*step_mult
 
         colbiases[x]=dac_code_end
@@ -294,8 +294,8 @@ def IVsweep(board,kernel,x,y,vstart,vend,step_mult,vgate,vref,backwards=False,co
             # now we go in the opposite direction!
             board.setcoldacs(colbiases)
             board.event()
-            voltagelist.append(board.dac_calcvout(colbiases[x])-board.dac_calcvout(ref_code))
-            currentlist.append((board.adc_predict_voltage(board.retrievecurrents()[y])-board.dac_calcvout(ref_code))/board.pots[y])
+            voltagelist.append(board.dac_calcvout(colbiases[x], line='col', i=x)-board.dac_calcvout(ref_code, line='ref'))
+            currentlist.append((board.adc_predict_voltage(board.retrievecurrents()[y])-board.dac_calcvout(ref_code, line='ref'))/board.pots[y])
             colbiases[x]+=-1*step_mult
 
         if colbiases[x] != dac_code_start:
@@ -303,8 +303,8 @@ def IVsweep(board,kernel,x,y,vstart,vend,step_mult,vgate,vref,backwards=False,co
             colbiases[x]=dac_code_start
             board.setcoldacs(colbiases)
             board.event()
-            voltagelist.append(board.dac_calcvout(colbiases[x])-board.dac_calcvout(ref_code))
-            currentlist.append((board.adc_predict_voltage(board.retrievecurrents()[y])-board.dac_calcvout(ref_code))/board.pots[y])
+            voltagelist.append(board.dac_calcvout(colbiases[x], line='col', i=x)-board.dac_calcvout(ref_code, line='ref'))
+            currentlist.append((board.adc_predict_voltage(board.retrievecurrents()[y])-board.dac_calcvout(ref_code, line='ref'))/board.pots[y])
             
     #we return these lists to plot
     return voltagelist, currentlist
@@ -332,8 +332,9 @@ def init_dacs(ground_code,board,ref_code):
     board.setrowdacs(rowbiases)
     
      
-def read_device(col_code, row_code, gate_code, x ,y, pulselen, ground_code, board, ref_code):
+def read_device(col_code, row_code, gate_code, x ,y, pulselen, ground_code, board, ref_code, n_avg=1, min_stderr=None, oversample_mode='event'):
     #Read is always performed on fwd configuration. Reads current on rows for a given  Vread 
+    #There is still plenty of noise while reading the ADC. n_avg reads are averaged, see Daffodil_Base.event_oversampled for min_stderr and oversample_mode.
     board.config_forward_pass()
     board.set_compliance_control(1)
     rowbiases=[]
@@ -352,16 +353,11 @@ def read_device(col_code, row_code, gate_code, x ,y, pulselen, ground_code, boar
     board.setrowdac_channel(rowbiases[y], y )
     board.setcoldac_channel(colbiases[x], x)
     #t.sleep(0.05)
-    board.event_timevariant(pulselen, write=False)
     #Sleep time should be adjusted. But may not be necessary when parallel DAC programming is implemented in FPGA.
-   
-    avg_current = 0
-    #There is still plenty of noise while reading the ADC. We are currently averaging 4 reads to overcome noise.
-    for i in range(1):
-        #read_current = ((board.adc_predict_voltage(board.retrievecurrents()[y])-board.dac_calcvout(ref_code))/board.pots[x])*1000000
-        read_current = ((board.adc_predict_voltage(board.retrievecurrent_channel(y))-board.dac_calcvout(ref_code))/board.pots[x])*1000000
-        avg_current = avg_current + read_current
-    current = avg_current/1 
+    mean, std, samples = board.event_oversampled(n_avg, min_stderr, oversample_mode, pulse_len=pulselen)
+
+    #read_current = ((board.adc_predict_voltage(board.retrievecurrents()[y])-board.dac_calcvout(ref_code))/board.pots[x])*1000000
+    current = ((board.adc_predict_voltage(mean[y])-board.dac_calcvout(ref_code, line='ref'))/board.pots[x])*1000000
     t.sleep(0.01)
     
     return current
@@ -419,9 +415,9 @@ def form_device (col_code, row_code, gate_code, x ,y, ground_code, board, prm, r
         #Programs to 2.7v and then steps
         program(col_code, row_code, fast_gate_sweep_code, x, y, write_pulse_len, ground_code, board, ref_code)
         t.sleep(0.06)
-        voltagelist.append(-board.dac_calcvout(fast_gate_sweep_code)+board.dac_calcvout(ref_code))
+        voltagelist.append(-board.dac_calcvout(fast_gate_sweep_code, line='gate', i=x)+board.dac_calcvout(ref_code, line='ref'))
         #currentlist.append(read_device(col_read_code, row_code_start, gate_code_end, x, y, read_pulse_len, ground_code, board, ref_code)/1000000)
-        currentlist.append(-(board.adc_predict_voltage(board.retrievecurrent_channel(x))-board.dac_calcvout(ref_code))/board.pots[x])
+        currentlist.append(-(board.adc_predict_voltage(board.retrievecurrent_channel(x))-board.dac_calcvout(ref_code, line='ref'))/board.pots[x])
         gate_sweep_code = fast_gate_sweep_code
         form_steps = int((gate_code-fast_gate_sweep_code)//form_inc) #this is  how many steps we will take
     else:
@@ -430,10 +426,10 @@ def form_device (col_code, row_code, gate_code, x ,y, ground_code, board, prm, r
 
     for i in range(form_steps):
         program(col_code, row_code, gate_sweep_code, x, y, write_pulse_len, ground_code, board, ref_code)
-        voltagelist.append(-board.dac_calcvout(gate_sweep_code)+board.dac_calcvout(ref_code))
+        voltagelist.append(-board.dac_calcvout(gate_sweep_code, line='gate', i=x)+board.dac_calcvout(ref_code, line='ref'))
         t.sleep(0.06)
         #currentlist.append(read_device(col_read_code, row_code_start, gate_code_end, x, y, read_pulse_len, ground_code, board, ref_code)/1000000)
-        currentlist.append(-(board.adc_predict_voltage(board.retrievecurrent_channel(x))-board.dac_calcvout(ref_code))/board.pots[x])
+        currentlist.append(-(board.adc_predict_voltage(board.retrievecurrent_channel(x))-board.dac_calcvout(ref_code, line='ref'))/board.pots[x])
         
         if(i >= 3):
             slope = ((currentlist[i] - currentlist[i-3])/(voltagelist[i] -  voltagelist[i-3])) * 1000
@@ -480,10 +476,10 @@ def form_device (col_code, row_code, gate_code, x ,y, ground_code, board, prm, r
         
     for j in range(form_steps):
         program(col_code, row_code, gate_sweep_code, x, y, write_pulse_len, ground_code, board, ref_code)
-        voltagelist.append(-board.dac_calcvout(gate_sweep_code)+board.dac_calcvout(ref_code))
+        voltagelist.append(-board.dac_calcvout(gate_sweep_code, line='gate', i=x)+board.dac_calcvout(ref_code, line='ref'))
         gate_sweep_code = gate_sweep_code-1*form_inc
         t.sleep(0.01)       
-        currentlist.append(-(board.adc_predict_voltage(board.retrievecurrent_channel(x))-board.dac_calcvout(ref_code))/board.pots[x])
+        currentlist.append(-(board.adc_predict_voltage(board.retrievecurrent_channel(x))-board.dac_calcvout(ref_code, line='ref'))/board.pots[x])
         #currentlist.append(read_device(col_read_code, row_code_start, gate_code_end, x, y, pulse_len, ground_code, board, ref_code)/1000000)
 
         if(DEBUG):  print("Current(uA)", currentlist[i+j]*10**6,"Vgate",voltagelist[i+j])
@@ -492,8 +488,8 @@ def form_device (col_code, row_code, gate_code, x ,y, ground_code, board, prm, r
         #if we don't end exactly at the start, we do a start voltage measurement. It will close a nice loop 
         gate_sweep_code = ground_code
         program(col_code, row_code, gate_sweep_code, x, y, write_pulse_len, ground_code, board, ref_code)
-        voltagelist.append(-board.dac_calcvout(gate_sweep_code)+board.dac_calcvout(ref_code))
-        currentlist.append(-(board.adc_predict_voltage(board.retrievecurrent_channel(x))-board.dac_calcvout(ref_code))/board.pots[x])    
+        voltagelist.append(-board.dac_calcvout(gate_sweep_code, line='gate', i=x)+board.dac_calcvout(ref_code, line='ref'))
+        currentlist.append(-(board.adc_predict_voltage(board.retrievecurrent_channel(x))-board.dac_calcvout(ref_code, line='ref'))/board.pots[x])    
         #currentlist.append(read_device(col_read_code, row_code_start, gate_code_end, x, y, pulse_len, ground_code, board, ref_code)/1000000)
 
         t.sleep(0.01)       
@@ -630,7 +626,7 @@ def set_target (board,prm,kernel,x,y,vcol,vrow,vgate, tc, form=True,set_current=
                 avg_current = 0
                 #Start programming column
                 program(col_sweep_code,  row_code_start, gate_code_fwd, x, y, write_pulse_len, ground_code, board, ref_code)
-                voltagelist.append(board.dac_calcvout(col_sweep_code)-board.dac_calcvout(ref_code))
+                voltagelist.append(board.dac_calcvout(col_sweep_code, line='col', i=x)-board.dac_calcvout(ref_code, line='ref'))
                 #if programmed voltage reaches over read volt, start reading at vread
                 if(voltagelist[i] > (prm.vread-prm.vref)):
     
@@ -794,7 +790,7 @@ def set_target (board,prm,kernel,x,y,vcol,vrow,vgate, tc, form=True,set_current=
                 board.set_compliance_control(OFF) 
                 board.config_backward_pass()
                 program(col_code_start, row_code_end, gate_sweep_code, x, y, write_pulse_len, ground_code, board, ref_code)
-                voltagelist.append(-board.dac_calcvout(gate_sweep_code)+board.dac_calcvout(ref_code))
+                voltagelist.append(-board.dac_calcvout(gate_sweep_code, line='gate', i=x)+board.dac_calcvout(ref_code, line='ref'))
                         
 
                 gate_sweep_code = gate_sweep_code+1*(sweep_inc)
@@ -950,12 +946,12 @@ def fwd_sweep_serial (col_code_start, col_code_end, row_code_start, gate_code_fw
     for i in range(reset_vcol_steps):
         #Start programming column
         program(col_sweep_code,  row_code_start, gate_code_fwd, x, y, write_pulse_len, ground_code, board, ref_code)
-        voltagelist.append(board.dac_calcvout(col_sweep_code)-board.dac_calcvout(ref_code))
+        voltagelist.append(board.dac_calcvout(col_sweep_code, line='col', i=x)-board.dac_calcvout(ref_code, line='ref'))
         #if programmed voltage reaches over read volt, start reading at vread
         #currentlist.append(read_device(col_read_code, row_code_start, gate_code_end, x, y, read_pulse_len, ground_code, board, ref_code))
         #if(vtolerant):  currentlist.append(read_device(col_read_code, row_code_start, gate_code_end, x, y, read_pulse_len, ground_code, board, ref_code))
         #currentlist.append((board.adc_predict_voltage(board.retrievecurrents()[y])-board.dac_calcvout(ref_code))/board.pots[y])
-        currentlist.append((board.adc_predict_voltage(board.retrievecurrent_channel(y))-board.dac_calcvout(ref_code))/board.pots[y])
+        currentlist.append((board.adc_predict_voltage(board.retrievecurrent_channel(y))-board.dac_calcvout(ref_code, line='ref'))/board.pots[y])
         t.sleep(0.1)
         actual_current = currentlist[i]*10**6
         col_sweep_code = col_sweep_code+1*sweep_inc
@@ -974,10 +970,10 @@ def fwd_sweep_serial (col_code_start, col_code_end, row_code_start, gate_code_fw
     reset_vcol_steps = int((col_sweep_code-col_code_start)//sweep_inc) #this is  how many steps we will take    
     for j in range(reset_vcol_steps):
         program(col_sweep_code,  row_code_start, gate_code_fwd, x, y, write_pulse_len, ground_code, board, ref_code)
-        voltagelist.append(board.dac_calcvout(col_sweep_code)-board.dac_calcvout(ref_code))
+        voltagelist.append(board.dac_calcvout(col_sweep_code, line='col', i=x)-board.dac_calcvout(ref_code, line='ref'))
         #currentlist.append(read_device(col_read_code, row_code_start, gate_code_end, x, y, read_pulse_len, ground_code, board, ref_code))
         #currentlist.append((board.adc_predict_voltage(board.retrievecurrents()[y])-board.dac_calcvout(ref_code))/board.pots[y])
-        currentlist.append((board.adc_predict_voltage(board.retrievecurrent_channel(y))-board.dac_calcvout(ref_code))/board.pots[y])
+        currentlist.append((board.adc_predict_voltage(board.retrievecurrent_channel(y))-board.dac_calcvout(ref_code, line='ref'))/board.pots[y])
         actual_current = currentlist[i+j]*10**6
         t.sleep(0.1)
         if(DEBUG):  print("Current at", col_sweep_code, ":", actual_current, "for Vcol:",   voltagelist[i+j], "slope", slope, "cdiff", cdiff, "oshoot", oshoot_cnt, "***********")    
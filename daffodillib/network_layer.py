@@ -33,7 +33,7 @@ class Linear:
         board : Board.controller.Daffodil_Base
             Daffodil board object (can be physical or simulated).
         shape : list[int, int]
-            Dimensions of the layer in terms of kernels. A layer with 50 rows and 50 columns can be realized by passing [2, 2].
+            Dimensions of the layer in terms of kernels. A layer with 50 rows and 50 columns can be realized by passing [2, 2]. In `tiled` mode the shape is derived from `weight_shape`.
         weight_shape : list[int, int]
             Dimensions of the layer in terms of individual devices.
         vread : float
@@ -49,31 +49,14 @@ class Linear:
         encoding : str
             Whether or not the layer should be mapped for Daffodil's forward configuration or backward.
         mode : str
-            How a layer should be mapped to a kernel. The provided implementation supports `block` mode of operation, where a layer is mapped to contiguous blocks of devices within a kernel.
+            How a layer should be mapped to a kernel. The provided implementation supports `block` mode of operation, where a layer is mapped to contiguous blocks of devices within a kernel,
+            and `tiled` mode, where a layer of any size is split into kernel-sized tiles that are mapped to separate kernels (see `plan_tiles`).
         offsets : list[tuples]
             A list of parameters compatible with the provided `mode`. For `block` mode, this is simply [(k, x, y)] where (x, y) indicate the (column, row) within kernel k to which the layer is mapped. 
+            For `tiled` mode, only the kernel k of every offset is used: [(k,)] maps the tiles to consecutive kernels starting from k, [(k0,), (k1,), ...] lists one kernel per tile.
         """
         
         self.board=board
-        self.kernels=[i[0] for i in offsets]
-        self.kernels = list(set(self.kernels))
-
-        if len(shape) == 2:
-            self.shape=shape
-        else:
-            raise ValueError("shape is not list of two values")
-
-        self.xdim=shape[0]*self.board.xdim
-        self.ydim=shape[1]*self.board.ydim
-
-        self.array=[]
-
-        for i in range(self.shape[0]):
-            holdlist=[]
-            for j in range(self.shape[1]):
-                holdlist.append(self.kernels[j+self.shape[1]*i])
-            self.array.append(holdlist)
-            
         self.vread=vread
         self.vset=vset
         self.vreset=vreset
@@ -84,6 +67,25 @@ class Linear:
         self.mode = mode
         self.weight_shape=weight_shape
         if (self.mode == 'block'): 
+            self.kernels=[i[0] for i in offsets]
+            self.kernels = list(set(self.kernels))
+
+            if len(shape) == 2:
+                self.shape=shape
+            else:
+                raise ValueError("shape is not list of two values")
+
+            self.xdim=shape[0]*self.board.xdim
+            self.ydim=shape[1]*self.board.ydim
+
+            self.array=[]
+
+            for i in range(self.shape[0]):
+                holdlist=[]
+                for j in range(self.shape[1]):
+                    holdlist.append(self.kernels[j+self.shape[1]*i])
+                self.array.append(holdlist)
+
             # Block mode encoding: the layer is mapped to a contiguous block starting from (kernel, column, row)/(k, x, y)
             assert len(offsets) == 1 and len(offsets[0]) == 3
             self.xoffset = offsets[0][1]
@@ -91,11 +93,106 @@ class Linear:
             # safety/sanity checks
             assert self.xoffset < self.board.xdim
             assert self.yoffset < self.board.ydim
+        elif (self.mode == 'tiled'):
+            # Tiled mode encoding: the layer is split into kernel-sized tiles, each mapped to (0, 0) of its own kernel
+            self.plan_tiles(offsets)
         else:
             # Other modes can be implemented here
             raise ValueError(f"Layer mode {self.mode} not implemented")
-            
-    def read_array(self, vread, vref, slice=False):
+
+        # conductance cache, see read_kernel_cached
+        self.cache = {}
+        self.cache_stats = {'hits': 0, 'misses': 0}
+
+    def plan_tiles(self, offsets):
+        """Split the layer into tiles of at most one kernel and assign a kernel to every tile.
+
+        The columns (inputs) of the layer are split into `shape[0]` column tiles and the rows (outputs) into `shape[1]` row tiles, all of
+        them full kernels except for the last one in each direction. Tile (i, j) is mapped to (0, 0) of kernel `array[i][j]`.
+
+        Parameters
+        ----------
+        offsets : list[tuples]
+            The kernels available to the layer. If a single (k, ...) is given, the tiles are mapped to consecutive kernels starting from k.
+            Otherwise the kernels of the offsets are used in order, one per tile.
+        """
+        if self.encoding != 'forward':
+            raise ValueError(f"Layer mode {self.mode} not implemented for {self.encoding} encoding")
+
+        xtiles = -(-self.weight_shape[0] // self.board.xdim)
+        ytiles = -(-self.weight_shape[1] // self.board.ydim)
+        if len(offsets) == 1:
+            kernels = list(range(offsets[0][0], offsets[0][0] + xtiles*ytiles))
+        else:
+            kernels = [i[0] for i in offsets]
+        if len(kernels) < xtiles*ytiles:
+            raise ValueError(f"A {self.weight_shape[0]} x {self.weight_shape[1]} layer needs {xtiles*ytiles} kernels, {len(kernels)} given")
+        kernels = kernels[:xtiles*ytiles]
+        if len(set(kernels)) < len(kernels) or min(kernels) < 0 or max(kernels) >= self.board.kernels:
+            raise ValueError(f"Layer kernels {kernels} must be distinct and in the range [0-{self.board.kernels-1}]")
+
+        self.shape = [xtiles, ytiles]
+        self.xdim = xtiles*self.board.xdim
+        self.ydim = ytiles*self.board.ydim
+        self.xoffset = 0
+        self.yoffset = 0
+        self.kernels = kernels
+        self.array = [kernels[ytiles*i:ytiles*(i+1)] for i in range(xtiles)]
+        self.tiles = [] # (kernel, (first column, last column + 1), (first row, last row + 1)) of every tile, row tiles first
+        for i in range(xtiles):
+            for j in range(ytiles):
+                x0, y0 = i*self.board.xdim, j*self.board.ydim
+                self.tiles.append((self.array[i][j], (x0, min(x0 + self.board.xdim, self.weight_shape[0])), (y0, min(y0 + self.board.ydim, self.weight_shape[1]))))
+        return self.tiles
+
+    def read_kernel_cached(self, kernel, vread, vref):
+        """Read the conductances of a kernel, re-measuring only the columns that changed since its last readout.
+
+        The last readout of every kernel of the layer is kept in `cache`, together with a mask of the devices written since then by
+        `out_prod_update` or `set_target` (see `mark_dirty`). Only the columns with written devices are measured again, the other
+        columns are taken from the cache. A readout with other read, reference or gate voltages measures the whole kernel.
+        `cache_stats` counts the columns taken from the cache ('hits') and the measured ones ('misses').
+
+        Parameters
+        ----------
+        kernel : int
+            The kernel to read.
+        vread : float
+            The read voltage.
+        vref : float
+            The reference voltage for the ADCs.
+        Returns
+        -------
+        conductances : numpy.ndarray
+            The (columns, rows) conductances of the whole kernel.
+        """
+        settings = (vread, vref, self.vgate)
+        entry = self.cache.get(kernel)
+        if entry is None or entry['settings'] != settings:
+            entry = {'settings': settings, 'G': np.zeros((self.board.xdim, self.board.ydim)), 'dirty': np.ones((self.board.xdim, self.board.ydim), dtype=bool)}
+            self.cache[kernel] = entry
+
+        columns = np.flatnonzero(entry['dirty'].any(axis=1)).tolist()
+        self.cache_stats['hits'] += self.board.xdim - len(columns)
+        self.cache_stats['misses'] += len(columns)
+        if columns:
+            entry['G'][columns] = read_array.read_kernel(self.board, kernel, vread, self.vgate, vref, weight_shape=[25, 25], xoffset=0, yoffset=0, columns=columns)
+            entry['dirty'][columns] = False
+        return entry['G'].copy()
+
+    def mark_dirty(self, kernel, columns, rows):
+        """Mark the devices on the given columns and rows of a kernel as written, so that the next cached readout measures them again."""
+        if kernel in self.cache:
+            self.cache[kernel]['dirty'][np.ix_(list(columns), list(rows))] = True
+
+    def invalidate_cache(self, kernel=None):
+        """Drop the cached readout of a kernel, or of all kernels, e.g. after the devices were written outside of this layer."""
+        if kernel is None:
+            self.cache = {}
+        else:
+            self.cache.pop(kernel, None)
+
+    def read_array(self, vread, vref, slice=False, cached=False):
         """Read states of kernels mapping the given neural network layer.
 
         Parameters
@@ -105,25 +202,41 @@ class Linear:
         vref : float
             The reference voltage for the ADCs.
         slice : bool
-            If True, the sliced subkernel to which the layer is mapped is returned. If False, entire Kernels are returned.
+            If True, the sliced subkernel to which the layer is mapped is returned, and unless `cached` is set only its devices are measured
+            (see the `roi` option of `read_array.read_kernel`). If False, entire Kernels are returned.
+        cached : bool
+            If True, only the devices written since the last readout are measured again, see `read_kernel_cached`. Otherwise every kernel is measured.
         Returns
         -------
         readarray : list[list[list[float]]]
             Three-dimensional array representing read-back device states over all kernels involved in layer mapping.
         """
-        configure=True
         readarray = []
         if (self.mode == 'block'):
             for kernel in self.kernels:
-                reads=read_array.read_kernel(self.board, kernel, vread, self.vgate, vref, weight_shape=[25, 25], xoffset=0, yoffset=0, configure=configure)
                 if (self.encoding == 'forward'):
                     x_slice = self.weight_shape[0]
                     y_slice = self.weight_shape[1]
                 else: 
                     x_slice = self.weight_shape[1]
                     y_slice = self.weight_shape[0]
-                reads = np.array(reads)
-                if (slice): reads = reads[self.xoffset:self.xoffset+x_slice, self.yoffset:self.yoffset+y_slice]
+                if (slice and not cached):
+                    # only the devices of the slice are measured
+                    roi = [min(x_slice, self.board.xdim-self.xoffset), min(y_slice, self.board.ydim-self.yoffset)]
+                    reads = np.array(read_array.read_kernel(self.board, kernel, vread, self.vgate, vref, weight_shape=roi, xoffset=self.xoffset, yoffset=self.yoffset, roi=True))
+                else:
+                    if not cached: self.invalidate_cache(kernel)
+                    reads = self.read_kernel_cached(kernel, vread, vref)
+                    if (slice): reads = reads[self.xoffset:self.xoffset+x_slice, self.yoffset:self.yoffset+y_slice]
+                readarray.append(reads)
+        elif (self.mode == 'tiled'):
+            for kernel, (x0, x1), (y0, y1) in self.tiles:
+                if (slice and not cached):
+                    reads = np.array(read_array.read_kernel(self.board, kernel, vread, self.vgate, vref, weight_shape=[x1-x0, y1-y0], xoffset=0, yoffset=0, roi=True))
+                else:
+                    if not cached: self.invalidate_cache(kernel)
+                    reads = self.read_kernel_cached(kernel, vread, vref)
+                    if (slice): reads = reads[:x1-x0, :y1-y0]
                 readarray.append(reads)
         # reading for other modes can be implemented here
         return readarray
@@ -141,42 +254,122 @@ class Linear:
         currents : list[float]
             An array representing accumulated currents on rows corresponding to the mapped network layer.
         """
-        inputvector = inputvector.copy()
-        if self.vref == 0 and min(inputvector) < 0:
+        vector, codes = self.prepare_inputs(inputvector)
+        return self.forward_prepared(vector, codes).tolist()
+
+    def kernel_plan(self):
+        """List the kernel operations of a forward pass in the order `forward_pass` runs them.
+
+        Returns
+        -------
+        plan : list[tuple]
+            One (kernel, first input, weight_shape, xoffset, yoffset, first output, number of outputs) per kernel operation. The kernel is driven
+            with the `board.xdim` inputs starting at first input, and its first `number of outputs` row currents are added to the layer currents starting at first output.
+        """
+        if (self.mode == 'block'):
+            return [(self.array[i][j], self.board.xdim*i, self.weight_shape, self.xoffset, self.yoffset, self.board.ydim*j, self.board.ydim)
+                    for i in range(self.shape[0]) for j in range(self.shape[1])]
+        return [(kernel, x0, (x1-x0, y1-y0), 0, 0, y0, y1-y0) for kernel, (x0, x1), (y0, y1) in self.tiles]
+
+    def pad_inputs(self, inputvectors):
+        """Check a batch of input vectors and pad them to the columns of the layer.
+
+        Parameters
+        ----------
+        inputvectors : list[list[float]]
+            A (batch, inputs) array of voltages, one input vector of `forward_pass` per row.
+        Returns
+        -------
+        vectors : numpy.ndarray
+            The (batch, `xdim`) column voltages, including the x offset padding and `vref`.
+        """
+        inputvectors = np.atleast_2d(np.asarray(inputvectors, dtype=float))
+        if self.vref == 0 and inputvectors.min() < 0:
             raise ValueError("Layer is currently set to be strictly positive! Enable vref!")
-        if max(list(map(abs,inputvector))) > 1:
+        if np.abs(inputvectors).max() > 1:
             raise ValueError("Largest input can only be 1!")
-        if len(inputvector) > self.xdim:
+        if inputvectors.shape[1] > self.xdim:
             raise ValueError("Too big input dimension!")
-    
-        if (self.mode == 'block'):
-            currentstemp=[]
-            vector=inputvector
-            currents=[]
-            for p in range(self.ydim):
-                currents.append(0)
-            # Padding if there's x offset
-            # Forward pass = apply on columns (x), measure on rows (y)
-            for p in range(self.xoffset):
-                vector.insert(0, 0)
-            for p in range(self.xdim-len(inputvector)):
-                vector.append(0)
-            for p in range(self.xdim):
-                vector[p] = vector[p]+self.vref
 
-            for i in range(self.shape[0]):
-                configure = True
-                for j in range(self.shape[1]):
-                    currentstemp=currentstemp + read_array.vmm_kernel_forward(self.board,self.array[i][j],vector[(self.board.xdim)*i:self.board.xdim*(i+1)],self.vgate,self.vref,self.weight_shape,self.xoffset,self.yoffset,configure)
-                    if j == 0:
-                        configure = False
-                for p in range(self.ydim):
-                    currents[p]+=currentstemp[p]
-                currentstemp=[]
+        # all voltages are relative to vref
+        vectors = np.zeros((len(inputvectors), self.xdim))
+        vectors[:, self.xoffset:self.xoffset+inputvectors.shape[1]] = inputvectors
+        vectors += self.vref
+        return vectors
+
+    def prepare_inputs(self, inputvector, invertvouts=None):
+        """Host-side part of a forward pass: check an input vector, pad it to the layer and convert it to column DAC codes.
+
+        Parameters
+        ----------
+        inputvector : list[floats]
+            A list of voltages to be applied on input columns, as for `forward_pass`.
+        invertvouts : callable, optional
+            The voltage to code conversion, see `Board.controller.Daffodil_Base.dac_inverter`. If None, the board converts the voltages.
+        Returns
+        -------
+        vector : numpy.ndarray
+            The `xdim` column voltages, including the x offset padding and `vref`.
+        codes : list[int]
+            The DAC codes of `vector`, converted in blocks of `board.xdim` columns with the column calibration.
+        """
+        vector = self.pad_inputs(inputvector)[0]
+        blocks = np.abs(vector.reshape(-1, self.board.xdim))
+        codes = self.board.dac_invertvouts(blocks, line='col') if invertvouts is None else invertvouts(blocks)
+        return vector, codes.ravel().tolist()
+
+    def forward_prepared(self, vector, codes):
+        """Board-side part of a forward pass: apply the output of `prepare_inputs` to the kernels of the layer.
+
+        The DACs are only reconfigured when the column block or the enabled block of the next kernel differs from the previous one.
+
+        Parameters
+        ----------
+        vector : numpy.ndarray
+            The column voltages returned by `prepare_inputs`.
+        codes : list[int]
+            The column DAC codes returned by `prepare_inputs`.
+        Returns
+        -------
+        currents : numpy.ndarray
+            The accumulated row currents of the layer outputs.
+        """
+        currents = np.zeros(self.ydim)
+        configured = None
+        for kernel, x0, weight_shape, xoffset, yoffset, y0, ny in self.kernel_plan():
+            config = (x0, weight_shape, xoffset, yoffset)
+            partial = read_array.vmm_kernel_forward(self.board, kernel, vector[x0:x0+self.board.xdim], self.vgate, self.vref, weight_shape, xoffset, yoffset, config != configured,
+                                                    readcodes=codes[x0:x0+self.board.xdim])
+            configured = config
+            currents[y0:y0+ny] += partial[:ny]
+
+        yoffset = self.yoffset if self.mode == 'block' else 0
+        return currents[yoffset:yoffset+self.weight_shape[1]]
+
+    def forward_batch(self, inputvectors):
+        """Perform `forward_pass` for a batch of inputs, kernel by kernel.
+
+        All inputs are applied to one kernel before the next kernel is selected, so between events only the column biases change
+        (see `read_array.vmm_kernel_forward_batch`). Device reads do not disturb the states, so the currents are the same as those of `forward_pass`.
+
+        Parameters
+        ----------
+        inputvectors : list[list[float]]
+            A (batch, inputs) array of voltages, one input vector of `forward_pass` per row.
+        Returns
+        -------
+        currents : numpy.ndarray
+            A (batch, outputs) array of the accumulated row currents of every input.
+        """
+        vectors = self.pad_inputs(inputvectors)
 
-            return currents[self.yoffset:self.yoffset+self.weight_shape[1]]
+        currents = np.zeros((len(vectors), self.ydim))
+        for kernel, x0, weight_shape, xoffset, yoffset, y0, ny in self.kernel_plan():
+            partial = read_array.vmm_kernel_forward_batch(self.board, kernel, vectors[:, x0:x0+self.board.xdim], self.vgate, self.vref, weight_shape, xoffset, yoffset)
+            currents[:, y0:y0+ny] += partial[:, :ny]
 
-        # other modes can be implemented here
+        yoffset = self.yoffset if self.mode == 'block' else 0
+        return currents[:, yoffset:yoffset+self.weight_shape[1]]
 
     def out_prod_update(self, yvector, xvector, vgate):
 
@@ -220,9 +413,49 @@ class Linear:
                 for j in range(self.shape[1]):
                     self.board.set_kernel(self.array[i][j])
                     outerproduct.outer_product(self.board,self.vset,self.vreset,vgate,yvector[(self.board.xdim)*i:self.board.xdim*(i+1)],xvector[self.board.ydim*j:self.board.ydim*(j+1)])
+                    self.mark_dirty(self.array[i][j], np.flatnonzero(xvector[self.board.ydim*j:self.board.ydim*(j+1)]), np.flatnonzero(yvector[(self.board.xdim)*i:self.board.xdim*(i+1)]))
+
+        elif (self.mode == 'tiled'):
+            xvector = np.pad(np.asarray(xvector), (0, self.xdim-len(xvector)))
+            yvector = np.pad(np.asarray(yvector), (0, self.ydim-len(yvector)))
+
+            for kernel, (x0, x1), (y0, y1) in self.tiles:
+                xtile = xvector[x0:x0+self.board.xdim]
+                ytile = yvector[y0:y0+self.board.ydim]
+                if not (xtile.any() and ytile.any()): # no pulses in this tile, the outer product would not have any events
+                    continue
+                self.board.set_kernel(kernel)
+                outerproduct.outer_product(self.board,self.vset,self.vreset,vgate,ytile.tolist(),xtile.tolist())
+                self.mark_dirty(kernel, np.flatnonzero(xtile), np.flatnonzero(ytile))
 
         # Other encoding modes can be added here
 
+    def set_target(self, prm, kernel, x, y, vcol, vrow, tc, **kwargs):
+        """Program a single device of the layer to a target current with `IVcurve.set_target`, using the gate voltage of the layer.
+
+        Parameters
+        ----------
+        prm : module
+            The programming parameters, see `daffodillib.parameters`.
+        kernel : int
+            The kernel of the device.
+        x, y : int
+            The column and row of the device in the kernel.
+        vcol, vrow : float
+            The column and row voltages passed to `IVcurve.set_target`.
+        tc : float
+            The target current.
+        kwargs
+            The options `form`, `set_current` and `swfix_en` of `IVcurve.set_target`.
+        Returns
+        -------
+        The voltage list, set current and status of `IVcurve.set_target`.
+        """
+        result = IVcurve.set_target(self.board, prm, kernel, x, y, vcol, vrow, self.vgate, tc, **kwargs)
+        # with swfix_en, columns 13 and 14 are enabled together
+        self.mark_dirty(kernel, [13, 14] if kwargs.get('swfix_en') and x in (13, 14) else [x], [y])
+        return result
+
     def load_weights_outerproduct_parallel(self, weights, vgate):
         num_pulses = 1
         for x in range(weights.shape[0]):
@@ -261,4 +494,31 @@ class Linear:
             plt.title(f'Kernel {self.kernels[idx]}')
             cbar = fig.colorbar(imgplot)
             cbar.set_label('Conductance (µS)')
-        return arrs
\ No newline at end of file
+        return arrs
+
+def forward_batch(layers, inputs, activation=None):
+    """Run a batch of inputs through a network with the kernel-major schedule of `Linear.forward_batch`.
+
+    The layers are executed one after the other for the whole batch, and within a layer every kernel processes all inputs before the board
+    switches to the next one. A network on k kernels therefore needs k kernel configurations per batch instead of k per input.
+
+    Parameters
+    ----------
+    layers : list[Linear]
+        The layers of the network, in order.
+    inputs : list[list[float]]
+        A (batch, inputs) array of input voltages of the first layer.
+    activation : callable, optional
+        Called as `activation(layer_idx, currents)` on the (batch, outputs) currents of every layer, it returns the input voltages of the next layer.
+        Without it, the currents are returned and passed on unchanged.
+    Returns
+    -------
+    outputs : numpy.ndarray
+        The (batch, outputs) result of the last layer (after `activation`).
+    """
+    x = inputs
+    for layer_idx, layer in enumerate(layers):
+        x = layer.forward_batch(x)
+        if activation is not None:
+            x = activation(layer_idx, x)
+    return x
@@ -60,9 +60,12 @@ def outer_product_primitive(board,vwrite,vgate,col_update,row_update,sig, config
         board.config_outerproduct()
 
     #based on the write vlues, this specifies all the DAC code values that need to be passed
-    dac_code_write = board.dac_invertvout(abs(vwrite+board.vground))
-    dac_code_zero = board.dac_invertvout(board.vground)
-    dac_gate_code = board.dac_invertvout(abs(vgate))
+    #the codes are converted line by line, with the channel calibration if one is loaded
+    def line_codes(v, line):
+        return board.dac_invertvouts([v]*(board.ydim if line == 'row' else board.xdim), line=line).tolist()
+    vwrite_line = abs(vwrite+board.vground)
+    dac_gate_code = line_codes(abs(vgate), 'gate')
+    dac_gate_zero = line_codes(board.vground, 'gate')
     
     """
     the half value is special, the nonselected columns will have this voltage. this counterintuitive, but since we can't use negative numbers
@@ -73,8 +76,10 @@ def outer_product_primitive(board,vwrite,vgate,col_update,row_update,sig, config
     because of our chosen way of performing the updates, this is allowed, but we could do this in theoretically fewer operation but we would need to assert
     the half bias on all unselected lines to avoid uncontrollabe leakage currents which could potentially cause a read-disturb
     """
-    dac_code_writehalf = board.dac_invertvout(abs(vwrite)/2 + board.vground) # the voltage across devices on non-active rows/columns
-    dac_code_writehalf = board.dac_invertvout(board.vground) # experimental - zero bias on non-active rows/columns
+    vwritehalf = abs(vwrite)/2 + board.vground # the voltage across devices on non-active rows/columns
+    vwritehalf = board.vground # experimental - zero bias on non-active rows/columns
+    col_code_writehalf = line_codes(vwritehalf, 'col')
+    row_code_writehalf = line_codes(vwritehalf, 'row')
 
     #these are the lists of biases 
     gatebiases=[]
@@ -82,19 +87,19 @@ def outer_product_primitive(board,vwrite,vgate,col_update,row_update,sig, config
     colbiases=[]
 
     if sig == 0:#if we are in the positive mode, the columns will have bias 
-        dac_col_vol = dac_code_write
-        dac_row_vol = dac_code_zero
+        dac_col_vol = line_codes(vwrite_line, 'col')
+        dac_row_vol = line_codes(board.vground, 'row')
     else: #if we are in the ngative mode, the rows will have bias. 
-        dac_row_vol = dac_code_write
-        dac_col_vol = dac_code_zero
+        dac_row_vol = line_codes(vwrite_line, 'row')
+        dac_col_vol = line_codes(board.vground, 'col')
 
     #we set everyting to the nonwrite configuration 
     for i in range(board.xdim):
-        gatebiases.append(dac_code_zero)
-        colbiases.append(dac_code_writehalf)
+        gatebiases.append(dac_gate_zero[i])
+        colbiases.append(col_code_writehalf[i])
         board.COL_EN_tobe[i]=0
     for i in range(board.ydim):
-        rowbiases.append(dac_code_writehalf)
+        rowbiases.append(row_code_writehalf[i])
         board.ROW_EN_tobe[i]=0
 
     #we assert our biases
@@ -114,12 +119,12 @@ def outer_product_primitive(board,vwrite,vgate,col_update,row_update,sig, config
         for i in range(len(col_series)): # we sweep the columns
             if col_series[i]>0: #if our vector has number in it, we use this column to update
                 col_series[i]+=-1 #we decrement the value
-                colbiases[i]=dac_col_vol #we give it the outerproduct value
-                gatebiases[i]=dac_gate_code #we specify a nonzero gate bias
+                colbiases[i]=dac_col_vol[i] #we give it the outerproduct value
+                gatebiases[i]=dac_gate_code[i] #we specify a nonzero gate bias
                 board.COL_EN_tobe[i]=1 #we tell the board to assert it's value
             else:
-                colbiases[i]=dac_code_writehalf #if we don't use it we give it the half voltage
-                gatebiases[i]=dac_code_zero # we set the gate to zero
+                colbiases[i]=col_code_writehalf[i] #if we don't use it we give it the half voltage
+                gatebiases[i]=dac_gate_zero[i] # we set the gate to zero
                 board.COL_EN_tobe[i]=0 # we also do not assert the value
                 #in the future, we may want to actually assert this line even though the gate bias is zero so that the line is biased.
                  #this would help control the impedance on the lines by not having floating wires. 
@@ -128,8 +133,8 @@ def outer_product_primitive(board,vwrite,vgate,col_update,row_update,sig, config
         #we can hold these values here for quite a while until we do a whole roq sequence 
         
         if (debug):
-            gatebiases_converted = [board.dac_calcvout(gatebias) for gatebias in gatebiases]
-            colbiases_converted = [board.dac_calcvout(colbias) for colbias in colbiases]
+            gatebiases_converted = board.dac_calcvouts(gatebiases, line='gate').tolist()
+            colbiases_converted = board.dac_calcvouts(colbiases, line='col').tolist()
             print('gatebiases', gatebiases_converted)
             print('colbiases', colbiases_converted)
         board.setcoldacs(colbiases)
@@ -143,14 +148,14 @@ def outer_product_primitive(board,vwrite,vgate,col_update,row_update,sig, config
             for j in range(len(row_series)):
                 if row_series[j]>0: #if the vector has a nonzero value
                     row_series[j]+=-1 #we will decrement it
-                    rowbiases[j]=dac_row_vol #we will give it's dac the right voltage
+                    rowbiases[j]=dac_row_vol[j] #we will give it's dac the right voltage
                     board.ROW_EN_tobe[j]=1 #we will assert the row during an event
                 else:
-                    rowbiases[j]=dac_code_writehalf #we will give it half bias
+                    rowbiases[j]=row_code_writehalf[j] #we will give it half bias
                     board.ROW_EN_tobe[j]=0 #we will not assert the row during an event. we could choose to assert this so as to better control the impedance of neighboring wires
             board.setrowdacs(rowbiases)#we will set the biases
             if (debug):
-                rowbiases_converted = [board.dac_calcvout(rowbias) for rowbias in rowbiases]
+                rowbiases_converted = board.dac_calcvouts(rowbiases, line='row').tolist()
                 print('rowbiases', rowbiases_converted)
                 print('asserting event')
                 print('ROW enables', board.ROW_EN_tobe)
@@ -0,0 +1,94 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+The pipeline.py program is designed to keep the board busy during inference.
+
+In a plain forward pass, the board idles while the host post-processes the currents of a layer (differential subtraction, scaling,
+bias, activation) and converts them to the DAC codes of the next layer. Here, that host work runs on a worker thread while the board
+executes the layers of other samples.
+
+The samples are skewed by two rounds per layer: in round r, layer l processes sample r - 2l. The currents of round r are post-processed
+during round r + 1 and are needed again in round r + 2, so the board and the worker always use different halves of the double buffers.
+The board operations are issued in a fixed order and the outputs are returned in sample order, so the results do not depend on the thread timing.
+The board itself is only accessed from the calling thread. The worker converts voltages to codes with the DAC settings captured when
+`run` starts (see `Daffodil_Base.dac_inverter`), so the DAC gain, offset and calibration must not change during a run.
+"""
+
+class Pipelined_Forward:
+    """
+    Pipelined inference over a list of `network_layer.Linear` layers.
+    """
+    def __init__(self, layers, activation):
+        """
+        Parameters
+        ----------
+        layers : list[network_layer.Linear]
+            The layers of the network, in order.
+        activation : callable
+            Called as `activation(layer_idx, currents)` on a (1, outputs) array of layer currents, it returns the input voltages of the next layer
+            (or the network output after the last layer). This is the same interface as `network_layer.forward_batch`.
+        """
+        self.layers = layers
+        self.activation = activation
+        # the double buffers, slot s % 2 holds the inputs and currents of sample s in every layer
+        self.vectors = [[np.zeros(layer.xdim) for layer in layers] for slot in range(2)]
+        self.codes = [[None for layer in layers] for slot in range(2)]
+        self.currents = [[np.zeros(layer.weight_shape[1]) for layer in layers] for slot in range(2)]
+        self.inverters = None # the board-free column code conversion of every layer, captured by run
+
+    def prepare(self, layer_idx, sample, inputvector):
+        #converts the inputs of a layer into its buffer slot
+        vector, codes = self.layers[layer_idx].prepare_inputs(inputvector, self.inverters[layer_idx])
+        self.vectors[sample % 2][layer_idx][:] = vector
+        self.codes[sample % 2][layer_idx] = codes
+
+    def board_round(self, r, num_samples):
+        #the board work of round r: every layer processes its sample, if it has one
+        for layer_idx, layer in enumerate(self.layers):
+            sample = r - 2*layer_idx
+            if 0 <= sample < num_samples:
+                slot = sample % 2
+                self.currents[slot][layer_idx][:] = layer.forward_prepared(self.vectors[slot][layer_idx], self.codes[slot][layer_idx])
+
+    def host_round(self, r, X, outputs):
+        #the host work on the currents of round r, it prepares the inputs of round r + 2
+        for layer_idx in range(len(self.layers)):
+            sample = r - 2*layer_idx
+            if 0 <= sample < len(X):
+                x = self.activation(layer_idx, self.currents[sample % 2][layer_idx][None])[0]
+                if layer_idx < len(self.layers) - 1:
+                    self.prepare(layer_idx + 1, sample, x)
+                else:
+                    outputs[sample] = x
+        if r + 2 < len(X):
+            self.prepare(0, r + 2, X[r + 2])
+
+    def run(self, X):
+        """Run every sample of `X` through the network.
+
+        Parameters
+        ----------
+        X : list[list[float]]
+            A (samples, inputs) array of input voltages of the first layer.
+        Returns
+        -------
+        outputs : numpy.ndarray
+            One row of network outputs (after `activation`) per sample, in the order of `X`.
+        """
+        X = np.asarray(X, dtype=float)
+        outputs = [None]*len(X)
+        self.inverters = [layer.board.dac_inverter('col') for layer in self.layers]
+        for sample in range(min(2, len(X))):
+            self.prepare(0, sample, X[sample])
+
+        pending = {}
+        with ThreadPoolExecutor(max_workers=1) as worker:
+            for r in range(len(X) + 2*(len(self.layers) - 1)):
+                if r - 2 in pending:
+                    pending.pop(r - 2).result() # the inputs of this round are ready
+                self.board_round(r, len(X))
+                pending[r] = worker.submit(self.host_round, r, X, outputs)
+            for r in sorted(pending):
+                pending[r].result()
+        return np.array(outputs)
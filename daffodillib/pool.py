@@ -0,0 +1,163 @@
+import numpy as np
+import time
+from concurrent.futures import ThreadPoolExecutor
+from daffodillib.network_layer import forward_batch
+from daffodillib.utils import differential_activation
+
+"""
+The pool.py program is designed to run one network on several Daffodil boards at once.
+
+A `Board_Pool` holds the boards (simulated or physical, in any mix), builds and programs a copy of the network on each of them, and splits a
+dataset into one contiguous shard per board. Every board is driven by its own thread. The boards spend most of an inference waiting on their
+GPIO, sysfs and ADC I/O, so the throughput grows with the number of boards. Simulated boards share the interpreter and do not run in parallel,
+but they exercise the same code paths, which makes a simulated pool usable in tests.
+
+The pool keeps health and throughput statistics for every board. A board that fails is marked unhealthy and its shard is rerun on the healthy boards.
+Any error raised while a board runs its shard is a board fault, including a `ValueError` (e.g. a garbled sysfs read or an ADC overflow). The inputs
+are checked on the host instead: the dataset before it is sharded, and the inputs of every further layer as the activation returns them. Errors of
+these checks, or of the activation itself, are raised to the caller and no board is marked unhealthy.
+"""
+
+class Board_Pool:
+    """
+    A pool of boards for data-parallel inference.
+    """
+    def __init__(self, boards):
+        """
+        Parameters
+        ----------
+        boards : list[Board.controller.Daffodil_Base]
+            The boards of the pool.
+        """
+        if len(boards) == 0:
+            raise ValueError("A board pool needs at least one board")
+        self.boards = list(boards)
+        self.networks = [None]*len(self.boards) # the layers of the network on every board, see load_network
+        self.stats = [{'samples': 0, 'busy_time': 0.0, 'errors': 0, 'last_error': None, 'healthy': True} for board in self.boards]
+
+    def healthy(self):
+        """Indices of the boards that have not failed."""
+        return [i for i, stat in enumerate(self.stats) if stat['healthy']]
+
+    def reset_health(self, i=None):
+        """Mark board `i`, or all boards, as healthy again, e.g. after a repair."""
+        for k in range(len(self.boards)) if i is None else [i]:
+            self.stats[k]['healthy'] = True
+
+    def throughput(self):
+        """Samples per second of busy time of every board, None for boards that have not run yet."""
+        return [stat['samples'] / stat['busy_time'] if stat['busy_time'] > 0 else None for stat in self.stats]
+
+    def close(self):
+        """Close every board of the pool, see `Daffodil_Phys.close`."""
+        for board in self.boards:
+            board.close()
+
+    def load_network(self, make_layers, weights, vgate):
+        """Build the network on every board and program the same weights into each copy.
+
+        Parameters
+        ----------
+        make_layers : callable
+            Called as `make_layers(board)`, it returns the list of `network_layer.Linear` layers of the network on that board.
+        weights : list[numpy.ndarray]
+            The weights of every layer, programmed with `load_weights_outerproduct_parallel`.
+        vgate : float
+            The gate voltage used for programming.
+        """
+        def load(i):
+            layers = make_layers(self.boards[i])
+            for layer, weight in zip(layers, weights):
+                layer.load_weights_outerproduct_parallel(weight, vgate)
+            self.networks[i] = layers
+
+        with ThreadPoolExecutor(max_workers=len(self.boards)) as executor:
+            for future in [executor.submit(load, i) for i in range(len(self.boards))]:
+                future.result()
+
+    def run_shard(self, i, X, activation, batch_size):
+        #runs one shard on board i and books the time, the samples and any board error against it
+        #the activation and the checks of the layer inputs it returns run on the host, their errors leave the board healthy
+        layers = self.networks[i]
+        host_errors = []
+        def checked_activation(layer_idx, currents):
+            try:
+                inputs = currents if activation is None else activation(layer_idx, currents)
+                if layer_idx + 1 < len(layers):
+                    layers[layer_idx + 1].pad_inputs(inputs) # raises on inputs that no board can run
+                return inputs
+            except Exception as e:
+                host_errors.append(e)
+                raise
+
+        start = time.perf_counter()
+        try:
+            outputs = [forward_batch(layers, X[j:j+batch_size], checked_activation) for j in range(0, len(X), batch_size)]
+        except Exception as e:
+            if not any(e is host_error for host_error in host_errors):
+                self.stats[i]['errors'] += 1
+                self.stats[i]['last_error'] = repr(e)
+                self.stats[i]['healthy'] = False
+            raise
+        finally:
+            self.stats[i]['busy_time'] += time.perf_counter() - start
+        self.stats[i]['samples'] += len(X)
+        return np.concatenate(outputs) if outputs else None
+
+    def forward(self, X, activation, batch_size=1):
+        """Run a dataset through the network, sharded across the healthy boards.
+
+        Parameters
+        ----------
+        X : list[list[float]]
+            A (samples, inputs) array of input voltages of the first layer.
+        activation : callable
+            The layer post-processing, see `network_layer.forward_batch`. It must not keep state between calls, as it is called from several threads.
+        batch_size : int
+            Number of samples every board runs kernel by kernel at a time, see `Linear.forward_batch`.
+        Returns
+        -------
+        outputs : numpy.ndarray
+            One row of network outputs per sample, in the order of `X`.
+        """
+        X = np.asarray(X, dtype=float)
+        if any(self.networks[i] is None for i in self.healthy()):
+            raise Exception("The network must be loaded on the pool first, see load_network")
+        if len(self.healthy()):
+            self.networks[self.healthy()[0]][0].pad_inputs(X) # raises on inputs that no board can run
+
+        shards = [np.arange(len(X))]
+        outputs = [None]*len(X)
+        while shards:
+            boards = self.healthy()
+            if len(boards) == 0:
+                raise Exception(f"No healthy boards left in the pool, last error: {[stat['last_error'] for stat in self.stats]}")
+            # the pending samples are split into contiguous shards, one per healthy board
+            pending = np.concatenate(shards)
+            shards = []
+            parts = np.array_split(pending, len(boards))
+            with ThreadPoolExecutor(max_workers=len(boards)) as executor:
+                futures = [executor.submit(self.run_shard, i, X[part], activation, batch_size) for i, part in zip(boards, parts)]
+            for i, part, future in zip(boards, parts, futures):
+                if future.exception() is not None and self.stats[i]['healthy']:
+                    raise future.exception() # bad inputs, the board is fine
+                if future.exception() is not None:
+                    shards.append(part) # rerun on the boards that are still healthy
+                elif len(part):
+                    for k, output in zip(part, future.result()):
+                        outputs[k] = output
+        return np.array(outputs)
+
+    def testing_forward(self, X, y, Gnorm, vread, batch_size=1):
+        """`utils.testing_forward` on the pool. The layers of every board need a `bias`, as in `testing_forward`.
+
+        Returns
+        ----------
+        acc : float
+            The classification accuracy of the network on the `(X, y)` dataset.
+        """
+        X = np.asarray(X)
+        activation = differential_activation(self.networks[self.healthy()[0]], Gnorm, vread)
+        x = self.forward(X * vread, activation, batch_size)
+        count = int(np.count_nonzero(np.argmax(x, axis=1) == np.argmax(y[:len(X)], axis=1)))
+        return count/len(X) * 100
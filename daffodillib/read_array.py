@@ -25,24 +25,42 @@ it includes
 
 """
 
-def read_kernel(board, kernel, vread, vgate, vref, weight_shape=[25, 25], xoffset=0, yoffset=0, configure=True):
+def read_kernel(board, kernel, vread, vgate, vref, weight_shape=[25, 25], xoffset=0, yoffset=0, configure=True, n_samples=1, min_stderr=None, columns=None, roi=False):
     """
     This operation is designed, in the forward pass configuration, to give you all the device conductances.
     Forward pass means applying voltage on the columns and reading out currents on the rows. 
     After specifying a kernel, a read voltage, and a gate voltage, you will get back the device conductances.
+    Each column read is averaged over `n_samples` events, see `Daffodil_Base.event_oversampled`.
+    If a list of `columns` is given, only those columns are measured and their conductances are returned, in the same order.
+    With `roi=True`, only the region of interest given by `weight_shape`, `xoffset` and `yoffset` is read: only its columns are measured
+    (unless `columns` is given), only its rows are converted to conductances, and the result has exactly the shape of the region.
     """
 
 
 
-    dac_code_read = board.dac_invertvout(vread+vref) #this converts read voltage to dac bit code
-    dac_gate_code = board.dac_invertvout(abs(vgate)) #this converts gate voltage to dac bit code
-    ref_code = board.dac_invertvout(abs(vref))
+    #the codes are converted line by line, with the channel calibration if one is loaded
+    dac_code_read = board.dac_invertvouts([vread+vref]*board.xdim, line='col').tolist() #this converts read voltage to dac bit code
+    dac_gate_code = board.dac_invertvouts([abs(vgate)]*board.xdim, line='gate').tolist() #this converts gate voltage to dac bit code
+    dac_gate_zero = board.dac_invertvouts([abs(board.vground)]*board.xdim, line='gate').tolist()
+    ref_code = board.dac_invertvout(abs(vref), line='ref')
+    col_ref_code = board.dac_invertvouts([abs(vref)]*board.xdim, line='col').tolist()
+    row_ref_code = board.dac_invertvouts([abs(vref)]*board.ydim, line='row').tolist()
 
-    vreadinvert = board.dac_calcvout(dac_code_read)-board.dac_calcvout(ref_code) #this checks that you actually are applying bias. if you use a very small value it might be rounded to zero
+    ref_voltage = board.dac_calcvout(ref_code, line='ref')
+    vreadinvert = board.dac_calcvouts(dac_code_read, line='col')-ref_voltage #this checks that you actually are applying bias. if you use a very small value it might be rounded to zero
 
-    if vreadinvert == 0: #don't have zero read voltage!
+    if np.any(vreadinvert == 0): #don't have zero read voltage!
         raise ValueError ("Cannot have zero read voltage!")
 
+    if roi:
+        if xoffset < 0 or yoffset < 0 or xoffset + weight_shape[0] > board.xdim or yoffset + weight_shape[1] > board.ydim:
+            raise ValueError(f"Region of interest {weight_shape} at ({xoffset}, {yoffset}) exceeds the {board.xdim} x {board.ydim} kernel")
+        if columns is None:
+            columns = range(xoffset, xoffset + weight_shape[0])
+        rows = slice(yoffset, yoffset + weight_shape[1]) #only these rows are converted
+    else:
+        rows = slice(0, board.ydim)
+
     board.set_kernel(kernel) #this selects the kernel
     if configure: # if you are doing a lot of reads, you might not want to configure every time
         board.setrefopamp(ref_code) #this sets the reference for the amplifiers to ref_code
@@ -58,10 +76,10 @@ def read_kernel(board, kernel, vread, vgate, vref, weight_shape=[25, 25], xoffse
     colbiases=[]
     
     for i in range(board.xdim): #we start with zeros
-        gatebiases.append(board.dac_invertvout(abs(board.vground)))
-        colbiases.append(ref_code)
+        gatebiases.append(dac_gate_zero[i])
+        colbiases.append(col_ref_code[i])
     for i in range(board.ydim):
-        rowbiases.append(ref_code)
+        rowbiases.append(row_ref_code[i])
 
 
     #everything is now set to vref
@@ -99,18 +117,17 @@ def read_kernel(board, kernel, vread, vgate, vref, weight_shape=[25, 25], xoffse
     #now we measure column by column and readout on the rows
     #only ONE column is allowed to have it's gates biased
     #for safety, we also keep unaccessed columns at zero asserted bias
-    for i in range(board.xdim):
-        gatebiases[i] = dac_gate_code #specify the gate bias
-        colbiases[i] = dac_code_read #specify the column bias
+    for i in (range(board.xdim) if columns is None else columns):
+        gatebiases[i] = dac_gate_code[i] #specify the gate bias
+        colbiases[i] = dac_code_read[i] #specify the column bias
         board.setgatedacs(gatebiases) #set the gate biases
         board.setcoldacs(colbiases) #set the column biases
-        board.event() #assert an event
-        conductances.append(board.retrievecurrents()) #add currents to the list. They are still ADC numbers
-        for p in range(board.ydim):# since we have the current ADC code numbers we need to use the voltage and the potentiometer value to make them conductances
-            conductances[i][p]=(board.adc_predict_voltage(conductances[i][p])-board.dac_calcvout(ref_code))/board.pots[p]/vreadinvert #we extract the predicted voltage, and use transimpedance+applied bias to get conductance
+        mean, std, samples = board.event_oversampled(n_samples, min_stderr) #assert an event, or several to average the noise
+        # since we have the current ADC code numbers we need to use the voltage and the potentiometer value to make them conductances
+        conductances.append(((board.adc_predict_voltage(mean[rows])-ref_voltage)/board.pots[rows]/vreadinvert[i]).tolist()) #we extract the predicted voltage, and use transimpedance+applied bias to get conductance
 
-        gatebiases[i] = board.dac_invertvout(abs(board.vground)) #we specify these again as zero bias
-        colbiases[i] = ref_code
+        gatebiases[i] = dac_gate_zero[i] #we specify these again as zero bias
+        colbiases[i] = col_ref_code[i]
     #when we leave the loop, we want to be sure to turn everything back off to zero. 
     board.setgatedacs(gatebiases) #set the gate biases
     board.setcoldacs(colbiases)
@@ -126,7 +143,7 @@ def read_all_kernels(board,vread,vgate,vref=1.7):
     configure=True #let's configure the first time
     for i in range(board.kernels):
         #let's read out all the kernels
-        kernels.append(read_kernel(board,i,vread,vgate,vref,configure))
+        kernels.append(read_kernel(board,i,vread,vgate,vref,configure=configure))
         configure = False # we don't need to configure again
 
     board.set_kernel(originalkernel)#let's go back to our original kernel 
@@ -159,9 +176,11 @@ def read_and_plot_kernels(board,vread,vgate,vref=1.7, fname='kernels.png'):
     fig.colorbar(imgplot, cax=cbar_ax)
     plt.savefig(fname)
 
-def vmm_kernel_forward(board, kernel, readvoltages, vgate, vref, weight_shape, xoffset, yoffset, configure=True, log=False):
+def vmm_kernel_forward(board, kernel, readvoltages, vgate, vref, weight_shape, xoffset, yoffset, configure=True, log=False, n_samples=1, min_stderr=None, readcodes=None):
     #This is used to perform vector matrix multiplication in the forward configuraiton. That means we assert bias on ALL the columns and read out from the rows.
     #if you submit a less than full kernel size length of readvoltages, then the remainders are set to zero. 
+    #the output currents are averaged over n_samples events, see Daffodil_Base.event_oversampled
+    #readcodes are the column DAC codes of readvoltages, if they were already converted (see Linear.prepare_inputs)
 
     disable_unused = True
 
@@ -169,17 +188,21 @@ def vmm_kernel_forward(board, kernel, readvoltages, vgate, vref, weight_shape, x
     if configure: #do we need to update our gate and column biases? if so, let's do it
         gatebiases=[] #these instantiate our lists 
         colbiases=[]
+        gate_codes = board.dac_invertvouts([abs(vgate)]*board.xdim, line='gate').tolist() #with the channel calibration if one is loaded
+        gate_zero = board.dac_invertvouts([abs(board.vground)]*board.xdim, line='gate').tolist()
 
         for i in range(board.xdim): #this sets all gate biases to the specified gate bias while also padding the colbiases layer
-            gatebiases.append(board.dac_invertvout(abs(vgate)))
+            gatebiases.append(gate_codes[i])
             colbiases.append(0) #TODO: re-check
         
+        if readcodes is None:
+            readcodes = board.dac_invertvouts(np.abs(readvoltages), line='col').tolist() #converts all the read voltages at once, with the channel calibration if one is loaded
         for p in range(len(readvoltages)): #since the colbiases layer is padded, we can send this function lists of readvoltages which are smaller than full size 
-           colbiases[p]=board.dac_invertvout(abs(readvoltages[p]))
+           colbiases[p]=readcodes[p]
 
         #you can specify a vref in the VMM function. This allows negative numbers to be multiplied into the array.
         #readvoltage values equal to vref will produce zero current and the ADC will readout a voltage of vref. 
-        ref_code = board.dac_invertvout(abs(vref))
+        ref_code = board.dac_invertvout(abs(vref), line='ref')
         board.setrefopamp(ref_code)
         #configures the forward pass and enables all rows/columns
         board.config_forward_pass()
@@ -192,14 +215,14 @@ def vmm_kernel_forward(board, kernel, readvoltages, vgate, vref, weight_shape, x
 
             for i in range(board.xdim):
                 board.COL_EN_tobe[i]=0
-                gatebiases[i]=board.dac_invertvout(abs(board.vground))
+                gatebiases[i]=gate_zero[i]
             for i in range(board.ydim):
                 board.ROW_EN_tobe[i]=0
 
             # Disable unused rows/cols from the Kernel
             for i in range(col_first, col_last):
                 board.COL_EN_tobe[i]=1
-                gatebiases[i]=board.dac_invertvout(vgate)
+                gatebiases[i]=gate_codes[i]
             for i in range(row_first, row_last):
                 board.ROW_EN_tobe[i]=1
         else:
@@ -216,9 +239,7 @@ def vmm_kernel_forward(board, kernel, readvoltages, vgate, vref, weight_shape, x
     if (log):
         print('vref', vref)
         print('readvoltages', readvoltages, len(readvoltages))
-        voltagelist = []
-        for i in colbiases:
-            voltagelist.append(board.dac_calcvout(i)-board.dac_calcvout(ref_code))
+        voltagelist = (board.dac_calcvouts(colbiases, line='col')-board.dac_calcvout(ref_code, line='ref')).tolist()
         print('colbiases', colbiases, len(colbiases))
         print('voltagelist (actual applied voltage across device)', voltagelist, len(voltagelist))
 
@@ -227,15 +248,13 @@ def vmm_kernel_forward(board, kernel, readvoltages, vgate, vref, weight_shape, x
 
         exit()
 
-    board.event() #we have an event
-
-    currents=board.retrievecurrents() #we retrieve the currents 
+    mean, std, samples = board.event_oversampled(n_samples, min_stderr) #we have an event, or several to average the noise
 
     #as mentioned above, to get the correct current, you have to extract the reference bias and then use the transimpedance to get the current
-    for y in range(len(currents)):
-        currents[y]=(board.adc_predict_voltage(currents[y])-board.adc_predict_voltage(board.dac_invertvout(abs(vref))))/board.pots[y]
+    currents=((board.adc_predict_voltage(mean)-board.adc_predict_voltage(board.dac_invertvout(abs(vref))))/board.pots[:len(mean)]).tolist()
 
-    if (board.sim_device and board.sim_device.name == 'MTJ'):
+    sim_device = getattr(board, 'sim_device', None) # Daffodil_Phys has no device model
+    if (sim_device and sim_device.name == 'MTJ'):
         # inject noise
         std = 0
         currents = np.random.normal(currents, std).tolist()
@@ -247,6 +266,24 @@ def vmm_kernel_forward(board, kernel, readvoltages, vgate, vref, weight_shape, x
     #we return the currents 
     return currents
 
+def vmm_kernel_forward_batch(board, kernel, readvoltages, vgate, vref, weight_shape, xoffset, yoffset, n_samples=1, min_stderr=None):
+    #This is vmm_kernel_forward for a batch of input vectors, one per row of readvoltages. It returns one row of currents per input.
+    #the kernel, reference, gates and enables are configured for the first input only, every further input just updates the column biases.
+    #this keeps the board on one kernel for the whole batch instead of reconfiguring it for every vector.
+    readvoltages = np.atleast_2d(readvoltages)
+    readcodes = board.dac_invertvouts(np.abs(readvoltages), line='col') #converts the read voltages of the whole batch at once
+    colbiases = np.zeros((len(readvoltages), board.xdim), dtype=int) #padded with zeros as in vmm_kernel_forward
+    colbiases[:, :readvoltages.shape[1]] = readcodes
+
+    currents = np.zeros((len(readvoltages), board.ydim))
+    currents[0] = vmm_kernel_forward(board, kernel, readvoltages[0], vgate, vref, weight_shape, xoffset, yoffset, True, n_samples=n_samples, min_stderr=min_stderr)
+    ref_voltage = board.adc_predict_voltage(board.dac_invertvout(abs(vref)))
+    for b in range(1, len(readvoltages)):
+        board.setcoldacs(colbiases[b].tolist())
+        mean, std, samples = board.event_oversampled(n_samples, min_stderr)
+        currents[b] = (board.adc_predict_voltage(mean)-ref_voltage)/board.pots[:len(mean)]
+    return currents
+
 def vmm_kernel_backward(board, kernel, readvoltages, vgate=3.3, vref=1.7, configure=True, log=False):
     #This is used to perform vector matrix multiplication in the backwards configuraiton. That means we assert bias on ALL the rows and read out from the columns.
     #if you submit a less than full kernel size length of readvoltages, then the remainders are set to zero.
@@ -255,17 +292,19 @@ def vmm_kernel_backward(board, kernel, readvoltages, vgate=3.3, vref=1.7, config
         gatebiases=[] #these instantiate our lists 
         rowbiases=[]
     
+        gate_codes = board.dac_invertvouts([abs(vgate)]*board.xdim, line='gate').tolist() #with the channel calibration if one is loaded
         for i in range(board.xdim): #this sets all gate biases to the specified gate bias while also padding the rowbiases layer
-            gatebiases.append(board.dac_invertvout(abs(vgate)))
+            gatebiases.append(gate_codes[i])
         for i in range(board.ydim):
             rowbiases.append(0)
 
+        readcodes = board.dac_invertvouts(np.abs(readvoltages), line='row').tolist() #converts all the read voltages at once, with the channel calibration if one is loaded
         for p in range(len(readvoltages)): #since the rowbiases layer is padded, we can send this function lists of readvoltages which are smaller than full size 
-           rowbiases[p]=board.dac_invertvout(abs(readvoltages[p]))
+           rowbiases[p]=readcodes[p]
 
         #you can specify a vref in the VMM function. This allows negative numbers to be multiplied into the array.
         #readvoltage values equal to vref will produce zero current and the ADC will readout a voltage of vref. 
-        ref_code = board.dac_invertvout(abs(vref))
+        ref_code = board.dac_invertvout(abs(vref), line='ref')
         board.setrefopamp(ref_code)
         #configures the forward pass and enables all rows/columns
         board.config_backward_pass()
@@ -282,18 +321,15 @@ def vmm_kernel_backward(board, kernel, readvoltages, vgate=3.3, vref=1.7, config
     if (log):
         print('vref', vref)
         print('readvoltages', readvoltages, len(readvoltages))
-        voltagelist = []
-        for i in rowbiases:
-            voltagelist.append(-board.dac_calcvout(i)+board.dac_calcvout(ref_code))
+        voltagelist = (-board.dac_calcvouts(rowbiases, line='row')+board.dac_calcvout(ref_code, line='ref')).tolist()
         print('rowbiases', rowbiases, len(rowbiases))
         print('voltagelist (actual applied voltage across device)', voltagelist, len(voltagelist))
 
     board.event() #we have an event
 
-    currents=board.retrievecurrents() #we retrieve the currents
+    currents=np.array(board.retrievecurrents()) #we retrieve the currents
     # as mentioned above, to get the correct current, you have to extract the reference bias and then use the transimpedance to get the current
-    for y in range(len(currents)):
-        currents[y]= -(board.adc_predict_voltage(currents[y])-board.adc_predict_voltage(board.dac_invertvout(abs(vref))))/board.pots[y]
+    currents= (-(board.adc_predict_voltage(currents)-board.adc_predict_voltage(board.dac_invertvout(abs(vref))))/board.pots[:len(currents)]).tolist()
 
     #we return the currents 
     return currents    
\ No newline at end of file
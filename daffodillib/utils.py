@@ -1,6 +1,7 @@
 import numpy as np
+import os
 
-def testing_forward(layers, X, y, Gnorm, vread):
+def testing_forward(layers, X, y, Gnorm, vread, batch_size=None, pipelined=False):
     """Function for performing neural network inference.
 
     Parameters
@@ -11,6 +12,11 @@ def testing_forward(layers, X, y, Gnorm, vread):
         Dataset features.
     y : list[float]
         Dataset labels.
+    batch_size : int, optional
+        If given, the samples are run `batch_size` at a time with the kernel-major schedule of `network_layer.forward_batch`,
+        which selects and configures every kernel once per batch instead of once per sample.
+    pipelined : bool
+        If True, the samples are run with `pipeline.Pipelined_Forward`, which post-processes the layer outputs on a worker thread while the board runs other samples.
 
     Returns
     ----------
@@ -20,6 +26,20 @@ def testing_forward(layers, X, y, Gnorm, vread):
     vread_forward = vread
     count = 0
     test_sample_num = X.shape[0]
+    activation = differential_activation(layers, Gnorm, vread)
+    if pipelined:
+        from daffodillib.pipeline import Pipelined_Forward
+        x = Pipelined_Forward(layers, activation).run(X * vread_forward)
+        count = int(np.count_nonzero(np.argmax(x, axis=1) == np.argmax(y[:test_sample_num], axis=1)))
+        return count/test_sample_num * 100
+    if batch_size is not None:
+        from daffodillib.network_layer import forward_batch
+        for j in range(0, test_sample_num, batch_size):
+            print(f'Sample {j}/{test_sample_num}')
+            x = forward_batch(layers, X[j:j+batch_size] * vread_forward, activation)
+            count += int(np.count_nonzero(np.argmax(x, axis=1) == np.argmax(y[j:j+batch_size], axis=1)))
+        return count/test_sample_num * 100
+
     for j in range(test_sample_num):
         if (j%len(y)//3==0):
             print(f'Sample {j}/{test_sample_num}')
@@ -40,9 +60,24 @@ def testing_forward(layers, X, y, Gnorm, vread):
     acc = count/test_sample_num * 100
     return acc
 
+def differential_activation(layers, Gnorm, vread):
+    """The layer post-processing of `testing_forward`, as an activation for `network_layer.forward_batch` and `pipeline.Pipelined_Forward`.
+
+    The outputs of every layer are taken as differential pairs of rows, scaled by `Gnorm * vread`, offset by the layer bias and passed through tanh.
+    The result is scaled by `vread` again to be the input voltages of the next layer, except for the last layer.
+    """
+    def activation(layer_idx, x):
+        x = (x[:, ::2] - x[:, 1::2]) # assume differential block mode of mapping in each layer
+        x = np.tanh(x / (Gnorm * vread) + layers[layer_idx].bias)
+        return x * vread if layer_idx < len(layers) - 1 else x
+    return activation
+
 # Helper functions for binding ADC/DAC/DPOT part classes to corresponding hardware interfaces
+sysfs_root = '/sys' # can be pointed at a stand-in tree, see Board.emulator
+dev_root = '/dev' # location of the IIO buffer character devices
+
 def find_device_iio(n):
-    directory = '/sys/bus/iio/devices/iio:device' + str(n)
+    directory = sysfs_root + '/bus/iio/devices/iio:device' + str(n)
     try:
         with open(directory + '/name') as f:
             f.read()
@@ -51,10 +86,35 @@ def find_device_iio(n):
     return directory
 
 def find_device_spi(n):
-    directory = '/sys/bus/spi/devices/spi13.' + str(n)
+    directory = sysfs_root + '/bus/spi/devices/spi13.' + str(n)
     try:
         with open(directory + '/modalias') as f:
             f.read()
     except:
         raise Exception("Could not find spi device number {}".format(n))
-    return directory
\ No newline at end of file
+    return directory
+
+class Sysfs_File:
+    """A sysfs attribute that is opened once and kept open.
+
+    Reads and writes go through `os.pread`/`os.pwrite` at offset 0, so each access is a single syscall instead of open/access/close.
+    The last value written is cached, and `write(value, force=False)` skips the syscall when the attribute already holds `value`.
+    """
+    def __init__(self, fname, flags=os.O_RDWR):
+        self.fname = fname
+        self.fd = os.open(fname, flags)
+        self.value = None # unknown until the first write
+
+    def write(self, value, force=True):
+        if not force and value == self.value:
+            return
+        os.pwrite(self.fd, (str(value) + '\n').encode('utf-8'), 0)
+        self.value = value
+
+    def read(self):
+        return int(os.pread(self.fd, 32, 0).split(b'\n')[0])
+
+    def close(self):
+        if getattr(self, 'fd', None) is not None:
+            os.close(self.fd)
+            self.fd = None
\ No newline at end of file
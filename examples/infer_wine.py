@@ -29,7 +29,7 @@ if __name__ == '__main__':
     if (sim): 
         board = controller.Daffodil_Sim('Generic')
         board.sim_device.dpot_r = dpot_r
-    else: board=controller.Daffodil_Phys()
+    else: board=controller.Daffodil_Phys(serial='1304917') # the serial selects the DPOT calibration of the board
 
     board.set_dac_gain_mode(4093)
     board.set_dac_offset(0)
@@ -37,7 +37,7 @@ if __name__ == '__main__':
     Ds = board.invert_dpot_rout(dpot_r)
     board.set_dpot_D(Ds)
     board.set_compliance_control(1)
-    board.setrefopamp(board.dac_invertvout(abs(vref)))
+    board.setrefopamp(board.dac_invertvout(abs(vref), line='ref'))
     
     # Network parameters
     # The pre-trained solutions are for a two layer perceptron network with dimensions 13 x 6 x 3
@@ -99,7 +99,7 @@ if __name__ == '__main__':
         layer2.load_weights_outerproduct_parallel(weight2, vgate=vgate)
 
         # Required, as weight loading may have altered the reference voltage
-        board.setrefopamp(board.dac_invertvout(abs(vref)))
+        board.setrefopamp(board.dac_invertvout(abs(vref), line='ref'))
 
         # Plot layers
         if (plot):
@@ -111,8 +111,12 @@ if __name__ == '__main__':
             layer2.plot_weights(vread, vref, slice=True)
             plt.savefig(f'plots/fc2_sim{sim}_solution{solution}.png')
 
+        # Every Gnorm is evaluated from the same programmed state
+        if (sim): programmed = board.snapshot()
+
         for Gnorm_idx in range(len(Gnorms)):
             print('\nGnorm:', Gnorms[Gnorm_idx], Gnorms_normalized[Gnorm_idx])
+            if (sim): board.restore(programmed)
             # Get accuracy estimate
             acc = testing_forward(layers, X_train, Y_train, Gnorms[Gnorm_idx], vread)
             print(f'Network Acc: {acc}')
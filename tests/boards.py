@@ -0,0 +1,61 @@
+"""
+Board setups shared by the tests, at the operating point of examples/infer_wine.py (also used by benchmarks/conftest.py).
+"""
+
+import numpy as np
+from pathlib import Path
+
+from daffodillib.Board import controller, emulator
+from daffodillib import network_layer
+
+wine_dir = Path(__file__).resolve().parent.parent / 'examples' / 'wine'
+
+vgate = 5
+vread = 0.1
+vref = 1.7 + vread
+vset = 0.8
+vreset = 0.8
+dpot_r = 2*10**3
+
+def configure(board):
+    board.set_dac_gain_mode(4093)
+    board.set_dac_offset(0)
+    board.set_dpot_D(board.invert_dpot_rout(dpot_r))
+    board.set_compliance_control(1)
+    board.setrefopamp(board.dac_invertvout(abs(vref), line='ref'))
+    return board
+
+def make_sim_board(name='Generic', **device_args):
+    board = controller.Daffodil_Sim(name, **device_args)
+    board.sim_device.dpot_r = dpot_r
+    return configure(board)
+
+def make_phys_board(adc_noise=0, seed=None):
+    # a Daffodil_Phys on the emulated hardware, close it when done
+    return configure(emulator.make_phys_board('Generic', dpot_r=dpot_r, adc_noise=adc_noise, seed=seed))
+
+def make_layers(board):
+    layer1 = network_layer.Linear(board, shape=[1, 1], weight_shape=(13, 12), vread=vread, vset=vset, vreset=vreset, vref=vref, vgate=vgate, encoding='forward', mode='block', offsets=[(0, 11, 12)])
+    layer2 = network_layer.Linear(board, shape=[1, 1], weight_shape=(6, 6), vread=vread, vset=vset, vreset=vreset, vref=vref, vgate=vgate, encoding='forward', mode='block', offsets=[(1, 0, 0)])
+    layer1.bias = np.loadtxt(wine_dir / 'solutions' / '0_fc1_bias.txt')
+    layer2.bias = np.loadtxt(wine_dir / 'solutions' / '0_fc2_bias.txt')
+    return [layer1, layer2]
+
+def load_weights():
+    return [np.loadtxt(wine_dir / 'solutions' / '0_fc1_weight.txt'), np.loadtxt(wine_dir / 'solutions' / '0_fc2_weight.txt')]
+
+def make_network(board):
+    # the wine network, programmed
+    layers = make_layers(board)
+    for layer, weight in zip(layers, load_weights()):
+        layer.load_weights_outerproduct_parallel(weight, vgate=vgate)
+    board.setrefopamp(board.dac_invertvout(abs(vref), line='ref'))
+    return layers
+
+def load_dataset():
+    X = np.loadtxt(wine_dir / 'dataset' / 'X_train.txt').T
+    Y = np.loadtxt(wine_dir / 'dataset' / 'Y_train.txt').T
+    return X, Y
+
+def Gnorm(board):
+    return (board.sim_device.setG - board.sim_device.resetG) / board.sim_device.currentscale
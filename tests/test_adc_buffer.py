@@ -0,0 +1,153 @@
+"""
+IIO triggered-buffer readout of the ADS7950 ADCs, on the emulated Daffodil_Phys.
+"""
+
+import os
+import asyncio
+import threading
+import numpy as np
+import pytest
+from types import SimpleNamespace
+
+from daffodillib import read_array, outerproduct
+from daffodillib.Board import controller
+from daffodillib.Board.aio import Async_Board
+from daffodillib.Board.Components.ADS7950SBDBT import parse_scan_type
+from daffodillib.Board.emulator import Sysfs_Emu
+
+from boards import make_phys_board, vgate, vread, vref, vset, vreset
+
+@pytest.fixture
+def board():
+    board = make_phys_board()
+    yield board
+    board.close()
+
+def test_parse_scan_type():
+    assert parse_scan_type('be:u12/16>>0') == (np.dtype('>u2'), 12, 0)
+    assert parse_scan_type('le:u12/16>>4\n') == (np.dtype('<u2'), 12, 4)
+    assert parse_scan_type('be:s12/16>>4') == (np.dtype('>i2'), 12, 4)
+    assert parse_scan_type('le:s64/64>>0') == (np.dtype('<i8'), 64, 0)
+    assert parse_scan_type('le:s12/16X2>>0') == (np.dtype('<i2'), 12, 0)
+    with pytest.raises(ValueError):
+        parse_scan_type('be:f32/32>>0')
+
+def test_buffered_read_matches_sysfs(board):
+    reference = read_array.read_kernel(board, 0, vread, vgate, vref)
+    board.enable_adc_buffer(3, Sysfs_Emu.trigger_name)
+    buffered = read_array.read_kernel(board, 0, vread, vgate, vref)
+    assert buffered == reference
+    samples, timestamps = board.retrieve_adc_samples()
+    assert samples.shape == (3, board.xdim) and timestamps.shape == (3, len(board.adcs))
+
+def test_one_scan_per_trigger(board):
+    board.enable_adc_buffer(3, Sysfs_Emu.trigger_name)
+    sysfs = board.PGPIO.sysfs
+    # buffer/length is the capacity of the ring buffer, not the scans of an event
+    assert all(sysfs.read_int(d + '/buffer/length') >= 3 for d in sysfs.adc_dirs)
+
+    sizes = [os.path.getsize(dev) for dev in sysfs.adc_devs]
+    board.PGPIO.write_int(sysfs.trigger_now, 1)
+    assert [os.path.getsize(dev) for dev in sysfs.adc_devs] == [size + sysfs.scan_dtype.itemsize for size in sizes]
+
+    # a read event fires the trigger once per scan
+    triggers = board.PGPIO.triggers
+    read_array.read_kernel(board, 0, vread, vgate, vref, columns=[0, 1])
+    assert board.PGPIO.triggers == triggers + 2*3
+
+def test_trigger_firing_on_its_own(board):
+    # a trigger without trigger_now, e.g. an hrtimer trigger, is not fired by the board: the read waits for the scans until it times out
+    sysfs = board.PGPIO.sysfs
+    sysfs.write(sysfs.make_dir('bus/iio/devices/trigger1') + '/name', 'hrtimer0')
+    with pytest.raises(ValueError, match='trigger'):
+        board.adcs[0].enable_buffer(2)
+    board.enable_adc_buffer(2, 'hrtimer0')
+    assert board.adc_trigger_now is None
+    for adc in board.adcs:
+        adc.buffer_timeout = 0.05
+    with pytest.raises(Exception, match='0 of 2 scans'):
+        read_array.read_kernel(board, 0, vread, vgate, vref, columns=[0])
+
+def test_write_events_leave_no_scans(board):
+    board.enable_adc_buffer(2, Sysfs_Emu.trigger_name)
+    sizes = [os.path.getsize(dev) for dev in board.PGPIO.sysfs.adc_devs]
+    cols = [0]*board.xdim
+    cols[0] = -1
+    board.set_kernel(0)
+    outerproduct.outer_product(board, vset, vreset, vgate, [1, -1]*12 + [1], cols)
+    assert [os.path.getsize(dev) for dev in board.PGPIO.sysfs.adc_devs] == sizes
+
+def test_flush_drops_stale_scans(board):
+    reference = read_array.read_kernel(board, 0, vread, vgate, vref)
+    board.enable_adc_buffer(2, Sysfs_Emu.trigger_name)
+
+    # scans left over from an earlier capture, e.g. of a trigger fired outside of a read event
+    sysfs = board.PGPIO.sysfs
+    stale = np.zeros(5, dtype=sysfs.scan_dtype)
+    for i in range(4):
+        stale['in_voltage{}'.format(i)] = 4095
+    for dev in sysfs.adc_devs:
+        with open(dev, 'ab') as f:
+            f.write(stale.tobytes())
+
+    board.flush_adc_buffer()
+    assert all(os.read(adc.buffer_file, sysfs.scan_dtype.itemsize) == b'' for adc in board.adcs)
+
+    # read events flush by themselves
+    for dev in sysfs.adc_devs:
+        with open(dev, 'ab') as f:
+            f.write(stale.tobytes())
+    assert read_array.read_kernel(board, 0, vread, vgate, vref) == reference
+
+def test_settle_wait(board, monkeypatch):
+    read_array.read_kernel(board, 0, vread, vgate, vref, columns=[0]) # leaves the board in the read configuration
+    waits = []
+    monkeypatch.setattr(controller, 't', SimpleNamespace(sleep=lambda s: waits.append((s, board.PGPIO.triggers))))
+
+    board.event_timevariant(100)
+    assert waits == [(board.adc_settle_time, 0)]
+    reference = list(board.adcs[0].registers)
+
+    # the sysfs trigger is fired after the wait
+    board.enable_adc_buffer(2, Sysfs_Emu.trigger_name)
+    triggers = board.PGPIO.triggers
+    board.event_timevariant(100)
+    assert waits[1:] == [(board.adc_settle_time, triggers)] and board.PGPIO.triggers == triggers + 2
+    assert board.adcs[0].registers == reference
+
+    # write pulses are not read
+    board.event_timevariant(100, write=True)
+    assert len(waits) == 2
+
+    aboard = Async_Board(board)
+    async def await_settle(t):
+        waits.append((t, board.PGPIO.triggers))
+    aboard.await_settle = await_settle
+    triggers = board.PGPIO.triggers
+    asyncio.run(aboard.aevent_timevariant(100))
+    assert waits[2:] == [(board.adc_settle_time, triggers)] and board.PGPIO.triggers == triggers + 2
+
+def test_settle_wait_trigger_firing_on_its_own(board, monkeypatch):
+    read_array.read_kernel(board, 0, vread, vgate, vref, columns=[0])
+    monkeypatch.setattr(controller, 't', SimpleNamespace(sleep=lambda s: None))
+    board.event_timevariant(100)
+    reference = list(board.adcs[0].registers)
+    sysfs = board.PGPIO.sysfs
+    sysfs.write(sysfs.make_dir('bus/iio/devices/trigger1') + '/name', 'hrtimer0')
+    sysfs.trigger_name = 'hrtimer0' # the emulated trigger captures the scans of the ADCs attached to hrtimer0
+    board.enable_adc_buffer(1, 'hrtimer0')
+
+    def sleep(s):
+        # scans captured while the outputs settle, and one once they have settled
+        stale = np.zeros(3, dtype=sysfs.scan_dtype)
+        for i in range(4):
+            stale['in_voltage{}'.format(i)] = 4095
+        for dev in sysfs.adc_devs:
+            with open(dev, 'ab') as f:
+                f.write(stale.tobytes())
+        threading.Timer(0.02, board.PGPIO.trigger).start()
+    monkeypatch.setattr(controller, 't', SimpleNamespace(sleep=sleep))
+
+    board.event_timevariant(100)
+    assert board.PGPIO.triggers == 1
+    assert board.adcs[0].registers == reference
@@ -0,0 +1,56 @@
+"""
+Board.aio: two Daffodil_Sim boards driven concurrently from one event loop, against the synchronous IVcurve routines.
+"""
+
+import asyncio
+import numpy as np
+
+from daffodillib import IVcurve, read_array
+from daffodillib.Board import aio
+
+from boards import make_sim_board, vgate, vread, vref
+
+pulses = [(1.7, 2.5), (2.5, 1.7), (1.7, 2.5)] # (column, row) voltages of a SET, a RESET and a SET
+devices = [(4, 6), (10, 2)] # one device per board
+
+def codes(board):
+    inv = board.dac_invertvout
+    return inv(1.7), inv(abs(vref)), inv(4.9), inv(abs(vref) + vread)
+
+def measure(board, x, y):
+    ground_code, ref_code, gate_code, read_code = codes(board)
+    board.set_kernel(3)
+    board.setrefopamp(ref_code)
+    currents = []
+    for vcol, vrow in pulses:
+        board.config_outerproduct()
+        IVcurve.program(board.dac_invertvout(vcol), board.dac_invertvout(vrow), gate_code, x, y, 100, ground_code, board, ref_code)
+        currents.append(IVcurve.read_device(read_code, ground_code, gate_code, x, y, 100, ground_code, board, ref_code))
+    return currents
+
+async def ameasure(aboard, x, y, log):
+    ground_code, ref_code, gate_code, read_code = codes(aboard)
+    async with aboard.lock:
+        aboard.set_kernel(3)
+        await aboard.aset_ref_opamp(ref_code)
+        currents = []
+        for vcol, vrow in pulses:
+            aboard.config_outerproduct()
+            await aio.aprogram(aboard.dac_invertvout(vcol), aboard.dac_invertvout(vrow), gate_code, x, y, 100, ground_code, aboard, ref_code)
+            currents.append(await aio.aread_device(read_code, ground_code, gate_code, x, y, 100, ground_code, aboard, ref_code))
+            log.append(x)
+    return currents
+
+def test_concurrent_boards():
+    references = [make_sim_board() for xy in devices]
+    expected = [measure(board, x, y) for board, (x, y) in zip(references, devices)]
+    assert all(len(set(currents)) == 2 for currents in expected) # the pulses switched the devices
+
+    boards = [make_sim_board() for xy in devices]
+    log = []
+    async def main():
+        return await asyncio.gather(*[ameasure(aio.Async_Board(board), x, y, log) for board, (x, y) in zip(boards, devices)])
+    assert asyncio.run(main()) == expected
+    assert log == [4, 10]*len(pulses) # the boards took turns
+    for board, reference in zip(boards, references):
+        np.testing.assert_array_equal(read_array.read_kernel(board, 3, vread, vgate, vref), read_array.read_kernel(reference, 3, vread, vgate, vref))
@@ -0,0 +1,49 @@
+"""
+Kernel-major batch execution (Linear.forward_batch, network_layer.forward_batch, read_array.vmm_kernel_forward_batch)
+against per-sample forward passes of the wine network on a Daffodil_Sim.
+"""
+
+import numpy as np
+import pytest
+
+from daffodillib import read_array, network_layer, utils
+
+from boards import make_sim_board, make_network, load_dataset, Gnorm, vgate, vread, vref
+
+@pytest.fixture
+def layers():
+    return make_network(make_sim_board())
+
+@pytest.fixture
+def X():
+    return load_dataset()[0][:7] * vread
+
+def test_vmm_kernel_forward_batch(layers, X):
+    layer = layers[0]
+    vectors = layer.pad_inputs(X)
+    batch = read_array.vmm_kernel_forward_batch(layer.board, 0, vectors, vgate, vref, layer.weight_shape, layer.xoffset, layer.yoffset)
+    assert batch.shape == (len(X), layer.board.ydim)
+    for vector, currents in zip(vectors, batch):
+        np.testing.assert_array_equal(currents, read_array.vmm_kernel_forward(layer.board, 0, vector, vgate, vref, layer.weight_shape, layer.xoffset, layer.yoffset))
+
+def test_linear_forward_batch(layers, X):
+    batch = layers[0].forward_batch(X)
+    assert batch.shape == (len(X), layers[0].weight_shape[1])
+    np.testing.assert_array_equal(batch, [layers[0].forward_pass(x) for x in X])
+    # a single input vector is a batch of one
+    np.testing.assert_array_equal(layers[0].forward_batch(X[0]), [layers[0].forward_pass(X[0])])
+
+def test_network_forward_batch(layers, X):
+    activation = utils.differential_activation(layers, Gnorm(layers[0].board), vread)
+    expected = []
+    for x in X:
+        for layer_idx, layer in enumerate(layers):
+            x = activation(layer_idx, np.array(layer.forward_pass(x))[None])[0]
+        expected.append(x)
+    np.testing.assert_array_equal(network_layer.forward_batch(layers, X, activation), expected)
+
+def test_testing_forward(layers):
+    X, Y = load_dataset()
+    X, Y = X[:12], Y[:12]
+    accuracy = utils.testing_forward(layers, X, Y, Gnorm(layers[0].board), vread)
+    assert utils.testing_forward(layers, X, Y, Gnorm(layers[0].board), vread, batch_size=5) == accuracy
@@ -0,0 +1,54 @@
+"""
+The conductance cache of network_layer.Linear (read_kernel_cached, mark_dirty, invalidate_cache) on a Daffodil_Sim.
+"""
+
+import numpy as np
+import pytest
+
+from daffodillib import read_array
+
+from boards import make_sim_board, make_network, vgate, vread, vref
+
+@pytest.fixture
+def layer():
+    return make_network(make_sim_board())[0] # 13 x 12 at (11, 12) of kernel 0
+
+def test_one_column_update(layer):
+    board = layer.board
+    before = layer.read_kernel_cached(0, vread, vref)
+    assert layer.cache_stats == {'hits': 0, 'misses': board.xdim}
+
+    # SET and RESET alternate devices of the third input column of the layer
+    xvector = [0]*13
+    xvector[2] = -1
+    layer.out_prod_update([1, -1]*6, xvector, vgate)
+    assert layer.cache[0]['dirty'].any(axis=1).sum() == 1
+
+    after = layer.read_kernel_cached(0, vread, vref)
+    assert layer.cache_stats == {'hits': board.xdim - 1, 'misses': board.xdim + 1}
+    np.testing.assert_array_equal(after, read_array.read_kernel(board, 0, vread, vgate, vref))
+    changed = np.flatnonzero((after != before).any(axis=1))
+    assert changed.tolist() == [13]
+
+    # a cached read of an unchanged kernel measures nothing
+    layer.read_kernel_cached(0, vread, vref)
+    assert layer.cache_stats['misses'] == board.xdim + 1
+
+    layer.invalidate_cache()
+    np.testing.assert_array_equal(layer.read_kernel_cached(0, vread, vref), after)
+    assert layer.cache_stats['misses'] == 2*board.xdim + 1
+
+def test_settings_change(layer):
+    board = layer.board
+    layer.read_kernel_cached(0, vread, vref)
+    layer.read_kernel_cached(0, vread/2, vref) # other read voltages measure the whole kernel
+    assert layer.cache_stats == {'hits': 0, 'misses': 2*board.xdim}
+
+def test_mark_dirty(layer):
+    board = layer.board
+    layer.mark_dirty(0, [1], [1]) # nothing cached yet
+    assert layer.cache == {}
+    layer.read_kernel_cached(0, vread, vref)
+    layer.mark_dirty(0, [4, 7], [0])
+    layer.read_kernel_cached(0, vread, vref)
+    assert layer.cache_stats == {'hits': board.xdim - 2, 'misses': board.xdim + 2}
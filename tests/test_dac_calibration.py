@@ -0,0 +1,88 @@
+"""
+Per-channel DAC calibration of `Daffodil_Sim`, whose simulated DACs follow the loaded calibration.
+"""
+
+import numpy as np
+import pytest
+
+from daffodillib import read_array, outerproduct, IVcurve
+
+from boards import make_sim_board, vread, vref, vset, vreset
+
+lsb = 5 / 4096 # one DAC code at the operating point
+vgate = 4.9 # the nearest code to 5 V overshoots the gate limit on channels with a gain above 1
+
+@pytest.fixture
+def calibration(tmp_path):
+    # a gain and offset error on every one of the 80 DAC channels, up to a few tens of codes at the read biases
+    k = np.arange(80)
+    fname = tmp_path / 'dacs.txt'
+    np.savetxt(fname, np.column_stack([1 + 0.01*np.sin(k), 0.015*np.cos(3*k)]))
+    return str(fname)
+
+def make_boards(calibration):
+    # an ideal board and a board with non-ideal DACs, holding the same programmed kernel
+    boards = []
+    for calibrated in [False, True]:
+        board = make_sim_board()
+        if calibrated:
+            board.load_dac_calibration(calibration)
+            board.setrefopamp(board.dac_invertvout(abs(vref), line='ref'))
+        outerproduct.outer_product(board, vset, vreset, vgate, [1, -1, 2, 1]*3, [2, 1, -1]*4)
+        boards.append(board)
+    return boards
+
+def applied_voltages(board):
+    # the voltages across the devices in the last event, columns minus rows
+    return np.subtract.outer(board.sim_device.columnvoltages, board.sim_device.rowvoltages)
+
+def test_reference(calibration):
+    ideal, board = make_boards(calibration)
+    # the ideal code misses the reference by more than a code, the calibrated one does not
+    assert abs(board.dac_calcvout(ideal.dac_invertvout(vref), line='ref') - vref) > lsb
+    assert abs(board.curr_vref - vref) < lsb
+    assert abs(board.dacs[1].all_channels[9].vout - vref) < lsb
+
+def test_vmm_forward_applies_requested_voltages(calibration):
+    ideal, board = make_boards(calibration)
+    readvoltages = vref + np.linspace(-0.09, 0.1, board.xdim) # within half a code of 1.7 V the nearest code may be below it
+    read_array.vmm_kernel_forward(board, 0, readvoltages, vgate, vref, [board.xdim, board.ydim], 0, 0)
+
+    # without the calibration, the codes would be off by more than a code on some columns
+    uncorrected = board.dac_calcvouts(ideal.dac_invertvouts(readvoltages), line='col') - readvoltages
+    assert np.abs(uncorrected).max() > 2*lsb
+    np.testing.assert_allclose(applied_voltages(board), (readvoltages - vref)[:, None] * np.ones(board.ydim), atol=lsb)
+
+def test_read_kernel_matches_ideal_board(calibration):
+    ideal, board = make_boards(calibration)
+    expected = np.array(read_array.read_kernel(ideal, 0, vread, vgate, vref))
+    np.testing.assert_allclose(read_array.read_kernel(board, 0, vread, vgate, vref), expected, rtol=0.02)
+    # the last column read had the read voltage applied across it
+    np.testing.assert_allclose(applied_voltages(board)[-1], vread, atol=lsb)
+
+def test_codes_checked_against_calibrated_window(calibration):
+    ideal, board = make_boards(calibration)
+    board.config_forward_pass()
+    # the ideal code of a voltage just above ground is legal, but drives some calibrated columns below ground
+    code = ideal.dac_invertvout(board.vground + 0.01)
+    low = board.dac_calcvouts([code]*board.xdim, line='col') < board.vground
+    assert low.any()
+    ideal.config_forward_pass()
+    ideal.setcoldacs([code]*ideal.xdim)
+    with pytest.raises(ValueError, match='Column Bias') as e:
+        board.setcoldacs([code]*board.xdim)
+    assert str(np.flatnonzero(low).tolist()) in str(e.value)
+    board.setcoldacs(board.dac_invertvouts([board.vground + 0.01]*board.xdim, line='col').tolist())
+
+def test_ivsweep_reports_applied_voltages(tmp_path):
+    # offsets only upwards, as the unselected gates of IVsweep_parallel are held at the ideal code of ground
+    k = np.arange(80)
+    fname = tmp_path / 'dacs.txt'
+    np.savetxt(fname, np.column_stack([np.ones(80), 0.002 + 0.01*(1 + np.cos(3*k))]))
+    board = make_sim_board()
+    board.load_dac_calibration(str(fname))
+    voltages, currents = IVcurve.IVsweep_parallel(board, 0, 3, vref + 0.05, vref + 0.2, 20, vgate, vref)
+    # the loop ends at the start voltage, which was the last one applied
+    applied = applied_voltages(board)[3]
+    np.testing.assert_allclose(applied, voltages[-1], atol=1e-4)
+    assert abs(board.dac_calcvout(board.dac_invertvout(vref + 0.05)) - board.dac_calcvout(board.dac_invertvout(vref)) - applied[0]) > 2*lsb
@@ -0,0 +1,70 @@
+"""
+Bias checks of the bulk DAC setters (Daffodil_Base.check_dac_codes) and their error messages.
+"""
+
+import pytest
+
+from daffodillib.Board import controller
+
+from boards import make_sim_board
+
+@pytest.fixture
+def board():
+    board = make_sim_board()
+    board.config_forward_pass()
+    return board
+
+def codes(board, v, overrides={}):
+    # the codes of v on every line, except for the {line: voltage} overrides
+    codes = [board.dac_invertvout(v)]*board.xdim
+    for i, vi in overrides.items():
+        codes[i] = board.dac_invertvout(vi)
+    return codes
+
+def test_valid(board):
+    board.setcoldacs(codes(board, 2.0))
+    board.setcoldacs([0]*board.xdim) # inactive lines
+    board.setgatedacs(codes(board, 4.9))
+    board.setrowdacs(codes(board, 1.0)) # rows are not checked in the forward pass
+
+def test_bias_messages(board):
+    board.setcoldacs(codes(board, 2.0))
+    written = board.retreivecolvoltages()
+    with pytest.raises(ValueError, match=r'^Column Bias cannot be lower than 1\.7V\. Offending col channels: \[3, 9\]$'):
+        board.setcoldacs(codes(board, 2.5, {3: 1.0, 9: 1.2}))
+    assert board.retreivecolvoltages() == written # nothing is written
+    with pytest.raises(ValueError, match=r'^Gate Bias cannot be lower than 1\.7V\. Offending gate channels: \[5\]$'):
+        board.setgatedacs(codes(board, 4.0, {5: 1.0}))
+    with pytest.raises(ValueError, match=r'^Gate Bias cannot be lower than 1\.7V\. Offending gate channels: \[5\]$'):
+        board.setgatedac_channel(board.dac_invertvout(1.0), 5)
+    # fractional codes are checked on their voltages
+    with pytest.raises(ValueError, match=r'Offending col channels: \[0, 1, 2\]$'):
+        board.setcoldacs([1000.5]*3)
+    with pytest.raises(ValueError, match='x1 can only be from 0 to 4095'):
+        board.setcoldacs([5000]*3)
+
+    board.config_backward_pass()
+    board.setcoldacs(codes(board, 1.0))
+    with pytest.raises(ValueError, match=r'^Row Bias cannot be lower than 1\.7V\. Offending row channels: \[24\]$'):
+        board.setrowdacs(codes(board, 2.0, {24: 1.0}))
+
+def test_message_order(board):
+    board.curr_vref = 1.0 # below the range setrefopamp allows, so that 3.3 V drops can be reached
+    drop = 'Applied voltage across the chip cannot be greater than 3.3V. Offending col channels: '
+    bias = 'Column Bias cannot be lower than 1.7V. Offending col channels: '
+    # the error of the first offending channel comes first
+    with pytest.raises(ValueError) as error:
+        board.setcoldacs(codes(board, 2.0, {3: 1.2, 7: 4.5, 20: 4.6}))
+    assert str(error.value) == bias + '[3] ' + drop + '[7, 20]'
+    with pytest.raises(ValueError) as error:
+        board.setcoldacs(codes(board, 2.0, {0: 4.5, 1: 1.2, 7: 4.5}))
+    assert str(error.value) == drop + '[0, 7] ' + bias + '[1]'
+    with pytest.raises(ValueError) as error:
+        board.setcoldac_channel(board.dac_invertvout(4.5), 7)
+    assert str(error.value) == drop + '[7]'
+
+def test_vref_unset():
+    board = controller.Daffodil_Sim('Generic')
+    board.config_forward_pass()
+    with pytest.raises(ValueError, match='vref must be set'):
+        board.setcoldacs([2000]*3)
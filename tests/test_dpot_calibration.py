@@ -0,0 +1,56 @@
+"""
+DPOT calibration of Daffodil_Phys, on the emulated hardware.
+"""
+
+import numpy as np
+import pytest
+
+from daffodillib import utils
+from daffodillib.Board import emulator
+from daffodillib.Board.controller import Daffodil_Phys
+from daffodillib.Board.Components.AD8403 import AD8403_Calibration, AD8403_Sim
+
+from boards import make_phys_board
+
+def test_default_serial(tmp_path, monkeypatch):
+    # without arguments, the DPOTs are calibrated with the file of the default serial, as before serials could be selected
+    calib_dir = tmp_path / 'misc' / 'dpots'
+    calib_dir.mkdir(parents=True)
+    monkeypatch.setattr(AD8403_Calibration, 'calib_dir', str(calib_dir))
+    with pytest.raises(ValueError, match='serial 1304917'):
+        Daffodil_Phys(PGPIO=object()) # raises before the PGPIO is used
+
+    sysfs = emulator.Sysfs_Emu(str(tmp_path / 'sysfs'))
+    (calib_dir / '1304917.txt').write_text(open(sysfs.calib_file).read())
+    monkeypatch.setattr(utils, 'sysfs_root', sysfs.root)
+    monkeypatch.setattr(utils, 'dev_root', sysfs.dev_dir)
+    with Daffodil_Phys(PGPIO=emulator.PGPIO_Emu(sysfs, 'Generic')) as board:
+        assert board.serial == '1304917'
+        assert board.dpots[0].calibration is AD8403_Calibration.for_serial('1304917')
+    with pytest.raises(ValueError, match='serial 42'):
+        Daffodil_Phys(PGPIO=object(), serial='42')
+
+def test_calibrated():
+    board = make_phys_board()
+    try:
+        assert board.dpots[0].calibration is AD8403_Calibration.get(board.PGPIO.sysfs.calib_file)
+        # the emulator's calibration file follows the ideal transfer curve
+        ideal = AD8403_Sim(0)
+        D = [[10, 100, 200, 255]]*len(board.dpots)
+        board.set_dpot_D(D)
+        np.testing.assert_allclose(board.dpots[3].calcrout(), ideal.predictcalcrouts(D[3]))
+        codes = board.invert_dpot_rout(2000)
+
+        for dpot in board.dpots:
+            dpot.calibration = None
+            for channel in dpot.all_channels:
+                channel.table = None
+        with pytest.raises(ValueError, match='calibrated'):
+            board.dpots[0].all_channels[0].invertrout(2000)
+        with pytest.raises(ValueError, match='calibrated'):
+            board.invert_dpot_rout(2000)
+
+        board.load_dpot_calibration(board.PGPIO.sysfs.calib_file)
+        assert board.invert_dpot_rout(2000) == codes
+    finally:
+        board.close()
@@ -0,0 +1,60 @@
+"""
+The vectorized DPOT interface of the board (pots, invert_dpot_rout, set_dpot_D) against the per-channel conversions.
+"""
+
+import numpy as np
+import pytest
+
+from boards import make_sim_board, make_phys_board, dpot_r
+
+def channel_pots(board):
+    return -np.array([c.predictcalcrout() for dpot in board.dpots for c in dpot.all_channels])[:max(board.xdim, board.ydim)]
+
+@pytest.fixture(params=['sim', 'phys'])
+def board(request):
+    if request.param == 'sim':
+        yield make_sim_board()
+    else:
+        with make_phys_board() as board:
+            yield board
+
+def test_pots(board):
+    np.testing.assert_array_equal(board.pots, channel_pots(board))
+    assert board.pots is board.pots # cached until a code changes
+
+    D = board.invert_dpot_rout(dpot_r // 2)
+    board.set_dpot_D(D)
+    np.testing.assert_array_equal(board.pots, channel_pots(board))
+    assert np.all(board.pots > -dpot_r)
+
+    board.dpots[2].all_channels[1].update_D(17) # single channel writes invalidate the cache as well
+    np.testing.assert_array_equal(board.pots, channel_pots(board))
+
+def test_invert_dpot_rout(board):
+    num_channels = len(board.dpots) * board.dpots[0].num_channels
+    routs = np.linspace(500, 20000, num_channels)
+    D = board.invert_dpot_rout(routs)
+    assert np.shape(D) == (len(board.dpots), board.dpots[0].num_channels)
+    for dpot, Ds, r in zip(board.dpots, D, routs.reshape(len(board.dpots), -1)):
+        assert Ds == [c.invertrout(rc) for c, rc in zip(dpot.all_channels, r)]
+    # a single resistance for every channel
+    assert board.invert_dpot_rout(dpot_r) == [dpot.invertchannels_rout(dpot_r) for dpot in board.dpots]
+
+    # a shorter vector leaves the remaining channels at code 0
+    D = board.invert_dpot_rout(routs[:board.xdim])
+    assert [Ds for row in D for Ds in row][board.xdim:] == [0]*(num_channels - board.xdim)
+    with pytest.raises(ValueError):
+        board.invert_dpot_rout(np.ones(num_channels + 1))
+    with pytest.raises(ValueError):
+        board.invert_dpot_rout(np.ones((2, 4)))
+
+def test_set_dpot_D(board):
+    D = np.arange(len(board.dpots) * 4).reshape(-1, 4) * 3
+    board.set_dpot_D(D)
+    assert [[c.D for c in dpot.all_channels] for dpot in board.dpots] == D.tolist()
+    board.set_dpot_D(D.tolist())
+    board.set_dpot_D(np.int64(40))
+    assert all(c.D == 40 for dpot in board.dpots for c in dpot.all_channels)
+    for invalid in [True, 3.0, D[:2], D.ravel().tolist()]:
+        with pytest.raises(ValueError):
+            board.set_dpot_D(invalid)
@@ -0,0 +1,43 @@
+"""
+The evaluation paths of the Generic device model: one device at a time, the selected block only, or the whole kernel.
+"""
+
+import numpy as np
+import pytest
+
+from daffodillib.Board.Device.Generic import Generic
+
+def make_kernel():
+    kernel = Generic().all_kernels[0]
+    kernel.kern[::3, ::2] = kernel.setG[::3, ::2]
+    # conductances out of the model's range, e.g. restored from an older snapshot. They are clamped by any event on the block
+    kernel.kern[10, 10], kernel.kern[11, 12], kernel.kern[0, 24] = 0.5, 1.1, 0.1
+    return kernel
+
+def event(kernel, cols, rows, vcol, vrow, dense=False):
+    if dense:
+        kernel.scalar_limit, kernel.sparse_fraction = 0, 0
+    colactiv, rowactiv = np.zeros(kernel.xdim), np.zeros(kernel.ydim)
+    colactiv[cols], rowactiv[rows] = 1, 1
+    return kernel.biasupdate(np.full(kernel.xdim, 5.0), np.full(kernel.xdim, vcol), np.full(kernel.ydim, vrow), colactiv, rowactiv, 2000)
+
+@pytest.mark.parametrize('cols, rows', [([2], [3]), ([0, 1], [0, 2]), ([3, 4], [5, 6, 7]), ([1, 10, 11], [10, 11, 12])])
+@pytest.mark.parametrize('vcol, vrow', [(1.7, 2.5), (2.5, 1.7), (1.8, 1.7)]) # SET, RESET and read
+def test_paths_agree(cols, rows, vcol, vrow):
+    sparse, dense = make_kernel(), make_kernel()
+    sparse_currents = event(sparse, cols, rows, vcol, vrow)
+    dense_currents = event(dense, cols, rows, vcol, vrow, dense=True)
+    np.testing.assert_array_equal(sparse.kern, dense.kern)
+    np.testing.assert_array_equal(sparse.set_count, dense.set_count)
+    np.testing.assert_array_equal(sparse.reset_count, dense.reset_count)
+    for a, b in zip(sparse_currents, dense_currents):
+        np.testing.assert_allclose(a, b, rtol=1e-12, atol=0)
+    assert sparse.kern.min() == 0.1 and not (sparse.kern == 1.1).any() and not ((sparse.kern < 1) & (sparse.kern != 0.1)).any()
+
+def test_switching():
+    kernel = make_kernel()
+    event(kernel, [1, 2], [1, 3], 1.7, 2.5)
+    assert (kernel.kern[np.ix_([1, 2], [1, 3])] == kernel.setG[np.ix_([1, 2], [1, 3])]).all()
+    assert kernel.set_count.sum() == 4
+    event(kernel, [1], [1], 2.5, 1.7)
+    assert kernel.kern[1, 1] == kernel.resetG[1, 1] and kernel.reset_count[1, 1] == 1
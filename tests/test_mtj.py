@@ -0,0 +1,49 @@
+"""
+Reproducible stochastic switching of the MTJ device model: seeds, and the random number generator state in snapshots.
+"""
+
+import numpy as np
+
+from daffodillib import outerproduct
+
+from boards import make_sim_board, vgate
+
+vpulse = 0.6 # close to the critical voltage, where a pulse switches a device with a probability between 0 and 1
+
+def pulses(board):
+    # a few outer-product pulses on kernel 0, returns the resulting conductances
+    board.set_kernel(0)
+    for i in range(3):
+        outerproduct.outer_product(board, vpulse, vpulse, vgate, [1, -1]*12 + [1], [-1]*25)
+    return board.sim_device.all_kernels[0].kern.copy()
+
+def test_stochastic():
+    board = make_sim_board('MTJ', seed=0)
+    G = pulses(board)
+    assert 0 < np.mean(G == board.sim_device.setG) < 0.5 # some, not all, SET pulses switched
+
+def test_seed():
+    np.testing.assert_array_equal(pulses(make_sim_board('MTJ', seed=3)), pulses(make_sim_board('MTJ', seed=3)))
+    assert not np.array_equal(pulses(make_sim_board('MTJ', seed=3)), pulses(make_sim_board('MTJ', seed=4)))
+
+def test_restore_repeats_switching():
+    board = make_sim_board('MTJ', seed=1)
+    pulses(board)
+    snap = board.snapshot()
+    G = pulses(board)
+    later = pulses(board)
+
+    board.restore(snap)
+    np.testing.assert_array_equal(pulses(board), G)
+    np.testing.assert_array_equal(pulses(board), later)
+    assert not np.array_equal(G, later) # the generator moved on between the runs
+
+def test_save_load(tmp_path):
+    board = make_sim_board('MTJ', seed=2)
+    pulses(board)
+    board.save(tmp_path / 'mtj.npy')
+    G = pulses(board)
+
+    other = make_sim_board('MTJ', seed=5) # the loaded generator state replaces the seed
+    other.load(tmp_path / 'mtj.npy')
+    np.testing.assert_array_equal(pulses(other), G)
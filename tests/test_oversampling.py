@@ -0,0 +1,76 @@
+"""
+Daffodil_Base.event_oversampled on the emulated Daffodil_Phys with ADC noise: sample statistics, early stopping and buffered scans.
+"""
+
+import numpy as np
+import pytest
+
+from daffodillib import read_array
+from daffodillib.Board.emulator import Sysfs_Emu
+
+from boards import make_phys_board, vgate, vread, vref
+
+noise = 2 # standard deviation of the emulated ADC noise, in codes
+
+def read_configuration(board):
+    read_array.read_kernel(board, 0, vread, vgate, vref, columns=[0]) # leaves the board in the read configuration
+    board.event()
+    return np.array(board.retrievecurrents())
+
+@pytest.fixture
+def codes():
+    # the codes of the read configuration without noise
+    with make_phys_board() as board:
+        return read_configuration(board)
+
+@pytest.fixture
+def board():
+    board = make_phys_board(adc_noise=noise, seed=0)
+    read_configuration(board)
+    yield board
+    board.close()
+
+def test_statistics(board, codes):
+    mean, std, samples = board.event_oversampled(200)
+    assert samples.shape == (200, board.xdim)
+    np.testing.assert_array_equal(mean, samples.mean(axis=0))
+    np.testing.assert_array_equal(std, samples.std(axis=0, ddof=1))
+    assert np.all(np.abs(mean - codes) < 5*noise/np.sqrt(200))
+    assert np.all(np.abs(std - noise) < 0.3*noise)
+
+def test_single_sample(board):
+    mean, std, samples = board.event_oversampled()
+    assert samples.shape == (1, board.xdim)
+    np.testing.assert_array_equal(mean, board.retrievecurrents())
+    assert not std.any()
+
+def test_min_stderr(board):
+    min_stderr = 0.5
+    mean, std, samples = board.event_oversampled(200, min_stderr)
+    n = len(samples)
+    assert 2 < n < 200
+    assert np.all(std / np.sqrt(n) < min_stderr)
+    # one sample earlier, some channel was still above the threshold
+    assert np.any(samples[:-1].std(axis=0, ddof=1) / np.sqrt(n - 1) >= min_stderr)
+
+def test_min_stderr_noise_free(codes):
+    with make_phys_board() as board:
+        read_configuration(board)
+        mean, std, samples = board.event_oversampled(10, min_stderr=0.1)
+    assert len(samples) == 2 # at least 2 samples are taken
+    np.testing.assert_array_equal(mean, codes)
+
+def test_buffered_scans(board, codes):
+    board.enable_adc_buffer(8, Sysfs_Emu.trigger_name)
+    triggers = board.PGPIO.triggers
+    mean, std, samples = board.event_oversampled(3, mode='adc') # one event, its scans are the samples
+    assert samples.shape == (8, board.xdim) and board.PGPIO.triggers == triggers + 8
+    mean, std, samples = board.event_oversampled(3) # every event adds its scans
+    assert samples.shape == (24, board.xdim)
+    assert np.all(np.abs(mean - codes) < 5*noise/np.sqrt(24))
+
+def test_invalid(board):
+    with pytest.raises(ValueError, match='n_samples'):
+        board.event_oversampled(0)
+    with pytest.raises(ValueError, match='not implemented'):
+        board.event_oversampled(2, mode='column')
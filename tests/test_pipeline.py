@@ -0,0 +1,41 @@
+"""
+pipeline.Pipelined_Forward against sample-by-sample forward passes of the wine network on a Daffodil_Sim.
+"""
+
+import numpy as np
+import pytest
+
+from daffodillib import utils
+from daffodillib.pipeline import Pipelined_Forward
+
+from boards import make_sim_board, make_network, load_dataset, Gnorm, vread
+
+@pytest.fixture
+def layers():
+    return make_network(make_sim_board())
+
+def sequential(layers, activation, X):
+    outputs = []
+    for x in X:
+        for layer_idx, layer in enumerate(layers):
+            x = activation(layer_idx, np.array(layer.forward_pass(x))[None])[0]
+        outputs.append(x)
+    return np.array(outputs)
+
+@pytest.mark.parametrize('num_samples', [1, 2, 5])
+def test_matches_sequential(layers, num_samples):
+    X, Y = load_dataset()
+    X = X[:num_samples] * vread
+    activation = utils.differential_activation(layers, Gnorm(layers[0].board), vread)
+    outputs = Pipelined_Forward(layers, activation).run(X)
+    assert outputs.shape == (num_samples, 3)
+    np.testing.assert_array_equal(outputs, sequential(layers, activation, X))
+
+def test_worker_error(layers):
+    X, Y = load_dataset()
+    activation = utils.differential_activation(layers, Gnorm(layers[0].board), vread)
+    def scaled(layer_idx, x):
+        # inputs out of range for the second layer, rejected by prepare_inputs on the worker
+        return activation(layer_idx, x) * 100
+    with pytest.raises(ValueError, match='Largest input'):
+        Pipelined_Forward(layers, scaled).run(X[:3] * vread)
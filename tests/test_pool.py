@@ -0,0 +1,72 @@
+"""
+Data-parallel inference with pool.Board_Pool, on simulated boards.
+"""
+
+import numpy as np
+import pytest
+
+from daffodillib import utils
+from daffodillib.pool import Board_Pool
+
+from boards import make_sim_board, make_layers, make_network, load_weights, load_dataset, Gnorm, vgate, vread
+
+X, Y = load_dataset()
+X, Y = X[:30], Y[:30]
+
+def make_pool(n):
+    pool = Board_Pool([make_sim_board() for i in range(n)])
+    pool.load_network(make_layers, load_weights(), vgate)
+    return pool
+
+def activation(pool):
+    return utils.differential_activation(pool.networks[0], Gnorm(pool.boards[0]), vread)
+
+def test_matches_one_board():
+    board = make_sim_board()
+    reference = utils.testing_forward(make_network(board), X, Y, Gnorm(board), vread, batch_size=10)
+    pool = make_pool(3)
+    assert pool.testing_forward(X, Y, Gnorm(pool.boards[0]), vread, batch_size=10) == reference
+    assert [stat['samples'] for stat in pool.stats] == [10, 10, 10]
+
+def test_bad_inputs_keep_boards_healthy():
+    pool = make_pool(3)
+    Xb = X * vread
+    Xb[4, 0] = 5
+    with pytest.raises(ValueError):
+        pool.forward(Xb, activation(pool))
+    assert pool.healthy() == [0, 1, 2]
+
+    # a ValueError raised inside a shard, here a second layer input out of range, is raised to the caller as well
+    bad = lambda i, currents: np.full((len(currents), 6), 5.0) if i == 0 else currents
+    with pytest.raises(ValueError):
+        pool.forward(X * vread, bad)
+    assert pool.healthy() == [0, 1, 2]
+    assert all(stat['errors'] == 0 for stat in pool.stats)
+
+def test_board_fault_fails_over():
+    reference = make_pool(1)
+    expected = reference.forward(X * vread, activation(reference), batch_size=10)
+
+    pool = make_pool(3)
+    def fault(*args, **kwargs):
+        raise Exception("ADC not responding")
+    pool.boards[1].event = fault
+    outputs = pool.forward(X * vread, activation(pool), batch_size=10)
+    np.testing.assert_array_equal(outputs, expected)
+    assert pool.healthy() == [0, 2]
+    assert pool.stats[1]['errors'] == 1 and 'ADC not responding' in pool.stats[1]['last_error']
+    assert pool.stats[0]['samples'] + pool.stats[2]['samples'] == 30 # their own shards, then the failed one
+
+def test_board_value_error_fails_over():
+    # hardware faults raise ValueError too, e.g. a garbled sysfs read or an ADC register overflow
+    reference = make_pool(1)
+    expected = reference.forward(X * vread, activation(reference), batch_size=10)
+
+    pool = make_pool(3)
+    def fault():
+        raise ValueError("invalid literal for int() with base 10: ''")
+    pool.boards[2].retrievecurrents = fault
+    outputs = pool.forward(X * vread, activation(pool), batch_size=10)
+    np.testing.assert_array_equal(outputs, expected)
+    assert pool.healthy() == [0, 1]
+    assert pool.stats[2]['errors'] == 1 and 'invalid literal' in pool.stats[2]['last_error']
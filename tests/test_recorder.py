@@ -0,0 +1,117 @@
+"""
+Recording, saving and replaying the operation stream of a board with Board.recorder.
+"""
+
+import numpy as np
+import pytest
+
+from daffodillib import read_array, outerproduct
+from daffodillib.Board.recorder import Recorder, Recording, replay, optimize
+
+from boards import make_sim_board, make_network, load_dataset, vgate, vread, vref, vset, vreset
+
+def record_program_and_read(board):
+    cols = [0]*board.xdim
+    cols[2] = -1
+    cols[5] = 1
+    with Recorder(board) as recording:
+        board.set_kernel(0)
+        outerproduct.outer_product(board, vset, vreset, vgate, [1, -1]*12 + [1], cols)
+        currents = read_array.read_kernel(board, 0, vread, vgate, vref)
+    return recording, currents
+
+def test_save_load_replay(tmp_path):
+    board = make_sim_board()
+    start = board.snapshot().copy()
+    recording, currents = record_program_and_read(board)
+    assert not [name for name in board.__dict__ if name.startswith('set')] # the board methods are unwrapped
+
+    recording.save(tmp_path / 'program.dlog')
+    loaded = Recording.load(tmp_path / 'program.dlog')
+    assert loaded.data == recording.data
+    assert len(loaded) == len(recording) > 0
+
+    replayed = make_sim_board()
+    replayed.restore(start)
+    assert replay(replayed, loaded, check=True) == []
+    np.testing.assert_array_equal(replayed.snapshot()['G'], board.snapshot()['G'])
+    assert read_array.read_kernel(replayed, 0, vread, vgate, vref) == read_array.read_kernel(board, 0, vread, vgate, vref)
+
+    # the replay checks the ADC codes against the recording
+    perturbed = make_sim_board()
+    perturbed.restore(start)
+    perturbed.sim_device.all_kernels[0].kern[3, 3] *= 0.5
+    assert len(replay(perturbed, loaded, check=True)) > 0
+
+def test_truncated_log(tmp_path):
+    recording, currents = record_program_and_read(make_sim_board())
+    recording.save(tmp_path / 'program.dlog')
+    data = (tmp_path / 'program.dlog').read_bytes()
+
+    # the last record is an ADC read with a 25 code payload
+    with pytest.raises(ValueError, match='missing 2 payload bytes'):
+        list(Recording(data[:-2]).records())
+    with pytest.raises(ValueError, match='incomplete record header'):
+        len(Recording(data + b'\x01\x00'))
+    with pytest.raises(ValueError, match='Unknown opcode'):
+        list(Recording(data + bytes([200, 0, 0, 0, 0, 0, 0])).records())
+    with pytest.raises(ValueError, match='Not a board operation log'):
+        Recording(data[3:])
+    with pytest.raises(ValueError):
+        replay(make_sim_board(), Recording(data[:-2]))
+
+def replays_the_same(start, recording, optimized):
+    #replays both recordings on boards in the state `start` and compares the ADC codes, DAC codes and conductances
+    boards = []
+    for rec in (recording, optimized):
+        board = make_sim_board()
+        board.restore(start)
+        assert replay(board, rec, check=True) == []
+        boards.append(board)
+    dac_codes = [[channel.x1 for dac in board.dacs for channel in dac.all_channels] for board in boards]
+    assert dac_codes[0] == dac_codes[1]
+    np.testing.assert_array_equal(boards[0].snapshot()['G'], boards[1].snapshot()['G'])
+
+def test_optimize_hoists_loop_setup():
+    board = make_sim_board()
+    layers = make_network(board)
+    X, Y = load_dataset()
+    start = board.snapshot().copy()
+    with Recorder(board) as recording:
+        for x in X[:4] * vread:
+            layers[0].forward_pass(x)
+    optimized, report = optimize(recording)
+    for name in ['set_kernel', 'config_forward_pass', 'setrefopamp', 'setgatedacs']:
+        assert report['operations'][name] == (4, 1)
+    assert report['operations']['event'] == (4, 4)
+    assert report['before'] == len(recording) and report['after'] == len(optimized) < len(recording)
+    replays_the_same(start, recording, optimized)
+
+def test_optimize_merges_channel_writes():
+    board = make_sim_board()
+    idle, read = board.dac_invertvout(1.7), board.dac_invertvout(vref)
+    board.set_kernel(0)
+    board.config_forward_pass()
+    board.setgatedacs([board.dac_invertvout(vgate)]*board.ydim)
+    board.setrowdacs([idle]*board.ydim)
+    board.setcoldacs([idle]*board.xdim)
+    start = board.snapshot().copy()
+    with Recorder(board) as recording:
+        for j in range(3):
+            for channel in [2, 5, 7]:
+                board.setcoldac_channel(read - channel - j, channel)
+            board.event()
+            board.retrievecurrents()
+            board.setcoldacs([idle]*board.xdim) # back to idle after every read
+    optimized, report = optimize(recording)
+    # the other column codes are only known after the first bulk write, the writes of the first iteration stay as they are
+    assert report['operations']['setcoldac_channel'] == (9, 3)
+    assert report['operations']['setcoldacs'] == (3, 5)
+    assert report['after'] < report['before']
+    replays_the_same(start, recording, optimized)
+
+    # with a higher channel limit the writes are not merged, and the restores after the first one become single-channel writes instead
+    optimized, report = optimize(recording, channel_limit=3)
+    assert report['operations']['setcoldac_channel'] == (9, 9 + 6)
+    assert report['operations']['setcoldacs'] == (3, 1)
+    replays_the_same(start, recording, optimized)
@@ -0,0 +1,35 @@
+"""
+Region-of-interest reads (read_array.read_kernel with roi=True) against full kernel reads on a Daffodil_Sim.
+"""
+
+import numpy as np
+import pytest
+
+from daffodillib import read_array
+
+from boards import make_sim_board, make_network, vgate, vread, vref
+
+@pytest.fixture
+def board():
+    board = make_sim_board()
+    make_network(board) # programmed devices in kernels 0 and 1
+    return board
+
+def test_roi_matches_full_read(board):
+    for kernel in [0, 1]:
+        full = np.array(read_array.read_kernel(board, kernel, vread, vgate, vref, weight_shape=[25, 25]))
+        for shape, xoffset, yoffset in [([13, 12], 11, 12), ([6, 6], 0, 0), ([1, 25], 24, 0), ([25, 1], 0, 24)]:
+            roi = np.array(read_array.read_kernel(board, kernel, vread, vgate, vref, weight_shape=shape, xoffset=xoffset, yoffset=yoffset, roi=True))
+            assert roi.shape == tuple(shape)
+            np.testing.assert_array_equal(roi, full[xoffset:xoffset+shape[0], yoffset:yoffset+shape[1]])
+
+def test_roi_columns(board):
+    full = np.array(read_array.read_kernel(board, 0, vread, vgate, vref))
+    roi = np.array(read_array.read_kernel(board, 0, vread, vgate, vref, weight_shape=[13, 12], xoffset=11, yoffset=12, roi=True, columns=[20, 12]))
+    np.testing.assert_array_equal(roi, full[[20, 12], 12:24])
+
+def test_roi_bounds(board):
+    with pytest.raises(ValueError, match='exceeds'):
+        read_array.read_kernel(board, 0, vread, vgate, vref, weight_shape=[13, 12], xoffset=13, yoffset=12, roi=True)
+    with pytest.raises(ValueError, match='exceeds'):
+        read_array.read_kernel(board, 0, vread, vgate, vref, weight_shape=[5, 5], xoffset=-1, yoffset=0, roi=True)
@@ -0,0 +1,102 @@
+"""
+Board.server over a loopback TCP socket, against a Daffodil_Sim used directly.
+"""
+
+import socket
+import threading
+import contextlib
+import numpy as np
+import pytest
+
+from daffodillib import read_array
+from daffodillib.Board.server import Board_Server, Daffodil_Client, send_message, recv_message
+
+from boards import configure, make_sim_board, make_phys_board, make_network, load_dataset, vgate, vread, vref
+
+@contextlib.contextmanager
+def serve(board):
+    server = Board_Server(board, ('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    assert server.listening.wait(5)
+    client = configure(Daffodil_Client(server.address))
+    yield client
+    client.shutdown()
+    thread.join(5)
+    assert not thread.is_alive()
+
+@pytest.fixture
+def client():
+    with serve(make_sim_board()) as client:
+        yield client
+
+def test_message_roundtrip():
+    body = {'codes': [1, 2, 3], 'mixed': [1, 2.5], 'pair': (np.arange(6, dtype='>i2').reshape(2, 3), 'x'),
+            'currents': np.linspace(0, 1, 25, dtype=np.float32), 'scalar': np.int64(7), 'empty': np.zeros((0, 25), dtype=np.uint16)}
+    a, b = socket.socketpair()
+    with a, b:
+        send_message(a, body)
+        decoded = recv_message(b)
+    assert decoded['codes'] == [1, 2, 3] and isinstance(decoded['codes'], list)
+    assert decoded['mixed'] == [1, 2.5]
+    assert isinstance(decoded['pair'], tuple) and decoded['pair'][1] == 'x'
+    for got, sent in [(decoded['pair'][0], body['pair'][0]), (decoded['currents'], body['currents']), (decoded['empty'], body['empty'])]:
+        assert got.dtype == sent.dtype and got.shape == sent.shape
+        np.testing.assert_array_equal(got, sent)
+    assert decoded['scalar'] == 7
+
+def test_matches_direct_board(client):
+    board = make_sim_board()
+    assert read_array.read_kernel(client, 3, vread, vgate, vref) == read_array.read_kernel(board, 3, vread, vgate, vref)
+
+    X, Y = load_dataset()
+    remote_layers, layers = make_network(client), make_network(board)
+    for x in X[:5] * vread:
+        assert remote_layers[0].forward_pass(x) == layers[0].forward_pass(x)
+    np.testing.assert_array_equal(client.pots, board.pots)
+
+    client.set_kernel(0)
+    board.set_kernel(0)
+    client.config_forward_pass()
+    board.config_forward_pass()
+    remote, local = client.event_oversampled(3), board.event_oversampled(3)
+    for got, expected in zip(remote, local):
+        assert got.dtype == expected.dtype and got.shape == expected.shape
+        np.testing.assert_array_equal(got, expected)
+
+def test_errors(client):
+    with pytest.raises(ValueError, match='not a public board attribute'):
+        client.call('_private')
+    with pytest.raises(Exception, match='AttributeError'):
+        client.call('no_such_method')
+    # a queued operation fails with the call that sends it, and the operations after it are skipped
+    client.defer('set_kernel', 99)
+    client.defer('set_compliance_control', 0)
+    with pytest.raises(ValueError, match='set_kernel'):
+        client.flush()
+    assert client.remote_getattr('compliance_control') == 1
+
+    # requests that are not lists of operations
+    for request in [{'name': 'event'}, [['event']], [{'args': []}], [{'name': 'set_kernel', 'args': ['x']}]]:
+        send_message(client.sock, request)
+        reply = recv_message(client.sock)
+        assert reply['results'] == [] and reply['error'] is not None
+
+    # the connection is still usable
+    assert client.remote_getattr('selected_kernel') is not None
+
+def test_swfix_state():
+    board = make_phys_board()
+    with serve(board) as client:
+        client.set_kernel(2, swfix_en=True)
+        assert client.swfix_en and client.remote_getattr('swfix_en')
+        np.testing.assert_array_equal(client.dac_channel_index('gate'), board.dac_channel_index('gate'))
+        gate = np.full(board.xdim, 4.0)
+        gate[13] = 4.5
+        codes = client.dac_invertvouts(gate, line='gate').tolist() # converted on the swapped channels
+        client.setgatedacs(codes)
+        client.flush()
+        assert board.dacs[4].all_channels[14].x1 == codes[13] and board.dacs[4].all_channels[13].x1 == codes[14]
+        client.set_kernel(2)
+        assert not client.swfix_en and not client.remote_getattr('swfix_en')
+    board.close()
@@ -0,0 +1,85 @@
+"""
+The array operations of Daffodil_Sim.event (bias and current checks, transimpedance and ADC conversion) against the per-channel conversion
+of ADS7950SBDBT_Sim.update_register.
+"""
+
+import numpy as np
+import pytest
+
+from daffodillib.Board.Components.ADS7950SBDBT import ADS7950SBDBT_Sim
+
+from boards import make_sim_board, make_network, vref
+
+def scalar_registers(board):
+    # the transimpedance outputs of the last event converted channel by channel, as the board did before the conversion used arrays
+    device = board.sim_device
+    pots = board.pots.tolist()
+    adcs = [ADS7950SBDBT_Sim(adc.vref, adc.n) for adc in board.adcs]
+    for adc, board_adc in zip(adcs, board.adcs):
+        adc.gain = board_adc.gain
+    if board.write_mode_C == 1:
+        for i in range(board.xdim):
+            adcs[i//4].update_register(i%4, device.columnvoltages[i] - device.columncurrents[i]*pots[i]/device.currentscale)
+    else:
+        for i in range(board.ydim):
+            output = device.rowvoltages[i] + device.rowcurrents[i]*pots[i]/device.currentscale
+            adcs[i//4].update_register(i%4, min(max(output, 0.0), board.vmax - board.vground))
+    return [r for adc in adcs for r in adc.registers][:25]
+
+@pytest.fixture
+def board():
+    board = make_sim_board()
+    make_network(board)
+    board.set_kernel(0)
+    return board
+
+def random_biases(board, rng, low, high):
+    return board.dac_invertvouts(rng.uniform(low, high, board.xdim)).tolist()
+
+@pytest.mark.parametrize('gains', [[1]*7, [1, 0, 1, 1, 0, 1, 1]])
+def test_forward_pass(board, gains):
+    for adc, gain in zip(board.adcs, gains):
+        adc.gain = gain
+    rng = np.random.default_rng(0)
+    board.config_forward_pass()
+    board.setgatedacs(board.dac_invertvouts([4.9]*board.xdim).tolist())
+    for i in range(5):
+        board.COL_EN_tobe = rng.integers(0, 2, board.xdim).tolist()
+        board.ROW_EN_tobe = rng.integers(0, 2, board.ydim).tolist()
+        board.setcoldacs(random_biases(board, rng, vref - 0.1, vref + 0.1))
+        board.event()
+        assert board.retrievecurrents() == scalar_registers(board)
+        assert [r for adc in board.adcs for r in adc.registers][:25] == board.retrievecurrents()
+
+def test_backward_pass(board):
+    rng = np.random.default_rng(1)
+    board.config_backward_pass()
+    board.setgatedacs(board.dac_invertvouts([4.9]*board.xdim).tolist())
+    board.COL_EN_tobe = [1]*board.xdim
+    board.ROW_EN_tobe = [1]*board.ydim
+    for i in range(5):
+        board.setrowdacs(random_biases(board, rng, vref - 0.05, vref + 0.05))
+        board.event()
+        assert board.retrievecurrents() == scalar_registers(board)
+
+def test_registers_are_views(board):
+    board.adc_registers[3, 2] = 1234
+    assert board.adcs[3].registers[2] == 1234 and board.retrievecurrents()[14] == 1234
+
+def test_errors(board):
+    board.config_forward_pass()
+    board.dacs[2].all_channels[3].vout = board.vmax + 0.1
+    with pytest.raises(ValueError, match='Voltage too high'):
+        board.event()
+
+    board = make_sim_board()
+    board.config_backward_pass()
+    board.set_compliance_control(0)
+    board.setgatedacs(board.dac_invertvouts([4.9]*board.xdim).tolist())
+    board.setcoldacs(board.dac_invertvouts([2.7]*board.xdim).tolist())
+    with pytest.raises(ValueError, match='transimpedance amplifier at limit'):
+        board.event()
+
+    board.adcs[0].vref = 0.5 # out of the datasheet range, so that valid outputs overflow the registers
+    with pytest.raises(ValueError, match='Register overflow'):
+        board.update_adc_registers(np.full(25, 1.5))
@@ -0,0 +1,35 @@
+"""
+Snapshot and restore of `Daffodil_Sim`.
+"""
+
+import numpy as np
+import pytest
+
+from daffodillib.Board import controller
+
+def test_fresh_board(tmp_path):
+    # a board straight from the constructor has no DPOT codes, its snapshot must still restore
+    board = controller.Daffodil_Sim('Generic')
+    snap = board.snapshot()
+    assert (snap['D'] == -1).all()
+
+    board.set_dpot_D(board.invert_dpot_rout(2000))
+    board.restore(snap)
+    assert all(c.D == -1 for dpot in board.dpots for c in dpot.all_channels)
+    with pytest.raises(ValueError):
+        board.pots
+
+    board.save(tmp_path / 'fresh.npy')
+    other = controller.Daffodil_Sim('Generic')
+    other.load(tmp_path / 'fresh.npy')
+    assert np.array_equal(other.snapshot()['G'], snap['G'])
+
+def test_dpot_codes_restore_transimpedances():
+    board = controller.Daffodil_Sim('Generic')
+    board.set_dpot_D(board.invert_dpot_rout(2000))
+    pots = board.pots.copy()
+    snap = board.snapshot()
+
+    board.set_dpot_D(board.invert_dpot_rout(5000))
+    board.restore(snap)
+    assert np.array_equal(board.pots, pots)
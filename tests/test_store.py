@@ -0,0 +1,55 @@
+"""
+Memory mapped device stores of Daffodil_Sim (store, store_mode): reattaching a chip and read-only access.
+"""
+
+import numpy as np
+import pytest
+
+from daffodillib import read_array
+from daffodillib.Board import controller
+from daffodillib.Board.Device.Generic import Generic
+
+from boards import make_sim_board, make_network, vgate, vread, vref
+
+@pytest.fixture
+def store(tmp_path):
+    # a chip with the wine network programmed
+    path = tmp_path / 'chip.npy'
+    board = make_sim_board(store=path)
+    make_network(board)
+    board.sim_device.flush()
+    return path, read_array.read_kernel(board, 0, vread, vgate, vref), board.sim_device.all_kernels[0].set_count.copy()
+
+def test_reattach(store):
+    path, reads, set_count = store
+    assert set_count.any()
+    board = make_sim_board(store=path)
+    assert read_array.read_kernel(board, 0, vread, vgate, vref) == reads
+    np.testing.assert_array_equal(board.sim_device.all_kernels[0].set_count, set_count)
+
+    # boards attached read-write share the state
+    other = make_sim_board(store=path)
+    other.sim_device.all_kernels[5].kern[3, 4] = other.sim_device.setG
+    assert board.sim_device.all_kernels[5].kern[3, 4] == other.sim_device.setG
+
+def test_read_only(store):
+    path, reads, set_count = store
+    board = make_sim_board(store=path, store_mode='r')
+    assert board.sim_device.readonly
+    np.testing.assert_array_equal(board.sim_device.all_kernels[0].set_count, set_count)
+    with pytest.raises(Exception, match='read-only'):
+        read_array.read_kernel(board, 0, vread, vgate, vref)
+    with pytest.raises(ValueError, match='read-only'):
+        board.sim_device.all_kernels[0].kern[0, 0] = 0
+
+    # the store is unchanged
+    assert read_array.read_kernel(make_sim_board(store=path), 0, vread, vgate, vref) == reads
+
+def test_invalid(tmp_path):
+    with pytest.raises(ValueError, match='does not exist'):
+        controller.Daffodil_Sim('Generic', store=tmp_path / 'missing.npy', store_mode='r')
+    with pytest.raises(ValueError, match='not implemented'):
+        controller.Daffodil_Sim('Generic', store=tmp_path / 'chip.npy', store_mode='w')
+    Generic(numkernel=4, store=tmp_path / 'small.npy')
+    with pytest.raises(ValueError, match='does not match'):
+        controller.Daffodil_Sim('Generic', store=tmp_path / 'small.npy')
@@ -0,0 +1,81 @@
+"""
+Linear layers in tiled mode: a 30 x 40 layer split over kernels 2-5 of a Daffodil_Sim.
+"""
+
+import numpy as np
+import pytest
+
+from daffodillib import network_layer, IVcurve, parameters
+
+from boards import make_sim_board, vgate, vread, vref, vset, vreset
+
+@pytest.fixture
+def board():
+    return make_sim_board()
+
+@pytest.fixture
+def weights():
+    return np.random.default_rng(0).integers(0, 2, (30, 40))
+
+@pytest.fixture
+def layer(board, weights):
+    layer = network_layer.Linear(board, weight_shape=(30, 40), vread=vread, vset=vset, vreset=vreset, vref=vref, vgate=vgate, mode='tiled', offsets=[(2,)])
+    layer.load_weights_outerproduct_parallel(weights, vgate=vgate)
+    board.setrefopamp(board.dac_invertvout(abs(vref), line='ref'))
+    return layer
+
+def test_plan_tiles(board):
+    layer = network_layer.Linear(board, weight_shape=(30, 40), vref=vref, mode='tiled', offsets=[(2,)])
+    assert layer.shape == [2, 2] and layer.array == [[2, 3], [4, 5]]
+    assert layer.tiles == [(2, (0, 25), (0, 25)), (3, (0, 25), (25, 40)), (4, (25, 30), (0, 25)), (5, (25, 30), (25, 40))]
+
+    layer = network_layer.Linear(board, weight_shape=(30, 40), vref=vref, mode='tiled', offsets=[(7,), (1,), (9,), (0,), (3,)])
+    assert [tile[0] for tile in layer.tiles] == [7, 1, 9, 0]
+    with pytest.raises(ValueError, match='needs 4 kernels'):
+        network_layer.Linear(board, weight_shape=(30, 40), mode='tiled', offsets=[(1,), (2,), (3,)])
+    with pytest.raises(ValueError, match='distinct'):
+        network_layer.Linear(board, weight_shape=(30, 40), mode='tiled', offsets=[(1,), (2,), (2,), (3,)])
+    with pytest.raises(ValueError, match='range'):
+        network_layer.Linear(board, weight_shape=(30, 40), mode='tiled', offsets=[(30,)])
+
+def test_programmed_weights(board, layer, weights):
+    sliced = layer.read_array(vread, vref, slice=True)
+    assert [reads.shape for reads in sliced] == [(25, 25), (25, 15), (5, 25), (5, 15)]
+    full = layer.read_array(vread, vref)
+    assert all(reads.shape == (board.xdim, board.ydim) for reads in full)
+    for reads, whole in zip(sliced, full):
+        np.testing.assert_array_equal(reads, whole[:reads.shape[0], :reads.shape[1]])
+
+    G = np.block([[sliced[0], sliced[1]], [sliced[2], sliced[3]]])
+    threshold = (board.sim_device.setG + board.sim_device.resetG) / 2 / board.sim_device.currentscale
+    np.testing.assert_array_equal(G > threshold, weights == 1)
+
+def test_forward(board, layer, weights):
+    G = np.where(weights == 1, board.sim_device.setG, board.sim_device.resetG) / board.sim_device.currentscale
+    ref_voltage = board.dac_calcvout(board.dac_invertvout(abs(vref), line='ref'), line='ref')
+    X = np.random.default_rng(1).uniform(0, 1, (4, 30)) * vread
+
+    currents = []
+    for x in X:
+        vector, codes = layer.prepare_inputs(x)
+        applied = board.dac_calcvouts(np.reshape(codes, (-1, board.xdim)), line='col').ravel()[:30] - ref_voltage # the quantized column voltages
+        currents.append(layer.forward_pass(x))
+        np.testing.assert_allclose(currents[-1], G.T @ applied, rtol=1e-2)
+    np.testing.assert_array_equal(layer.forward_batch(X), currents)
+
+def test_updates_and_set_target(board, layer, monkeypatch):
+    for kernel in layer.kernels:
+        layer.read_kernel_cached(kernel, vread, vref)
+
+    # only the tiles with pulses on both their columns and rows are written
+    layer.out_prod_update([0]*25 + [1] + [0]*14, [0]*27 + [1, 0, 0], vgate)
+    assert [layer.cache[kernel]['dirty'].sum() for kernel in [2, 3, 4, 5]] == [0, 0, 0, 1]
+    assert layer.cache[5]['dirty'][2, 0]
+
+    calls = []
+    monkeypatch.setattr(IVcurve, 'set_target', lambda board, prm, kernel, x, y, vcol, vrow, vgate, tc, **kwargs: calls.append((kernel, x, y, vgate)) or ([], 0, True))
+    for kernel, x, y in [(3, 4, 6), (4, 1, 2)]:
+        layer.set_target(parameters, kernel, x, y, parameters.set_vcol, parameters.set_vrow, 60)
+    assert calls == [(3, 4, 6, vgate), (4, 1, 2, vgate)]
+    assert layer.cache[3]['dirty'][4, 6] and layer.cache[4]['dirty'][1, 2]
+    assert [layer.cache[kernel]['dirty'].sum() for kernel in [2, 3, 4, 5]] == [0, 1, 1, 1]